@@ -3,19 +3,33 @@ from __future__ import absolute_import
 import sys
 from datadelivery.commands import Commands, APP_NAME
 from datadelivery.argparser import ArgParser
-from datadelivery.config import ConfigSetupAbandoned
+from datadelivery.config import ConfigFile, ConfigSetupAbandoned
 from datadelivery.s3 import S3Exception
-import pkg_resources
+from datadelivery.manifest import ManifestException
+
+
+def get_version():
+    """
+    Return the installed version of datadelivery using importlib.metadata when available
+    since pkg_resources is slow to import.
+    :return: str: version
+    """
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        import pkg_resources
+        return pkg_resources.get_distribution(APP_NAME).version
+    return version(APP_NAME)
 
 
 def main():
-    version_str = pkg_resources.get_distribution(APP_NAME).version
-    arg_parser = ArgParser(version_str, Commands(version_str))
+    version_str = get_version()
+    arg_parser = ArgParser(version_str, Commands(version_str, ConfigFile().agent_socket_filename))
     try:
         arg_parser.parse_and_run_commands()
     except ConfigSetupAbandoned:
         pass
-    except S3Exception as e:
+    except (S3Exception, ManifestException) as e:
         print("Error: {}".format(e))
         sys.exit(1)
 
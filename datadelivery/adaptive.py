@@ -0,0 +1,105 @@
+from __future__ import absolute_import
+import math
+import threading
+import time
+
+DEFAULT_INITIAL_LIMIT = 4
+DEFAULT_WINDOW = 20
+DEFAULT_DECREASE_FACTOR = 0.5
+DEFAULT_LATENCY_TOLERANCE = 2.0
+OVERLOAD_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class AdaptiveConcurrency(object):
+    def __init__(self, maximum, initial=DEFAULT_INITIAL_LIMIT, window=DEFAULT_WINDOW,
+                 decrease_factor=DEFAULT_DECREASE_FACTOR, latency_tolerance=DEFAULT_LATENCY_TOLERANCE,
+                 on_adjust=None):
+        """
+        Request hook limiting how many requests an S3 client has in flight using additive increase,
+        multiplicative decrease. After every window of healthy requests the limit grows by one. An overload
+        response (429/5xx), connection error or a window whose p95 latency exceeds latency_tolerance times
+        the best p95 seen so far cuts the limit by decrease_factor. Register it with S3.add_request_hook.
+        :param maximum: int: largest limit allowed
+        :param initial: int: limit to start with
+        :param window: int: number of finished requests between increases
+        :param decrease_factor: float: fraction of the limit kept after a decrease
+        :param latency_tolerance: float: how many times the best p95 latency is treated as overload
+        :param on_adjust: function(AdaptiveConcurrency, old_limit, reason) called after the limit changes
+        """
+        self.maximum = maximum
+        self.limit = float(min(initial, maximum))
+        self.window = window
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.on_adjust = on_adjust
+        self.in_flight = 0
+        self.best_p95 = None
+        self.adjustments = []
+        self._latencies = []
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def current_limit(self):
+        return max(1, int(self.limit))
+
+    def request_started(self, method, url_suffix, retry):
+        """
+        Wait until fewer than current_limit requests are in flight.
+        :return: float: time the request was allowed to start
+        """
+        with self._condition:
+            while self.in_flight >= self.current_limit:
+                self._condition.wait()
+            self.in_flight += 1
+        return time.time()
+
+    def request_finished(self, start_time, response, error):
+        now = time.time()
+        status_code = response.status_code if response is not None else None
+        with self._condition:
+            self.in_flight -= 1
+            if error is not None or status_code in OVERLOAD_STATUS_CODES:
+                # requests sent before the last decrease saw the old limit so do not cut again for them
+                if start_time >= self._last_decrease:
+                    reason = 'error: {}'.format(type(error).__name__) if error is not None else \
+                        '{} response'.format(status_code)
+                    self._decrease(now, reason)
+            else:
+                self._latencies.append(now - start_time)
+                if len(self._latencies) >= self.window:
+                    self._finish_window(now)
+            self._condition.notify_all()
+
+    def _finish_window(self, now):
+        p95 = _percentile(self._latencies, 95)
+        self._latencies = []
+        if self.best_p95 is None or p95 < self.best_p95:
+            self.best_p95 = p95
+        if p95 > self.best_p95 * self.latency_tolerance:
+            self._decrease(now, 'p95 latency {:.0f}ms over {:.0f}ms'.format(
+                p95 * 1000, self.best_p95 * self.latency_tolerance * 1000))
+        elif self.limit < self.maximum:
+            self._adjust(min(self.maximum, self.limit + 1), 'healthy, p95 latency {:.0f}ms'.format(p95 * 1000))
+
+    def _decrease(self, now, reason):
+        self._last_decrease = now
+        self._latencies = []
+        self._adjust(max(1.0, self.limit * self.decrease_factor), reason)
+
+    def _adjust(self, limit, reason):
+        old_limit = self.current_limit
+        self.limit = limit
+        if self.current_limit != old_limit:
+            self.adjustments.append((old_limit, self.current_limit, reason))
+            if self.on_adjust:
+                self.on_adjust(self, old_limit, reason)
+
+
+def _percentile(values, percent):
+    """
+    Nearest rank percentile of values.
+    """
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(percent / 100.0 * len(ordered))))
+    return ordered[rank - 1]
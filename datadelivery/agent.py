@@ -0,0 +1,132 @@
+from __future__ import absolute_import
+import json
+import os
+import socket
+from six.moves import socketserver
+from datadelivery.s3 import S3Exception
+
+FORWARDED_COMMANDS = ['deliver']
+CONNECT_TIMEOUT = 1.0
+
+
+class DeliveryAgent(object):
+    def __init__(self, commands, socket_filename):
+        """
+        Long running process listening on a Unix socket that runs commands forwarded by the datadelivery cli.
+        commands should keep one warm S3 client so forwarded commands skip interpreter startup, reading the
+        config file, connecting to the api and looking up the current endpoint and user.
+        The socket is only accessible by the user running the agent.
+        :param commands: Commands: runs the forwarded commands
+        :param socket_filename: str: path of the Unix socket to listen on
+        """
+        self.commands = commands
+        self.socket_filename = socket_filename
+        self.server = None
+
+    def start(self):
+        """
+        Listen on socket_filename replacing a socket left behind by an agent that is no longer running.
+        """
+        if os.path.exists(self.socket_filename):
+            if _is_listening(self.socket_filename):
+                raise S3Exception("A datadelivery agent is already listening on {}".format(self.socket_filename))
+            os.unlink(self.socket_filename)
+        old_umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.socket_filename, _AgentRequestHandler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon_threads = True
+        self.server.agent = self
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        """
+        Stop serve_forever (when called from another thread) and remove the socket.
+        """
+        self.server.shutdown()
+        self.close()
+
+    def close(self):
+        self.server.server_close()
+        try:
+            os.unlink(self.socket_filename)
+        except OSError:
+            pass
+
+    def run_command(self, request):
+        """
+        Run a forwarded command.
+        :param request: dict: 'command' name of a FORWARDED_COMMANDS method of Commands and its 'args'
+        :return: dict: response with 'error' message and 'status_code' when the command raised an exception
+        """
+        command = request.get('command')
+        if command not in FORWARDED_COMMANDS:
+            return {'error': "Unsupported agent command: {}".format(command), 'status_code': None}
+        try:
+            getattr(self.commands, command)(*request.get('args', []))
+            return {}
+        except Exception as ex:
+            return {'error': str(ex), 'status_code': getattr(ex, 'status_code', None)}
+
+
+def forward_command(socket_filename, command, args):
+    """
+    Run command in the agent listening on socket_filename.
+    :param socket_filename: str: path of the agent's Unix socket
+    :param command: str: name of a FORWARDED_COMMANDS method of Commands
+    :param args: list: JSON serializable arguments for the command
+    :return: bool: True if the agent ran the command, False if no agent is running
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_filename):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(socket_filename)
+        except socket.error:
+            # stale socket of an agent that is no longer running
+            return False
+        # the command may take as long as the api does so only connecting has a timeout
+        sock.settimeout(None)
+        stream = sock.makefile('rwb')
+        try:
+            stream.write(json.dumps({'command': command, 'args': args}).encode('utf-8') + b'\n')
+            stream.flush()
+            line = stream.readline()
+        finally:
+            stream.close()
+    except socket.error as ex:
+        raise S3Exception("Lost connection to the datadelivery agent: {}".format(ex))
+    finally:
+        sock.close()
+    if not line:
+        raise S3Exception("The datadelivery agent closed the connection without responding")
+    response = json.loads(line.decode('utf-8'))
+    if 'error' in response:
+        raise S3Exception(response['error'], response.get('status_code'))
+    return True
+
+
+def _is_listening(socket_filename):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_filename)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+class _AgentRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        response = self.server.agent.run_command(json.loads(line.decode('utf-8')))
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
@@ -1,5 +1,8 @@
 import argparse
 import sys
+from datadelivery.batch import DEFAULT_NUM_WORKERS
+from datadelivery.listing import OUTPUT_FORMATS, OUTPUT_FORMAT_TABLE
+from datadelivery.profiling import DEFAULT_PROFILE_PREFIX
 
 DESCRIPTION_STR = "datadelivery ({}) Deliver s3 projects to other users"
 
@@ -23,14 +26,60 @@ class ArgParser(object):
         """
         parsed_args = self.argument_parser.parse_args(args)
         if hasattr(parsed_args, 'func'):
-            parsed_args.func(parsed_args)
+            if parsed_args.profile or parsed_args.profile_prefix:
+                # cProfile and pstats are only imported when profiling is requested
+                from datadelivery.profiling import profiling
+                with profiling(parsed_args.profile_prefix or DEFAULT_PROFILE_PREFIX):
+                    self._run_command(parsed_args)
+            else:
+                self._run_command(parsed_args)
         else:
             self.argument_parser.print_help()
 
+    def _run_command(self, parsed_args):
+        if parsed_args.trace or parsed_args.trace_file:
+            with self.target_object.tracing(parsed_args.trace_file or ''):
+                parsed_args.func(parsed_args)
+        else:
+            parsed_args.func(parsed_args)
+
     def _create_argument_parser(self):
         argument_parser = argparse.ArgumentParser(description=DESCRIPTION_STR.format(self.version_str))
+        argument_parser.add_argument(
+            '--trace',
+            action='store_true',
+            default=False,
+            dest='trace',
+            help="Print a table summarizing the timing of HTTP requests to stderr when the command finishes.")
+        argument_parser.add_argument(
+            '--trace-file',
+            metavar='TraceFile',
+            type=str,
+            dest='trace_file',
+            help="Write the timing of each HTTP request as NDJSON to TraceFile when the command finishes.")
+        argument_parser.add_argument(
+            '--profile',
+            action='store_true',
+            default=False,
+            dest='profile',
+            help="Profile the command writing {0}.pstats (cProfile statistics of the main thread) and "
+                 "{0}.collapsed (sampled stacks of every thread for flame graph tools) and print the functions "
+                 "with the most cumulative time to stderr.".format(DEFAULT_PROFILE_PREFIX))
+        argument_parser.add_argument(
+            '--profile-prefix',
+            metavar='ProfilePrefix',
+            type=str,
+            dest='profile_prefix',
+            help="Profile the command like --profile writing ProfilePrefix.pstats and ProfilePrefix.collapsed.")
         subparsers = argument_parser.add_subparsers()
         self._add_deliver_command(subparsers)
+        self._add_deliver_many_command(subparsers)
+        self._add_plan_command(subparsers)
+        self._add_list_buckets_command(subparsers)
+        self._add_list_deliveries_command(subparsers)
+        self._add_status_command(subparsers)
+        self._add_watch_command(subparsers)
+        self._add_serve_command(subparsers)
         return argument_parser
 
     def _add_deliver_command(self, subparsers):
@@ -65,6 +114,187 @@ class ArgParser(object):
                                     dest='resend',
                                     help="Resend delivery email.")
 
+    def _add_deliver_many_command(self, subparsers):
+        """
+        Add 'deliver-many' command to subparsers
+        :param subparsers: subparser to add the command to
+        """
+        deliver_many_parser = subparsers.add_parser(
+            'deliver-many',
+            description='Deliver buckets to other users based on a csv, yaml, json or ndjson manifest file. '
+                        'Each row should have bucket_name and email and optionally msg_file and resend.')
+        deliver_many_parser.set_defaults(func=self._run_deliver_many)
+        deliver_many_parser.add_argument(
+            '-m', '--manifest',
+            metavar='ManifestFile',
+            type=str,
+            dest='manifest',
+            help="Filename of the manifest listing the deliveries to perform",
+            required=True)
+        deliver_many_parser.add_argument(
+            '--workers',
+            type=positive_int,
+            dest='workers',
+            default=DEFAULT_NUM_WORKERS,
+            help="Number of deliveries to perform at the same time (default {})".format(DEFAULT_NUM_WORKERS))
+        deliver_many_parser.add_argument(
+            '--journal',
+            metavar='JournalFile',
+            type=str,
+            dest='journal',
+            help="Record the progress of each row in JournalFile. When rerun with the same JournalFile, "
+                 "rows that were already sent are skipped and partly delivered rows resume where they stopped.")
+        deliver_many_parser.add_argument(
+            '--max-workers',
+            type=positive_int,
+            dest='max_workers',
+            help="Adapt the number of requests in flight between 1 and max_workers, starting at --workers. "
+                 "The limit grows while the server responds quickly and is cut on 429/5xx responses or rising "
+                 "latency. Progress and each change of the limit are printed to stderr.")
+
+    def _add_plan_command(self, subparsers):
+        """
+        Add 'plan' command to subparsers
+        :param subparsers: subparser to add the command to
+        """
+        plan_parser = subparsers.add_parser(
+            'plan',
+            description='Print the api calls needed to deliver the buckets in a manifest file, looking up each '
+                        'recipient and bucket only once. Pass --execute to perform the plan.')
+        plan_parser.set_defaults(func=self._run_plan)
+        plan_parser.add_argument(
+            '-m', '--manifest',
+            metavar='ManifestFile',
+            type=str,
+            dest='manifest',
+            help="Filename of the manifest listing the deliveries to plan",
+            required=True)
+        plan_parser.add_argument(
+            '--execute',
+            action='store_true',
+            default=False,
+            dest='execute',
+            help="Perform the plan after printing it.")
+        plan_parser.add_argument(
+            '--workers',
+            type=positive_int,
+            dest='workers',
+            default=DEFAULT_NUM_WORKERS,
+            help="Number of requests to perform at the same time (default {})".format(DEFAULT_NUM_WORKERS))
+
+    def _add_list_buckets_command(self, subparsers):
+        """
+        Add 'list-buckets' command to subparsers
+        :param subparsers: subparser to add the command to
+        """
+        list_buckets_parser = subparsers.add_parser('list-buckets', description='List buckets.')
+        list_buckets_parser.set_defaults(func=self._run_list_buckets)
+        list_buckets_parser.add_argument(
+            '--name',
+            metavar='BucketName',
+            type=str,
+            dest='name',
+            help="Only list the bucket with this name")
+        list_buckets_parser.add_argument(
+            '--owner',
+            metavar='S3UserId',
+            type=int,
+            dest='owner',
+            help="Only list buckets owned by this s3 user id")
+        self._add_output_format_argument(list_buckets_parser)
+
+    def _add_list_deliveries_command(self, subparsers):
+        """
+        Add 'list-deliveries' command to subparsers
+        :param subparsers: subparser to add the command to
+        """
+        list_deliveries_parser = subparsers.add_parser('list-deliveries', description='List deliveries.')
+        list_deliveries_parser.set_defaults(func=self._run_list_deliveries)
+        list_deliveries_parser.add_argument(
+            '--bucket',
+            metavar='BucketId',
+            type=int,
+            dest='bucket',
+            help="Only list deliveries of this bucket id")
+        list_deliveries_parser.add_argument(
+            '--from-user',
+            metavar='S3UserId',
+            type=int,
+            dest='from_user',
+            help="Only list deliveries sent by this s3 user id")
+        list_deliveries_parser.add_argument(
+            '--to-user',
+            metavar='S3UserId',
+            type=int,
+            dest='to_user',
+            help="Only list deliveries sent to this s3 user id")
+        list_deliveries_parser.add_argument(
+            '--state',
+            metavar='State',
+            type=int,
+            dest='state',
+            help="Only list deliveries in this state")
+        self._add_output_format_argument(list_deliveries_parser)
+
+    @staticmethod
+    def _add_output_format_argument(parser):
+        parser.add_argument(
+            '--format',
+            choices=OUTPUT_FORMATS,
+            default=OUTPUT_FORMAT_TABLE,
+            dest='output_format',
+            help="Print a table or one JSON object per line (default {})".format(OUTPUT_FORMAT_TABLE))
+
+    def _add_status_command(self, subparsers):
+        """
+        Add 'status' command to subparsers
+        :param subparsers: subparser to add the command to
+        """
+        status_parser = subparsers.add_parser('status', description='Show the state of deliveries.')
+        status_parser.set_defaults(func=self._run_status)
+        self._add_delivery_ids_argument(status_parser)
+
+    def _add_watch_command(self, subparsers):
+        """
+        Add 'watch' command to subparsers
+        :param subparsers: subparser to add the command to
+        """
+        watch_parser = subparsers.add_parser(
+            'watch',
+            description='Wait until recipients accept or decline deliveries, printing each change of state. '
+                        'Deliveries that have not changed recently are polled less often.')
+        watch_parser.set_defaults(func=self._run_watch)
+        self._add_delivery_ids_argument(watch_parser)
+        watch_parser.add_argument(
+            '--timeout',
+            type=float,
+            dest='timeout',
+            help="Seconds to wait before giving up (default wait forever)")
+
+    def _add_serve_command(self, subparsers):
+        """
+        Add 'serve' command to subparsers
+        :param subparsers: subparser to add the command to
+        """
+        serve_parser = subparsers.add_parser(
+            'serve',
+            description='Run an agent that keeps a connection to the api open. While it is running the deliver '
+                        'command is sent to the agent instead of starting a new connection. '
+                        'Restart the agent after changing the config file. Metrics configured with '
+                        'metrics_textfile or statsd_address are only exported when the agent exits.')
+        serve_parser.set_defaults(func=self._run_serve)
+
+    @staticmethod
+    def _add_delivery_ids_argument(parser):
+        parser.add_argument(
+            '-d', '--delivery-id',
+            metavar='DeliveryId',
+            type=int,
+            nargs='+',
+            dest='delivery_ids',
+            help="Ids of the deliveries",
+            required=True)
+
     def _run_deliver(self, args):
         """
         Method called for running the deliver command.
@@ -72,6 +302,48 @@ class ArgParser(object):
         user_message = self.read_argument_file_contents(args.msg_file)
         self.target_object.deliver(args.bucket_name, args.email, user_message, args.resend)
 
+    def _run_deliver_many(self, args):
+        """
+        Method called for running the deliver-many command.
+        """
+        self.target_object.deliver_many(args.manifest, args.workers, args.journal, args.max_workers)
+
+    def _run_plan(self, args):
+        """
+        Method called for running the plan command.
+        """
+        self.target_object.plan(args.manifest, args.execute, args.workers)
+
+    def _run_list_buckets(self, args):
+        """
+        Method called for running the list-buckets command.
+        """
+        self.target_object.list_buckets(args.name, args.owner, args.output_format)
+
+    def _run_list_deliveries(self, args):
+        """
+        Method called for running the list-deliveries command.
+        """
+        self.target_object.list_deliveries(args.bucket, args.from_user, args.to_user, args.state, args.output_format)
+
+    def _run_status(self, args):
+        """
+        Method called for running the status command.
+        """
+        self.target_object.status(args.delivery_ids)
+
+    def _run_watch(self, args):
+        """
+        Method called for running the watch command.
+        """
+        self.target_object.watch(args.delivery_ids, args.timeout)
+
+    def _run_serve(self, args):
+        """
+        Method called for running the serve command.
+        """
+        self.target_object.serve()
+
     @staticmethod
     def read_argument_file_contents(infile):
         """
@@ -85,3 +357,18 @@ class ArgParser(object):
                 print("Enter message and press CTRL-d when done:")
             return infile.read()
         return ""
+
+
+def positive_int(value):
+    """
+    argparse type for options that must be at least 1.
+    :param value: str: value from the command line
+    :return: int
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be a positive integer: {}".format(value))
+    return number
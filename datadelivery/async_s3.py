@@ -0,0 +1,285 @@
+"""
+asyncio client for the D4S2 s3 api mirroring datadelivery.s3.S3.
+Requires python 3.5+ and the aiohttp package (pip install datadelivery[async]).
+"""
+from __future__ import absolute_import
+import asyncio
+import json
+from datadelivery.retry import RetryPolicy
+from datadelivery.s3 import S3, S3Endpoint, S3User, User, S3Bucket, S3Delivery, NotFoundException, S3Exception, \
+    CONTENT_TYPE, DELIVERY_STATE_NEW, ALREADY_SENT_STATUS_CODE, should_invalidate_identity
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncS3(object):
+    def __init__(self, config, user_agent_str, identity_cache=None, retry_policy=None):
+        """
+        Create asyncio client for the D4S2 s3 api. All requests share one pooled aiohttp session that is
+        created on first use and should be released with close() (or by using the client with async with).
+        :param config: Config: settings for url, token, endpoint, connection pool and timeouts
+        :param user_agent_str: str: value sent in the user-agent header
+        :param identity_cache: IdentityCache: optional cache of current endpoint and s3 user between runs
+        :param retry_policy: RetryPolicy: decides when failed requests are retried, by default built from config
+        """
+        if aiohttp is None:
+            raise S3Exception("AsyncS3 requires the aiohttp package: pip install aiohttp")
+        self.config = config
+        self.user_agent_str = user_agent_str
+        self.identity_cache = identity_cache
+        self.retry_policy = retry_policy or RetryPolicy(config.retry_max_attempts, config.retry_backoff)
+        self.session = None
+        self._identity_tasks = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Release the pooled connections held by this client.
+        """
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.config.http_pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.config.connect_timeout,
+                                              sock_read=self.config.read_timeout))
+        return self.session
+
+    def _build_headers(self):
+        return {
+            'user-agent': self.user_agent_str,
+            'Authorization': 'Token {}'.format(self.config.token),
+            'content-type': CONTENT_TYPE,
+        }
+
+    async def _get_request(self, url_suffix):
+        return await self._send_request('GET', url_suffix, retry_safe=True)
+
+    async def _post_request(self, url_suffix, data, retry_safe=False):
+        return await self._send_request('POST', url_suffix, retry_safe=retry_safe, data=data)
+
+    async def _send_request(self, method, url_suffix, retry_safe, data=None, attempts=None):
+        """
+        Send a request retrying connection errors, timeouts and retryable responses as allowed by retry_policy.
+        :param method: str: HTTP method
+        :param url_suffix: str: path relative to config.url
+        :param retry_safe: bool: can this request be sent again without side effects
+        :param data: dict: JSON payload to send or None
+        :param attempts: list: when given the 1 based number of each attempt is appended as it is sent
+        :return: response JSON
+        """
+        url = '{}{}'.format(self.config.url, url_suffix)
+        session = self._get_session()
+        self.retry_policy.record_request()
+        attempt = 1
+        while True:
+            if attempts is not None:
+                attempts.append(attempt)
+            try:
+                async with session.request(method, url, headers=self._build_headers(), json=data) as resp:
+                    response = _Response(resp.status, await resp.text(), resp.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as ex:
+                delay = self.retry_policy.get_retry_delay(attempt, retry_safe)
+                if delay is None:
+                    raise S3Exception("Failed to connect to {}\n{}".format(self.config.url, ex))
+            else:
+                delay = self.retry_policy.get_retry_delay(attempt, retry_safe, response)
+                if delay is None:
+                    self._check_response(response, method, url_suffix)
+                    return response.json()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _check_response(self, response, method, url_suffix):
+        if response.status_code >= 400:
+            if self.identity_cache and should_invalidate_identity(method, url_suffix, response.status_code):
+                self.identity_cache.invalidate(self._identity_cache_key())
+            raise S3Exception(S3.make_message_for_http_error(response), response.status_code)
+
+    def _identity_cache_key(self):
+        return self.identity_cache.make_key(self.config.url, self.config.endpoint_name, self.config.token)
+
+    async def _get_identity(self, name, constructor, fetch_func):
+        """
+        Return the identity name, fetching it once no matter how many coroutines ask at the same time.
+        Checks identity_cache before calling fetch_func and saves the result there.
+        :param name: str: name of the identity in the cache
+        :param constructor: class used to create the identity from cached data
+        :param fetch_func: coroutine function that fetches the identity from the api
+        :return: object created by constructor or returned by fetch_func
+        """
+        task = self._identity_tasks.get(name)
+        if task is None or (task.done() and task.exception()):
+            task = asyncio.ensure_future(self._fetch_identity(name, constructor, fetch_func))
+            self._identity_tasks[name] = task
+        return await asyncio.shield(task)
+
+    async def _fetch_identity(self, name, constructor, fetch_func):
+        if not self.identity_cache:
+            return await fetch_func()
+        key = self._identity_cache_key()
+        data = self.identity_cache.get(key, name)
+        if data:
+            return constructor(data)
+        identity = await fetch_func()
+        self.identity_cache.put(key, name, vars(identity))
+        return identity
+
+    async def get_current_endpoint(self):
+        """
+        S3Endpoint matching config.endpoint_name, fetched on first use.
+        :return: S3Endpoint
+        """
+        return await self._get_identity('endpoint', S3Endpoint, self._fetch_current_endpoint)
+
+    async def get_current_s3user(self):
+        """
+        S3User for the current user at the current endpoint, fetched on first use.
+        :return: S3User
+        """
+        return await self._get_identity('s3user', S3User, self._fetch_current_s3user)
+
+    async def _fetch_current_endpoint(self):
+        url_suffix = 's3-endpoints/?name={}'.format(self.config.endpoint_name)
+        for endpoint_response in await self._get_request(url_suffix):
+            return S3Endpoint(endpoint_response)
+        raise NotFoundException("No endpoint found for s3 url: {}".format(self.config.url))
+
+    async def _fetch_current_s3user(self):
+        endpoint, user = await asyncio.gather(self.get_current_endpoint(), self.get_current_user())
+        url_suffix = 's3-users/?endpoint={}&user={}'.format(endpoint.id, user.id)
+        for s3user_response in await self._get_request(url_suffix):
+            return S3User(s3user_response)
+        raise NotFoundException("No s3 user found for endpoint {} and user {}".format(endpoint.id, user.id))
+
+    async def get_current_user(self):
+        """
+        Find the User that matches the current user under the endpoint
+        :return: User
+        """
+        return User(await self._get_request('users/current-user/'))
+
+    async def get_s3user_by_email(self, email):
+        """
+        Fetch s3 user that has the current endpoint and email
+        :param email: str: email address of user to fetch
+        :return: S3User or NotFoundException
+        """
+        endpoint = await self.get_current_endpoint()
+        url_suffix = 's3-users/?endpoint={}&email={}'.format(endpoint.id, email)
+        for s3user_response in await self._get_request(url_suffix):
+            return S3User(s3user_response)
+        raise NotFoundException("No s3 user found with email {} at endpoint {}".format(email, endpoint.id))
+
+    async def get_bucket_by_name(self, bucket_name):
+        """
+        Return S3Bucket or raise NotFoundException if not found
+        :param bucket_name: str: name of the bucket
+        :return: S3Bucket
+        """
+        items = await self._get_request('s3-buckets/?name={}'.format(bucket_name))
+        if items:
+            return S3Bucket(items[0])
+        raise NotFoundException("No bucket found with name {}".format(bucket_name))
+
+    async def create_bucket(self, bucket_name):
+        """
+        Create bucket with specified params.
+        :param bucket_name: str: name of the bucket
+        :return: S3Bucket
+        """
+        s3user, endpoint = await asyncio.gather(self.get_current_s3user(), self.get_current_endpoint())
+        data = {
+            'name': bucket_name,
+            'owner': s3user.id,
+            'endpoint': endpoint.id,
+        }
+        return S3Bucket(await self._post_request('s3-buckets/', data=data))
+
+    async def create_delivery(self, bucket, to_s3user, user_message):
+        """
+        Create delivery of bucket to to_user with user_message.
+        Delivery will still need to be sent
+        :param bucket: S3Bucket: bucket to deliver (should be owned by current user)
+        :param to_s3user: S3User: user to send the bucket to
+        :param user_message: str: message to send with the delivery
+        :return: S3Delivery
+        """
+        s3user = await self.get_current_s3user()
+        data = {
+            'bucket': bucket.id,
+            'from_user': s3user.id,
+            'to_user': to_s3user.id,
+            'user_message': user_message
+        }
+        return S3Delivery(await self._post_request('s3-deliveries/', data=data))
+
+    async def send_delivery(self, delivery, force=None):
+        """
+        Request the datadelivery service to process the delivery.
+        :param delivery: S3Delivery: the delivery to process
+        :param force: bool: set to True to allow resending
+        :return: S3Delivery
+        """
+        url_suffix = 's3-deliveries/{}/send/'.format(delivery.id)
+        if force:
+            return S3Delivery(await self._post_request(url_suffix + "?force=true", data={}))
+        # sending again without force is rejected by the server instead of emailing the recipient twice
+        attempts = []
+        try:
+            return S3Delivery(await self._send_request('POST', url_suffix, True, data={}, attempts=attempts))
+        except S3Exception as ex:
+            if len(attempts) < 2 or ex.status_code != ALREADY_SENT_STATUS_CODE:
+                raise
+            # an earlier attempt whose response was lost may have sent it, so the retry was rejected as a resend
+            sent_delivery = S3Delivery(await self._get_request('s3-deliveries/{}/'.format(delivery.id)))
+            if sent_delivery.state == DELIVERY_STATE_NEW:
+                raise
+            return sent_delivery
+
+    async def deliver(self, bucket_name, email, user_message, resend=False):
+        """
+        Deliver a bucket to a user creating the bucket if necessary, the same steps as the deliver command.
+        :param bucket_name: str: name of the bucket to deliver
+        :param email: str: email address of user to send the bucket to
+        :param user_message: str: custom message to send in the delivery email
+        :param resend: bool: is this a resend of an existing delivery
+        :return: S3Delivery
+        """
+        to_s3user, bucket, _ = await asyncio.gather(
+            self.get_s3user_by_email(email), self._find_bucket(bucket_name), self.get_current_s3user())
+        if not bucket:
+            bucket = await self.create_bucket(bucket_name)
+        delivery = await self.create_delivery(bucket, to_s3user, user_message)
+        return await self.send_delivery(delivery, resend)
+
+    async def _find_bucket(self, bucket_name):
+        try:
+            return await self.get_bucket_by_name(bucket_name)
+        except NotFoundException:
+            return None
+
+
+class _Response(object):
+    def __init__(self, status_code, text, headers):
+        """
+        Body and status of an aiohttp response read in full, quacks like requests.Response for
+        S3.make_message_for_http_error and RetryPolicy.
+        """
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.text)
@@ -0,0 +1,141 @@
+from __future__ import print_function, absolute_import
+import sys
+import threading
+from datadelivery.journal import STAGE_BUCKET_RESOLVED, STAGE_DELIVERY_CREATED, STAGE_SENT
+from datadelivery.recipients import RecipientLookup
+from datadelivery.s3 import S3Bucket, S3Delivery, NotFoundException, S3Exception
+
+DEFAULT_NUM_WORKERS = 4
+RESULT_TABLE_HEADERS = ['Row', 'Bucket', 'Email', 'Status', 'Details']
+
+
+class BatchDelivery(object):
+    def __init__(self, s3, num_workers=DEFAULT_NUM_WORKERS, journal=None, concurrency=None):
+        """
+        Delivers many buckets sharing a single S3 client across a pool of worker threads.
+        Recipients that appear in several rows are only looked up once.
+        :param s3: S3: client used for every delivery
+        :param num_workers: int: number of deliveries to run at the same time
+        :param journal: DeliveryJournal: optional record of each row's progress used to resume an earlier run
+        :param concurrency: AdaptiveConcurrency: optional request hook registered on s3 that limits requests
+        in flight, when given progress with the current limit is printed to stderr as rows finish
+        """
+        self.s3 = s3
+        self.num_workers = num_workers
+        self.journal = journal
+        self.concurrency = concurrency
+        self._finished_count = 0
+        self._row_count = 0
+        self._progress_lock = threading.Lock()
+        self.recipients = RecipientLookup(s3)
+
+    def run(self, rows):
+        """
+        Deliver each manifest row, a failing row does not stop the other rows.
+        :param rows: [ManifestRow]: deliveries to perform
+        :return: [DeliveryResult]: results in the same order as rows
+        """
+        from multiprocessing.pool import ThreadPool
+        self._finished_count = 0
+        self._row_count = len(rows)
+        pool = ThreadPool(self.num_workers)
+        try:
+            return pool.map(self._deliver_row, rows)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _deliver_row(self, row):
+        try:
+            result = DeliveryResult(row, delivery=self.deliver(row))
+        except (S3Exception, NotFoundException, IOError) as ex:
+            result = DeliveryResult(row, error=ex)
+        if self.concurrency:
+            self._print_progress(result)
+        return result
+
+    def _print_progress(self, result):
+        with self._progress_lock:
+            self._finished_count += 1
+            # a single write keeps lines from worker threads from interleaving
+            sys.stderr.write('{} of {} rows finished, row {} {}, concurrency {}\n'.format(
+                self._finished_count, self._row_count, result.row.row_num,
+                'sent' if result.succeeded else 'failed', self.concurrency.current_limit))
+
+    def deliver(self, row):
+        """
+        Deliver the bucket for a single row creating the bucket if necessary.
+        The requests for each row must finish within the configured deliver deadline.
+        With a journal, stages an earlier run completed for this row are skipped.
+        :param row: ManifestRow: delivery to perform
+        :return: S3Delivery
+        """
+        progress = self.journal.get(row) if self.journal else {}
+        if STAGE_SENT in progress:
+            return S3Delivery(progress[STAGE_SENT])
+        s3 = self.s3.with_deadline()
+        if STAGE_DELIVERY_CREATED in progress:
+            delivery = S3Delivery(progress[STAGE_DELIVERY_CREATED])
+        else:
+            user_message = row.read_user_message()
+            to_s3user = self.recipients.get_s3user_by_email(row.email, s3)
+            if STAGE_BUCKET_RESOLVED in progress:
+                bucket = S3Bucket(progress[STAGE_BUCKET_RESOLVED])
+            else:
+                try:
+                    bucket = s3.get_bucket_by_name(row.bucket_name)
+                except NotFoundException:
+                    bucket = s3.create_bucket(row.bucket_name)
+                self._record(row, STAGE_BUCKET_RESOLVED, bucket)
+            delivery = s3.create_delivery(bucket, to_s3user, user_message)
+            self._record(row, STAGE_DELIVERY_CREATED, delivery)
+        sent_delivery = s3.send_delivery(delivery, row.resend)
+        self._record(row, STAGE_SENT, sent_delivery)
+        return sent_delivery
+
+    def _record(self, row, stage, item):
+        if self.journal:
+            self.journal.record(row, stage, vars(item))
+
+
+class DeliveryResult(object):
+    def __init__(self, row, delivery=None, error=None):
+        """
+        Outcome of delivering a single manifest row.
+        :param row: ManifestRow: row that was delivered
+        :param delivery: S3Delivery: delivery that was sent or None if there was an error
+        :param error: Exception: error that stopped the delivery or None
+        """
+        self.row = row
+        self.delivery = delivery
+        self.error = error
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+    def table_row(self):
+        if self.succeeded:
+            status, details = 'sent', 'delivery {}'.format(self.delivery.id)
+        else:
+            status, details = 'failed', str(self.error)
+        return [str(self.row.row_num), self.row.bucket_name, self.row.email, status, details]
+
+
+def print_concurrency_adjustment(concurrency, old_limit, reason):
+    """
+    Report a change to the adaptive concurrency limit on stderr, used as AdaptiveConcurrency on_adjust.
+    """
+    sys.stderr.write('concurrency {} -> {}: {}\n'.format(old_limit, concurrency.current_limit, reason))
+
+
+def format_results_table(results):
+    """
+    Create a plain text table with one line per delivery result.
+    :param results: [DeliveryResult]: results to include
+    :return: str: table text
+    """
+    table = [RESULT_TABLE_HEADERS] + [result.table_row() for result in results]
+    widths = [max(len(line[idx]) for line in table) for idx in range(len(RESULT_TABLE_HEADERS))]
+    lines = ['  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip() for line in table]
+    return '\n'.join(lines)
@@ -0,0 +1,189 @@
+"""
+End to end delivery benchmark against a local MockD4S2Server and config file loading micro-benchmark.
+Run with: python -m datadelivery.benchmark --help
+"""
+from __future__ import print_function, absolute_import
+import argparse
+import math
+import os
+import shutil
+import tempfile
+import time
+from datadelivery.batch import BatchDelivery, DEFAULT_NUM_WORKERS
+from datadelivery.commands import Commands
+from datadelivery.config import Config, ConfigFile
+from datadelivery.manifest import ManifestRow
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN
+from datadelivery.s3 import S3
+
+USER_AGENT_STR = 'datadelivery-benchmark/1.0'
+CONFIG_SUMMARY_FORMAT = 'config {}: {:.1f}us/read'
+SUMMARY_FORMAT = '{}: {} deliveries, {:.1f} round trips/delivery, p50 {:.1f}ms, p99 {:.1f}ms, {:.1f} deliveries/s'
+
+
+class BenchmarkResult(object):
+    def __init__(self, name, latencies, elapsed, round_trips):
+        """
+        Timing for a group of deliveries.
+        :param name: str: name of the scenario
+        :param latencies: [float]: seconds taken by each delivery
+        :param elapsed: float: wall clock seconds for all deliveries
+        :param round_trips: int: number of requests the server received
+        """
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.elapsed = elapsed
+        self.round_trips = round_trips
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+    def percentile(self, percent):
+        """
+        Nearest rank percentile of the delivery latencies.
+        :param percent: float: 0 - 100
+        :return: float: seconds
+        """
+        rank = max(1, int(math.ceil(percent / 100.0 * self.count)))
+        return self.latencies[min(rank, self.count) - 1]
+
+    def summary(self):
+        return SUMMARY_FORMAT.format(
+            self.name, self.count, float(self.round_trips) / self.count, self.percentile(50) * 1000,
+            self.percentile(99) * 1000, self.count / self.elapsed)
+
+
+class _BenchmarkCommands(Commands):
+    def __init__(self, config, config_file):
+        super(_BenchmarkCommands, self).__init__(version_str='benchmark', config_file=config_file)
+        self.config = config
+
+    def _create_s3(self):
+        return S3(self.config, user_agent_str=USER_AGENT_STR)
+
+
+class _TimedBatchDelivery(BatchDelivery):
+    def __init__(self, s3, num_workers):
+        super(_TimedBatchDelivery, self).__init__(s3, num_workers)
+        self.latencies = []
+
+    def deliver(self, row):
+        start = time.time()
+        delivery = super(_TimedBatchDelivery, self).deliver(row)
+        self.latencies.append(time.time() - start)
+        return delivery
+
+
+def create_config(server):
+    return Config({'token': DEFAULT_TOKEN, 'url': server.url, 'identity_cache_ttl': 0, 'retry_backoff': 0.05})
+
+
+def benchmark_single(server, count):
+    """
+    Run count separate deliver commands each with a new client like separate CLI invocations.
+    :param server: MockD4S2Server: running server
+    :param count: int: number of deliveries
+    :return: BenchmarkResult
+    """
+    config = create_config(server)
+    emails = [server.add_recipient('single{}@example.com'.format(idx))['email'] for idx in range(count)]
+    server.reset_request_counts()
+    latencies = []
+    # keep the delivery index written by each deliver command out of the user's home directory
+    temp_dir = tempfile.mkdtemp()
+    try:
+        config_file = ConfigFile(os.path.join(temp_dir, 'datadelivery.yml'))
+        start = time.time()
+        for idx, email in enumerate(emails):
+            delivery_start = time.time()
+            _BenchmarkCommands(config, config_file).deliver('single-bucket{}'.format(idx), email, '', False)
+            latencies.append(time.time() - delivery_start)
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(temp_dir)
+    return BenchmarkResult('single', latencies, elapsed, server.total_requests)
+
+
+def benchmark_bulk(server, count, num_workers):
+    """
+    Run count deliveries in one batch sharing a client.
+    :param server: MockD4S2Server: running server
+    :param count: int: number of deliveries
+    :param num_workers: int: number of deliveries to run at the same time
+    :return: BenchmarkResult
+    """
+    rows = [ManifestRow(idx + 1, 'bulk-bucket{}'.format(idx),
+                        server.add_recipient('bulk{}@example.com'.format(idx))['email'])
+            for idx in range(count)]
+    server.reset_request_counts()
+    batch_delivery = _TimedBatchDelivery(S3(create_config(server), user_agent_str=USER_AGENT_STR), num_workers)
+    start = time.time()
+    results = batch_delivery.run(rows)
+    elapsed = time.time() - start
+    failed = [result for result in results if not result.succeeded]
+    if failed:
+        print('{} of {} bulk deliveries failed: {}'.format(len(failed), count, failed[0].error))
+    return BenchmarkResult('bulk', batch_delivery.latencies, elapsed, server.total_requests)
+
+
+def benchmark_config_loading(count):
+    """
+    Time reading a config file with the pure python and libyaml YAML loaders and from the compiled config.
+    :param count: int: number of reads to time for each loader
+    :return: [(str, float)]: loader name and seconds per read
+    """
+    import yaml
+    temp_dir = tempfile.mkdtemp()
+    try:
+        config_file = ConfigFile(os.path.join(temp_dir, 'datadelivery.yml'))
+        config_file.write_config(Config({'token': DEFAULT_TOKEN, 'url': 'http://127.0.0.1/api/v2/',
+                                         'endpoint_name': 'default', 'identity_cache_ttl': 0}))
+        loaders = [('SafeLoader', yaml.SafeLoader)]
+        if hasattr(yaml, 'CSafeLoader'):
+            loaders.append(('CSafeLoader', yaml.CSafeLoader))
+        results = []
+        for name, loader in loaders:
+            start = time.time()
+            for _ in range(count):
+                with open(config_file.filename, 'r') as stream:
+                    Config(yaml.load(stream, Loader=loader))
+            results.append((name, (time.time() - start) / count))
+        config_file.read_config()
+        start = time.time()
+        for _ in range(count):
+            config_file.read_config()
+        results.append(('compiled', (time.time() - start) / count))
+        return results
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def run_benchmarks(deliveries, rows, workers, latency, error_rate, rate_limit):
+    """
+    Start a mock server and benchmark the single and bulk delivery paths.
+    :return: [BenchmarkResult]
+    """
+    with MockD4S2Server(latency=latency, error_rate=error_rate, rate_limit=rate_limit, seed=0) as server:
+        return [benchmark_single(server, deliveries), benchmark_bulk(server, rows, workers)]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark deliveries against a local mock D4S2 api.')
+    parser.add_argument('--deliveries', type=int, default=20, help='Number of single deliver commands to run')
+    parser.add_argument('--rows', type=int, default=100, help='Number of rows in the bulk delivery')
+    parser.add_argument('--workers', type=int, default=DEFAULT_NUM_WORKERS, help='Bulk delivery workers')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds the server waits per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail with 503')
+    parser.add_argument('--rate-limit', type=float, default=None, help='Requests per second before 429')
+    parser.add_argument('--config-reads', type=int, default=1000, help='Number of config file reads to time')
+    parsed_args = parser.parse_args(args)
+    for name, seconds in benchmark_config_loading(parsed_args.config_reads):
+        print(CONFIG_SUMMARY_FORMAT.format(name, seconds * 1000000))
+    for result in run_benchmarks(parsed_args.deliveries, parsed_args.rows, parsed_args.workers,
+                                 parsed_args.latency, parsed_args.error_rate, parsed_args.rate_limit):
+        print(result.summary())
+
+
+if __name__ == '__main__':
+    main()
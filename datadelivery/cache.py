@@ -0,0 +1,181 @@
+from __future__ import absolute_import
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_IDENTITY_CACHE_TTL = 24 * 60 * 60
+
+
+class IdentityCache(object):
+    def __init__(self, filename, ttl=DEFAULT_IDENTITY_CACHE_TTL):
+        """
+        JSON file that remembers endpoint and s3 user lookups between runs.
+        The cache is best effort, any problem reading or writing the file is treated as a cache miss.
+        :param filename: str: path to the cache file
+        :param ttl: int: seconds a cached value remains valid, 0 disables the cache
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url, endpoint_name, token):
+        """
+        Build a cache key that changes when the api url, endpoint or token change.
+        The token is hashed so it is never written to the cache file.
+        :param url: str: base url of the D4S2 api
+        :param endpoint_name: str: name of the s3 endpoint
+        :param token: str: api token of the current user
+        :return: str: key
+        """
+        token_hash = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        return '{}|{}|{}'.format(url, endpoint_name, token_hash)
+
+    def get(self, key, name):
+        """
+        Return the cached value for name under key or None if missing or expired.
+        :param key: str: key from make_key
+        :param name: str: name of the value (ie. 'endpoint')
+        :return: dict: cached data or None
+        """
+        if not self.ttl:
+            return None
+        item = self._read().get(key, {}).get(name)
+        if item and time.time() - item['created'] < self.ttl:
+            return item['data']
+        return None
+
+    def put(self, key, name, data):
+        """
+        Save data as the value for name under key.
+        :param key: str: key from make_key
+        :param name: str: name of the value (ie. 'endpoint')
+        :param data: dict: JSON serializable data to save
+        """
+        if not self.ttl:
+            return
+        with self._lock:
+            contents = self._read()
+            contents.setdefault(key, {})[name] = {'created': time.time(), 'data': data}
+            self._write(contents)
+
+    def invalidate(self, key):
+        """
+        Remove all values saved under key.
+        :param key: str: key from make_key
+        """
+        with self._lock:
+            contents = self._read()
+            if key in contents:
+                del contents[key]
+                self._write(contents)
+
+    def _read(self):
+        try:
+            with open(self.filename, 'r') as stream:
+                contents = json.load(stream)
+            if isinstance(contents, dict):
+                return contents
+        except (IOError, OSError, ValueError):
+            pass
+        return {}
+
+    def _write(self, contents):
+        directory = os.path.dirname(self.filename) or '.'
+        try:
+            fd, temp_filename = tempfile.mkstemp(dir=directory, prefix='.datadelivery-cache')
+        except (IOError, OSError):
+            return
+        try:
+            with os.fdopen(fd, 'w') as stream:
+                json.dump(contents, stream)
+            os.rename(temp_filename, self.filename)
+        except (IOError, OSError):
+            try:
+                os.unlink(temp_filename)
+            except OSError:
+                pass
+
+
+DEFAULT_HTTP_CACHE_MAX_SIZE = 10 * 1024 * 1024
+
+
+class HttpCache(object):
+    def __init__(self, dirname, max_size=DEFAULT_HTTP_CACHE_MAX_SIZE):
+        """
+        Directory of GET responses saved with their ETag and Last-Modified validators so a later request
+        can be revalidated with If-None-Match/If-Modified-Since and answered from disk on 304 Not Modified.
+        When the files grow past max_size bytes the least recently used responses are removed.
+        Like IdentityCache the cache is best effort, any problem reading or writing is treated as a miss.
+        :param dirname: str: directory to keep responses in, created when first needed
+        :param max_size: int: bytes the saved responses may use
+        """
+        self.dirname = dirname
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url, token):
+        """
+        Build a cache key for a url, responses depend on the token of the user that requested them.
+        The token is hashed so it is never written to disk.
+        :param url: str: full url of the request
+        :param token: str: api token of the current user
+        :return: str: key
+        """
+        return hashlib.sha256('{}|{}'.format(token, url).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Return the saved response for key marking it as recently used.
+        :param key: str: key from make_key
+        :return: dict: with 'data' (response JSON), 'etag' and 'last_modified' or None if missing
+        """
+        filename = self._filename(key)
+        try:
+            with open(filename, 'r') as stream:
+                entry = json.load(stream)
+            os.utime(filename, None)
+            return entry
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, key, data, etag, last_modified):
+        """
+        Save a response, then remove the least recently used responses if the cache is over max_size.
+        :param key: str: key from make_key
+        :param data: object: response JSON
+        :param etag: str: ETag header of the response or None
+        :param last_modified: str: Last-Modified header of the response or None
+        """
+        entry = {'data': data, 'etag': etag, 'last_modified': last_modified}
+        with self._lock:
+            try:
+                if not os.path.exists(self.dirname):
+                    os.makedirs(self.dirname)
+                fd, temp_filename = tempfile.mkstemp(dir=self.dirname, prefix='.tmp')
+                with os.fdopen(fd, 'w') as stream:
+                    json.dump(entry, stream)
+                os.rename(temp_filename, self._filename(key))
+                self._evict()
+            except (IOError, OSError):
+                pass
+
+    def _filename(self, key):
+        return os.path.join(self.dirname, key + '.json')
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.dirname):
+            path = os.path.join(self.dirname, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.unlink(path)
+            total_size -= size
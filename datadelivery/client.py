@@ -0,0 +1,116 @@
+"""
+Python API for delivering buckets without running the datadelivery command.
+
+    from datadelivery.client import DeliveryClient, S3Exception
+
+    with DeliveryClient() as client:
+        delivery = client.deliver('mybucket', 'bob@example.com', 'Here is your data')
+
+Errors are raised as S3Exception (with status_code when the api responded, ie. 404 for a missing delivery),
+DeadlineExceededException when config.deliver_deadline runs out and NotFoundException when the recipient
+or current user has no s3 account at the endpoint.
+"""
+from __future__ import absolute_import
+import os
+import threading
+import weakref
+from datadelivery.commands import Commands, create_s3
+from datadelivery.config import ConfigFile, Config
+from datadelivery.s3 import S3Exception, NotFoundException, DeadlineExceededException, SessionPool
+
+
+class DeliveryClient(object):
+    def __init__(self, config=None, config_filename=None, version_str=None):
+        """
+        Client that can be shared between threads. Each thread sends requests using its own connection pool
+        while the current endpoint and user are looked up once and shared along with the identity cache,
+        http cache, delivery index and rate limit. The lookups deliver runs in helper threads borrow sessions
+        from a pool kept by the client so they do not use the calling thread's session. Only the one time
+        lookup of the current endpoint and user shares the session of the thread that triggers it.
+        Unlike the datadelivery command a missing token raises S3Exception instead of prompting for it.
+        :param config: Config: settings to use instead of reading the config file
+        :param config_filename: str: path of the config file, defaults to ~/.datadelivery.yml
+        (or the DATA_DELIVERY_CONFIG environment variable). Caches and the delivery index are kept next to it.
+        :param version_str: str: version sent in the user-agent header, defaults to the installed version
+        """
+        self.config_file = ConfigFile(config_filename) if config_filename else ConfigFile()
+        if config is None:
+            config = Config({})
+            if os.path.exists(self.config_file.filename):
+                config = self.config_file.read_config()
+        if not config.token:
+            raise S3Exception("No token found in {}, run datadelivery once to set it up.".format(
+                self.config_file.filename))
+        if version_str is None:
+            from datadelivery.__main__ import get_version
+            version_str = get_version()
+        self.config = config
+        self._commands = _ClientCommands(self, version_str)
+        self._s3 = create_s3(self.config_file, config, self._commands.user_agent_str)
+        self._thread_s3 = threading.local()
+        # weak so the clients of threads that have finished are not kept alive
+        self._thread_s3_set = weakref.WeakSet()
+        # sessions lent to deliver's lookup threads
+        self._session_pool = SessionPool(self._s3)
+        self._lock = threading.Lock()
+        self._commands.session_pool = self._session_pool
+
+    @property
+    def s3(self):
+        """
+        S3 client for the current thread.
+        """
+        s3 = getattr(self._thread_s3, 's3', None)
+        if s3 is None:
+            s3 = self._s3.with_new_session()
+            self._thread_s3.s3 = s3
+            with self._lock:
+                self._thread_s3_set.add(s3)
+        return s3
+
+    def deliver(self, bucket_name, email, user_message='', resend=False):
+        """
+        Deliver a bucket to a user, creating the bucket if it does not exist.
+        :param bucket_name: str: name of the bucket to deliver
+        :param email: str: email address of user to send the bucket to
+        :param user_message: str: custom message to send in the delivery email
+        :param resend: bool: send the email again for a bucket that was already delivered to email
+        :return: S3Delivery: the delivery that was sent
+        """
+        return self._commands.deliver(bucket_name, email, user_message, resend)
+
+    def get_delivery(self, delivery_id):
+        """
+        Fetch the current state of a delivery.
+        :param delivery_id: int: id of the delivery
+        :return: S3Delivery
+        """
+        delivery, _ = self.s3.get_delivery(delivery_id)
+        return delivery
+
+    def close(self):
+        """
+        Release the pooled connections of every thread.
+        """
+        with self._lock:
+            s3_list = list(self._thread_s3_set)
+            self._thread_s3_set.clear()
+        for s3 in s3_list:
+            s3.close()
+        self._session_pool.close()
+        self._s3.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _ClientCommands(Commands):
+    def __init__(self, client, version_str):
+        super(_ClientCommands, self).__init__(version_str, config_file=client.config_file)
+        self.client = client
+
+    def _create_s3(self):
+        return self.client.s3
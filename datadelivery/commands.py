@@ -1,31 +1,313 @@
 from __future__ import print_function, absolute_import
+import sys
+from contextlib import contextmanager
 from datadelivery.config import ConfigFile
-from datadelivery.s3 import S3, NotFoundException
+from datadelivery.s3 import S3, NotFoundException, S3Exception, SessionPool
+from datadelivery.cache import IdentityCache, HttpCache
+from datadelivery.manifest import read_manifest
+from datadelivery.metrics import get_process_metrics
+from datadelivery.adaptive import AdaptiveConcurrency
+from datadelivery.agent import DeliveryAgent, forward_command
+from datadelivery.batch import BatchDelivery, format_results_table, print_concurrency_adjustment
+from datadelivery.deliveryindex import DeliveryIndex
+from datadelivery.journal import DeliveryJournal
+from datadelivery.listing import write_items, BUCKET_COLUMNS, DELIVERY_COLUMNS
+from datadelivery.parallel import run_in_parallel
+from datadelivery.plan import DeliveryPlan
+from datadelivery.ratelimit import RateLimiter
+from datadelivery.watch import DeliveryWatcher
 
 APP_NAME = "datadelivery"
 
 
+def create_s3(config_file, config, user_agent_str):
+    """
+    Create an S3 client using the identity cache, rate limit, http cache and metrics settings in config.
+    :param config_file: ConfigFile: determines where the caches are kept
+    :param config: Config: settings for the client
+    :param user_agent_str: str: value sent in the user-agent header
+    :return: S3
+    """
+    identity_cache = IdentityCache(config_file.identity_cache_filename, config.identity_cache_ttl)
+    rate_limiter = None
+    if config.rate_limit:
+        rate_limiter = RateLimiter(config.rate_limit, config.rate_limit_burst, config_file.rate_limit_filename)
+    http_cache = None
+    if config.http_cache_size:
+        http_cache = HttpCache(config_file.http_cache_dirname, config.http_cache_size)
+    s3 = S3(config, user_agent_str=user_agent_str, identity_cache=identity_cache, rate_limiter=rate_limiter,
+            http_cache=http_cache)
+    if config.metrics_textfile or config.statsd_address:
+        s3.add_request_hook(get_process_metrics(config.metrics_textfile, config.statsd_address))
+    return s3
+
+
 class Commands(object):
-    def __init__(self, version_str):
+    def __init__(self, version_str, agent_socket_filename=None, config_file=None):
+        """
+        :param version_str: str: version of datadelivery
+        :param agent_socket_filename: str: Unix socket of an agent to forward commands to when it is running
+        :param config_file: ConfigFile: config file to use, defaults to ~/.datadelivery.yml
+        """
         self.version_str = version_str
+        self.agent_socket_filename = agent_socket_filename
+        self.config_file = config_file or ConfigFile()
+        self.tracer = None
+        self.shared_s3 = None
+        # lends sessions to threads that would otherwise share one, set by serve and DeliveryClient
+        self.session_pool = None
+
+    @property
+    def user_agent_str(self):
+        return '{}/{}'.format(APP_NAME, self.version_str)
 
     def _create_s3(self):
-        config = ConfigFile().read_or_create_config()
-        return S3(config, user_agent_str='{}/{}'.format(APP_NAME, self.version_str))
+        if self.shared_s3:
+            return self.shared_s3
+        s3 = create_s3(self.config_file, self.config_file.read_or_create_config(), self.user_agent_str)
+        if self.tracer:
+            self.tracer.attach(s3)
+        return s3
+
+    @contextmanager
+    def tracing(self, trace_filename):
+        """
+        Trace every HTTP call made by commands run within this context.
+        On exit writes NDJSON to trace_filename or a summary table to stderr when trace_filename is empty.
+        :param trace_filename: str: path of the NDJSON file to write or ''
+        """
+        # tracing imports requests and urllib3 so only import it when tracing is requested
+        from datadelivery.tracing import Tracer
+        self.tracer = Tracer()
+        try:
+            yield self.tracer
+        finally:
+            self.tracer.close()
+            self.tracer.write(trace_filename)
+            self.tracer = None
 
     def deliver(self, bucket_name, email, user_message, resend):
         """
         Deliver a bucket to a particular user with the user_message. When resend is True include force flag.
+        A resend of a delivery recorded in the local delivery index is sent directly without other lookups
+        unless user_message differs from the message the recorded delivery was created with.
         :param bucket_name: str: name of the bucket to deliver
         :param email: str: email address of user to send the bucket to
         :param user_message: str: custom message to send in the delivery email
         :param resend: bool: is this a resend of an existing delivery
+        :return: S3Delivery: the delivery that was sent, None when it was sent by the agent
         """
-        s3 = self._create_s3()
-        to_s3user = s3.get_s3user_by_email(email)
+        if self._forward_to_agent('deliver', [bucket_name, email, user_message, resend]):
+            return None
+        with self._deliver_s3() as s3:
+            s3 = s3.with_deadline()
+            delivery_index = DeliveryIndex(self.config_file.delivery_index_filename, s3.config)
+            if resend:
+                delivery = self._resend_indexed_delivery(s3, delivery_index, bucket_name, email, user_message)
+                if delivery:
+                    return delivery
+            # recipient, bucket and current s3 user lookups do not depend on each other so run them at the same time
+            with self._lookup_s3s(s3, 2) as (email_s3, bucket_s3):
+                to_s3user, bucket, _ = run_in_parallel(
+                    lambda: email_s3.get_s3user_by_email(email),
+                    lambda: self._find_bucket(bucket_s3, bucket_name),
+                    lambda: s3.current_s3user)
+            if not bucket:
+                bucket = s3.create_bucket(bucket_name)
+            delivery = s3.create_delivery(bucket, to_s3user, user_message)
+            # record the delivery before sending so it is reused by a resend even if sending fails
+            delivery_index.put(bucket_name, email, delivery)
+            delivery = s3.send_delivery(delivery, resend)
+            delivery_index.put(bucket_name, email, delivery)
+            return delivery
+
+    @contextmanager
+    def _deliver_s3(self):
+        """
+        Provide the S3 client deliver uses in the current thread.
+        The agent runs forwarded commands at the same time so each one borrows a session from session_pool
+        instead of using the session of shared_s3.
+        :return: S3
+        """
+        if self.shared_s3:
+            with self.session_pool.lend(1) as (session,):
+                yield self.shared_s3.with_session(session)
+        else:
+            yield self._create_s3()
+
+    @contextmanager
+    def _lookup_s3s(self, s3, count):
+        """
+        Provide S3 clients for lookups run in helper threads while s3 is used by the current thread.
+        The helpers borrow sessions from session_pool when there is one (the agent and DeliveryClient run several
+        deliveries at the same time). A datadelivery command runs a single delivery so its helpers use s3.
+        :param s3: S3: client used by the current thread
+        :param count: int: number of clients needed
+        :return: [S3]
+        """
+        if self.session_pool:
+            with self.session_pool.lend(count) as sessions:
+                yield [s3.with_session(session) for session in sessions]
+        else:
+            yield [s3] * count
+
+    def _forward_to_agent(self, command, args):
+        """
+        Run command in the agent started by serve when it is running.
+        Commands are not forwarded while tracing since the requests would be made by the agent.
+        :return: bool: True if the agent ran the command
+        """
+        if not self.agent_socket_filename or self.tracer:
+            return False
+        return forward_command(self.agent_socket_filename, command, args)
+
+    @staticmethod
+    def _resend_indexed_delivery(s3, delivery_index, bucket_name, email, user_message):
+        """
+        Force send the delivery recorded in delivery_index for bucket_name and email.
+        A recorded delivery created with a different message is not sent so a new one carries user_message.
+        :return: S3Delivery: the delivery that was sent or None if there is no recorded delivery with user_message
+        or it no longer exists
+        """
+        indexed_delivery = delivery_index.get(bucket_name, email)
+        if not indexed_delivery:
+            return None
+        if user_message and not indexed_delivery.has_message(user_message):
+            return None
         try:
-            bucket = s3.get_bucket_by_name(bucket_name)
+            delivery = s3.send_delivery(indexed_delivery, True)
+        except S3Exception as ex:
+            if ex.status_code != 404:
+                raise
+            delivery_index.remove(bucket_name, email)
+            return None
+        delivery_index.put(bucket_name, email, delivery)
+        return delivery
+
+    @staticmethod
+    def _find_bucket(s3, bucket_name):
+        """
+        Return S3Bucket or None if not found
+        """
+        try:
+            return s3.get_bucket_by_name(bucket_name)
         except NotFoundException:
-            bucket = s3.create_bucket(bucket_name)
-        delivery = s3.create_delivery(bucket, to_s3user, user_message)
-        s3.send_delivery(delivery, resend)
+            return None
+
+    def deliver_many(self, manifest_filename, num_workers, journal_filename=None, max_workers=None):
+        """
+        Deliver each bucket/email row in a manifest file using a single S3 client and a pool of workers.
+        Prints a table with the result of each row.
+        :param manifest_filename: str: path to a csv, yaml, json or ndjson manifest file
+        :param num_workers: int: number of deliveries to run at the same time
+        :param journal_filename: str: optional journal file recording progress, rows it shows as done are skipped
+        :param max_workers: int: when given, adapt the number of requests in flight between 1 and max_workers
+        starting at num_workers based on server latency and errors
+        """
+        rows = read_manifest(manifest_filename)
+        s3 = self._create_s3()
+        journal = DeliveryJournal(journal_filename) if journal_filename else None
+        concurrency = None
+        if max_workers:
+            concurrency = AdaptiveConcurrency(max_workers, initial=min(num_workers, max_workers),
+                                              on_adjust=print_concurrency_adjustment)
+            s3.add_request_hook(concurrency)
+            num_workers = max_workers
+        self._report_results(BatchDelivery(s3, num_workers, journal, concurrency).run(rows))
+
+    def plan(self, manifest_filename, execute, num_workers):
+        """
+        Print the deduplicated api calls needed to deliver every row in a manifest file, optionally performing them.
+        Recipients are looked up and buckets found or created once no matter how many rows share them.
+        :param manifest_filename: str: path to a csv, yaml, json or ndjson manifest file
+        :param execute: bool: perform the plan after printing it
+        :param num_workers: int: number of requests to run at the same time
+        """
+        delivery_plan = DeliveryPlan(read_manifest(manifest_filename))
+        print(delivery_plan.format())
+        if execute:
+            self._report_results(delivery_plan.execute(self._create_s3(), num_workers))
+
+    def list_buckets(self, name, owner, output_format):
+        """
+        Print buckets as they are received from the api.
+        :param name: str: only include the bucket with this name or None
+        :param owner: int: only include buckets owned by this s3 user id or None
+        :param output_format: str: 'table' or 'ndjson'
+        """
+        s3 = self._create_s3()
+        write_items(s3.iter_buckets(name=name, owner=owner), BUCKET_COLUMNS, output_format, sys.stdout)
+
+    def list_deliveries(self, bucket, from_user, to_user, state, output_format):
+        """
+        Print deliveries as they are received from the api.
+        :param bucket: int: only include deliveries of this bucket id or None
+        :param from_user: int: only include deliveries sent by this s3 user id or None
+        :param to_user: int: only include deliveries sent to this s3 user id or None
+        :param state: int: only include deliveries in this state or None
+        :param output_format: str: 'table' or 'ndjson'
+        """
+        s3 = self._create_s3()
+        deliveries = s3.iter_deliveries(bucket=bucket, from_user=from_user, to_user=to_user, state=state)
+        write_items(deliveries, DELIVERY_COLUMNS, output_format, sys.stdout)
+
+    def status(self, delivery_ids):
+        """
+        Print a table with the current state of each delivery.
+        :param delivery_ids: [int]: ids of the deliveries
+        """
+        watcher = DeliveryWatcher(self._create_s3(), delivery_ids)
+        watcher.poll()
+        print(watcher.format_status_table())
+
+    def watch(self, delivery_ids, timeout):
+        """
+        Poll deliveries printing each change of state until recipients have accepted or declined all of them.
+        Prints a table with the final state of each delivery.
+        :param delivery_ids: [int]: ids of the deliveries
+        :param timeout: float: seconds to wait before giving up or None to wait forever
+        """
+        watcher = DeliveryWatcher(self._create_s3(), delivery_ids, on_change=self._print_state_change)
+        finished = watcher.watch(timeout)
+        print(watcher.format_status_table())
+        if not finished:
+            unfinished_count = len([watched for watched in watcher.deliveries if not watched.finished])
+            raise S3Exception("{} of {} deliveries not finished after {} seconds".format(
+                unfinished_count, len(delivery_ids), timeout))
+
+    @staticmethod
+    def _print_state_change(watched, old_state_name):
+        print("Delivery {}: {} -> {}".format(watched.id, old_state_name, watched.state_name))
+
+    def serve(self):
+        """
+        Run an agent that keeps one S3 client with the current endpoint and user looked up, running commands
+        forwarded by other datadelivery processes until interrupted. Forwarded commands run at the same time
+        so each borrows sessions with open connections from a pool instead of sharing one.
+        Request metrics are exported when the agent exits since StatsD counters are sent as totals.
+        """
+        # the agent runs forwarded commands itself
+        self.agent_socket_filename = None
+        self.shared_s3 = self._create_s3()
+        self.session_pool = SessionPool(self.shared_s3)
+        # look up the current endpoint and user now so the first forwarded command does not wait for them
+        current_s3user = self.shared_s3.current_s3user
+        agent = DeliveryAgent(self, self.config_file.agent_socket_filename).start()
+        print("Listening on {} as {}".format(agent.socket_filename, current_s3user.email))
+        try:
+            agent.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            agent.close()
+            self.session_pool.close()
+
+    @staticmethod
+    def _report_results(results):
+        """
+        Print a table with the result of each row, raising S3Exception if any failed.
+        """
+        print(format_results_table(results))
+        failed_count = len([result for result in results if not result.succeeded])
+        if failed_count:
+            raise S3Exception("{} of {} deliveries failed".format(failed_count, len(results)))
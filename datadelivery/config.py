@@ -1,14 +1,26 @@
 from __future__ import print_function, absolute_import
+import json
 import os
-import yaml
+import tempfile
 from six.moves import input
+from datadelivery.cache import DEFAULT_IDENTITY_CACHE_TTL, DEFAULT_HTTP_CACHE_MAX_SIZE
+from datadelivery.retry import DEFAULT_MAX_ATTEMPTS, DEFAULT_BACKOFF_BASE
 
 
 CONFIG_FILENAME_ENV = 'DATA_DELIVERY_CONFIG'
 DEFAULT_CONFIG_FILENAME = '~/.datadelivery.yml'
+IDENTITY_CACHE_FILENAME_SUFFIX = '.cache.json'
+DELIVERY_INDEX_FILENAME_SUFFIX = '.deliveries.sqlite'
+RATE_LIMIT_FILENAME_SUFFIX = '.ratelimit.json'
+HTTP_CACHE_DIRNAME_SUFFIX = '.http-cache'
+AGENT_SOCKET_FILENAME_SUFFIX = '.agent.sock'
+COMPILED_CONFIG_FILENAME_SUFFIX = '.compiled.json'
 BASE_DATA_DELIVERY_URL = 'https://datadelivery.genome.duke.edu'
 DEFAULT_DATA_DELIVERY_URL = '{}/api/v2/'.format(BASE_DATA_DELIVERY_URL)
 DEFAULT_ENDPOINT_NAME = 'default'
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
 
 ENTER_DATA_DELIVERY_TOKEN_PROMPT = """Please request a token from {}
 Enter token (or press enter to quit):""".format(BASE_DATA_DELIVERY_URL)
@@ -18,6 +30,48 @@ class ConfigFile(object):
     def __init__(self, filename=os.environ.get(CONFIG_FILENAME_ENV, DEFAULT_CONFIG_FILENAME)):
         self.filename = os.path.expanduser(filename)
 
+    @property
+    def identity_cache_filename(self):
+        """
+        Path of the identity cache file kept next to the config file.
+        """
+        return os.path.splitext(self.filename)[0] + IDENTITY_CACHE_FILENAME_SUFFIX
+
+    @property
+    def delivery_index_filename(self):
+        """
+        Path of the delivery index database kept next to the config file.
+        """
+        return os.path.splitext(self.filename)[0] + DELIVERY_INDEX_FILENAME_SUFFIX
+
+    @property
+    def rate_limit_filename(self):
+        """
+        Path of the rate limiter state shared by every datadelivery process using this config file.
+        """
+        return os.path.splitext(self.filename)[0] + RATE_LIMIT_FILENAME_SUFFIX
+
+    @property
+    def http_cache_dirname(self):
+        """
+        Path of the directory of cached GET responses kept next to the config file.
+        """
+        return os.path.splitext(self.filename)[0] + HTTP_CACHE_DIRNAME_SUFFIX
+
+    @property
+    def agent_socket_filename(self):
+        """
+        Path of the Unix socket the agent started by 'datadelivery serve' listens on.
+        """
+        return os.path.splitext(self.filename)[0] + AGENT_SOCKET_FILENAME_SUFFIX
+
+    @property
+    def compiled_config_filename(self):
+        """
+        Path of the parsed copy of the config file that lets later runs skip parsing YAML.
+        """
+        return os.path.splitext(self.filename)[0] + COMPILED_CONFIG_FILENAME_SUFFIX
+
     def read_or_create_config(self):
         config = Config({})
         if os.path.exists(self.filename):
@@ -45,10 +99,50 @@ class ConfigFile(object):
         return input(message)
 
     def read_config(self):
-        with open(self.filename, 'r') as stream:
-            return Config(yaml.safe_load(stream))
+        """
+        Read the config file, using the compiled copy when it was made from the current file so the YAML
+        parser is neither imported nor run. The compiled copy is rewritten whenever the file is parsed.
+        :return: Config
+        """
+        stat = os.stat(self.filename)
+        version = [getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size]
+        data = self._read_compiled_config(version)
+        if data is None:
+            with open(self.filename, 'r') as stream:
+                data = load_yaml(stream)
+            self._write_compiled_config(version, data)
+        return Config(data)
+
+    def _read_compiled_config(self, version):
+        try:
+            with open(self.compiled_config_filename, 'r') as stream:
+                compiled = json.load(stream)
+            if compiled['version'] == version:
+                return compiled['data']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _write_compiled_config(self, version, data):
+        # best effort like IdentityCache, mkstemp creates a file only the user can read which matters for the token
+        directory = os.path.dirname(self.compiled_config_filename) or '.'
+        try:
+            fd, temp_filename = tempfile.mkstemp(dir=directory, prefix='.datadelivery-config')
+        except (IOError, OSError):
+            return
+        try:
+            with os.fdopen(fd, 'w') as stream:
+                json.dump({'version': version, 'data': data}, stream)
+            os.rename(temp_filename, self.compiled_config_filename)
+        except (IOError, OSError, TypeError, ValueError):
+            # TypeError when the YAML contains values JSON can not represent
+            try:
+                os.unlink(temp_filename)
+            except OSError:
+                pass
 
     def write_config(self, config):
+        import yaml
         with open(self.filename, 'w+') as stream:
             yaml.safe_dump(config.to_dict(), stream)
 
@@ -58,6 +152,18 @@ class Config(object):
         self.token = data.get('token')
         self._url = data.get('url')
         self._endpoint_name = data.get('endpoint_name')
+        self._http_pool_size = data.get('http_pool_size')
+        self._identity_cache_ttl = data.get('identity_cache_ttl')
+        self._http_cache_size = data.get('http_cache_size')
+        self._retry_max_attempts = data.get('retry_max_attempts')
+        self._retry_backoff = data.get('retry_backoff')
+        self._connect_timeout = data.get('connect_timeout')
+        self._read_timeout = data.get('read_timeout')
+        self.deliver_deadline = data.get('deliver_deadline')
+        self.rate_limit = data.get('rate_limit')
+        self.rate_limit_burst = data.get('rate_limit_burst')
+        self.metrics_textfile = data.get('metrics_textfile')
+        self.statsd_address = data.get('statsd_address')
 
     @property
     def url(self):
@@ -71,6 +177,66 @@ class Config(object):
             return DEFAULT_ENDPOINT_NAME
         return self._endpoint_name
 
+    @property
+    def http_pool_size(self):
+        if not self._http_pool_size:
+            return DEFAULT_HTTP_POOL_SIZE
+        return self._http_pool_size
+
+    @property
+    def identity_cache_ttl(self):
+        """
+        Seconds to reuse cached endpoint and s3 user lookups, 0 disables the cache.
+        """
+        if self._identity_cache_ttl is None:
+            return DEFAULT_IDENTITY_CACHE_TTL
+        return self._identity_cache_ttl
+
+    @property
+    def http_cache_size(self):
+        """
+        Bytes of GET responses to keep for revalidating with the D4S2 api, 0 disables the cache.
+        """
+        if self._http_cache_size is None:
+            return DEFAULT_HTTP_CACHE_MAX_SIZE
+        return self._http_cache_size
+
+    @property
+    def retry_max_attempts(self):
+        """
+        Number of times a request is attempted before giving up, 1 disables retrying.
+        """
+        if not self._retry_max_attempts:
+            return DEFAULT_MAX_ATTEMPTS
+        return self._retry_max_attempts
+
+    @property
+    def retry_backoff(self):
+        """
+        Seconds to wait (before jitter) after the first failed attempt, doubled after each further attempt.
+        """
+        if self._retry_backoff is None:
+            return DEFAULT_BACKOFF_BASE
+        return self._retry_backoff
+
+    @property
+    def connect_timeout(self):
+        """
+        Seconds to wait for a connection to the D4S2 api.
+        """
+        if not self._connect_timeout:
+            return DEFAULT_CONNECT_TIMEOUT
+        return self._connect_timeout
+
+    @property
+    def read_timeout(self):
+        """
+        Seconds to wait for the D4S2 api to send data on an open connection.
+        """
+        if not self._read_timeout:
+            return DEFAULT_READ_TIMEOUT
+        return self._read_timeout
+
     def to_dict(self):
         data = {}
         if self.token:
@@ -79,8 +245,42 @@ class Config(object):
             data['url'] = self._url
         if self._endpoint_name:
             data['endpoint_name'] = self._endpoint_name
+        if self._http_pool_size:
+            data['http_pool_size'] = self._http_pool_size
+        if self._identity_cache_ttl is not None:
+            data['identity_cache_ttl'] = self._identity_cache_ttl
+        if self._http_cache_size is not None:
+            data['http_cache_size'] = self._http_cache_size
+        if self._retry_max_attempts:
+            data['retry_max_attempts'] = self._retry_max_attempts
+        if self._retry_backoff is not None:
+            data['retry_backoff'] = self._retry_backoff
+        if self._connect_timeout:
+            data['connect_timeout'] = self._connect_timeout
+        if self._read_timeout:
+            data['read_timeout'] = self._read_timeout
+        if self.deliver_deadline:
+            data['deliver_deadline'] = self.deliver_deadline
+        if self.rate_limit:
+            data['rate_limit'] = self.rate_limit
+        if self.rate_limit_burst:
+            data['rate_limit_burst'] = self.rate_limit_burst
+        if self.metrics_textfile:
+            data['metrics_textfile'] = self.metrics_textfile
+        if self.statsd_address:
+            data['statsd_address'] = self.statsd_address
         return data
 
 
+def load_yaml(stream):
+    """
+    Parse YAML with the libyaml based CSafeLoader when pyyaml was built with it, it is much faster than SafeLoader.
+    :param stream: file to read
+    :return: parsed data
+    """
+    import yaml
+    return yaml.load(stream, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
 class ConfigSetupAbandoned(Exception):
     pass
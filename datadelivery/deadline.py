@@ -0,0 +1,35 @@
+from __future__ import absolute_import
+import time
+
+
+class Deadline(object):
+    def __init__(self, seconds=None):
+        """
+        Point in time by which a group of requests must finish.
+        :param seconds: float: seconds from now until the deadline, None for no deadline
+        """
+        self.expires_at = None
+        if seconds is not None:
+            self.expires_at = time.time() + seconds
+
+    def remaining(self):
+        """
+        :return: float: seconds left before the deadline (never negative) or None when there is no deadline
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self):
+        return self.remaining() == 0.0
+
+    def limit_timeout(self, timeout):
+        """
+        Shorten timeout so it does not extend past the deadline.
+        :param timeout: float: seconds
+        :return: float: timeout or the time remaining if that is shorter
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return min(timeout, remaining)
@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+import hashlib
+import time
+import six
+
+# the table is versioned so an index written before message hashes were recorded is ignored instead of failing
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS deliveries_v2 (
+    url TEXT NOT NULL,
+    endpoint_name TEXT NOT NULL,
+    bucket_name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    delivery_id INTEGER NOT NULL,
+    state INTEGER,
+    message_hash TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (url, endpoint_name, bucket_name, email)
+)
+"""
+SELECT_SQL = "SELECT delivery_id, state, message_hash FROM deliveries_v2 " \
+             "WHERE url = ? AND endpoint_name = ? AND bucket_name = ? AND email = ?"
+REPLACE_SQL = "INSERT OR REPLACE INTO deliveries_v2 " \
+              "(url, endpoint_name, bucket_name, email, delivery_id, state, message_hash, updated) " \
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+DELETE_SQL = "DELETE FROM deliveries_v2 WHERE url = ? AND endpoint_name = ? AND bucket_name = ? AND email = ?"
+
+
+class DeliveryIndex(object):
+    def __init__(self, filename, config):
+        """
+        SQLite database remembering the delivery created for each bucket and recipient so a resend
+        can send the existing delivery without looking anything else up.
+        The index is best effort, any database error is treated as a missing entry.
+        :param filename: str: path to the database file, created if it does not exist
+        :param config: Config: the api url and endpoint name are part of each key
+        """
+        self.filename = filename
+        self.config = config
+
+    def get(self, bucket_name, email):
+        """
+        Return the delivery recorded for bucket_name and email.
+        :param bucket_name: str: name of the bucket
+        :param email: str: email address of the recipient
+        :return: IndexedDelivery or None if not found
+        """
+        rows = self._execute(SELECT_SQL, self._key(bucket_name, email))
+        if rows:
+            delivery_id, state, message_hash = rows[0]
+            return IndexedDelivery(delivery_id, state, message_hash)
+        return None
+
+    def put(self, bucket_name, email, delivery):
+        """
+        Record the delivery of bucket_name to email.
+        :param bucket_name: str: name of the bucket
+        :param email: str: email address of the recipient
+        :param delivery: S3Delivery: delivery returned by the api
+        """
+        self._execute(REPLACE_SQL, self._key(bucket_name, email) +
+                      (delivery.id, delivery.state, make_message_hash(delivery.user_message), time.time()))
+
+    def remove(self, bucket_name, email):
+        self._execute(DELETE_SQL, self._key(bucket_name, email))
+
+    def _key(self, bucket_name, email):
+        return (self.config.url, self.config.endpoint_name, bucket_name, email)
+
+    def _execute(self, sql, params):
+        import sqlite3
+        try:
+            connection = sqlite3.connect(self.filename)
+            try:
+                with connection:
+                    connection.execute(CREATE_TABLE_SQL)
+                    return connection.execute(sql, params).fetchall()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            return []
+
+
+class IndexedDelivery(object):
+    def __init__(self, delivery_id, state, message_hash):
+        """
+        Delivery id, state and user message hash saved in a DeliveryIndex, enough to send the delivery again.
+        """
+        self.id = delivery_id
+        self.state = state
+        self.message_hash = message_hash
+
+    def has_message(self, user_message):
+        """
+        Was the delivery created with user_message.
+        :param user_message: str: message to compare
+        :return: bool
+        """
+        return self.message_hash == make_message_hash(user_message)
+
+
+def make_message_hash(user_message):
+    """
+    Hash of a delivery user message, stored instead of the message itself.
+    :param user_message: str: message sent with the delivery
+    :return: str: hex digest
+    """
+    user_message = user_message or ''
+    if isinstance(user_message, six.text_type):
+        user_message = user_message.encode('utf-8')
+    return hashlib.sha256(user_message).hexdigest()
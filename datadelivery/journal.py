@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+import json
+import os
+import threading
+
+STAGE_BUCKET_RESOLVED = 'bucket_resolved'
+STAGE_DELIVERY_CREATED = 'delivery_created'
+STAGE_SENT = 'sent'
+
+
+class DeliveryJournal(object):
+    def __init__(self, filename):
+        """
+        Append-only NDJSON file recording how far each manifest row got so an interrupted batch can resume.
+        Records already in the file are loaded when the journal is created. Each record is flushed to disk
+        before the next request for that row is sent.
+        :param filename: str: path to the journal file, created if it does not exist
+        """
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._rows = self._load()
+
+    @staticmethod
+    def row_key(row):
+        """
+        Key identifying a manifest row across runs.
+        :param row: ManifestRow: row to build the key for
+        :return: str: key
+        """
+        return '{}|{}|{}'.format(row.row_num, row.bucket_name, row.email)
+
+    def get(self, row):
+        """
+        Return the data recorded for row with the latest record for each stage.
+        :param row: ManifestRow: row to look up
+        :return: dict: stage name to record data, empty if nothing was recorded
+        """
+        with self._lock:
+            return dict(self._rows.get(self.row_key(row), {}))
+
+    def record(self, row, stage, data):
+        """
+        Append a record that row reached stage.
+        :param row: ManifestRow: row that made progress
+        :param stage: str: one of the STAGE_ constants
+        :param data: dict: JSON serializable data needed to resume from stage
+        """
+        key = self.row_key(row)
+        line = json.dumps({'row': key, 'stage': stage, 'data': data}, sort_keys=True) + '\n'
+        with self._lock:
+            with open(self.filename, 'a') as stream:
+                stream.write(line)
+                stream.flush()
+                os.fsync(stream.fileno())
+            self._rows.setdefault(key, {})[stage] = data
+
+    def _load(self):
+        rows = {}
+        if not os.path.exists(self.filename):
+            return rows
+        with open(self.filename, 'r+b') as stream:
+            contents = stream.read()
+            complete_size = contents.rfind(b'\n') + 1
+            if complete_size < len(contents):
+                # the last line is incomplete when a run was killed while writing it, remove it so the
+                # next record is not appended onto it and lost
+                stream.truncate(complete_size)
+        for line in contents[:complete_size].decode('utf-8').splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            rows.setdefault(record['row'], {})[record['stage']] = record['data']
+        return rows
@@ -0,0 +1,36 @@
+from __future__ import absolute_import
+import json
+
+OUTPUT_FORMAT_TABLE = 'table'
+OUTPUT_FORMAT_NDJSON = 'ndjson'
+OUTPUT_FORMATS = [OUTPUT_FORMAT_TABLE, OUTPUT_FORMAT_NDJSON]
+BUCKET_COLUMNS = [('id', 8), ('name', 40), ('owner', 8), ('endpoint', 8)]
+DELIVERY_COLUMNS = [('id', 8), ('bucket', 8), ('from_user', 10), ('to_user', 8), ('state', 8),
+                    ('decline_reason', 0)]
+
+
+def write_items(items, columns, output_format, stream):
+    """
+    Write each item as soon as it is received so output starts with the first page and memory use stays constant.
+    :param items: iterable of model objects (ie. S3Bucket)
+    :param columns: [(str, int)]: attribute names and widths for the table format
+    :param output_format: str: one of OUTPUT_FORMATS
+    :param stream: file to write to
+    :return: int: number of items written
+    """
+    if output_format == OUTPUT_FORMAT_TABLE:
+        stream.write(_make_table_line([name for name, _ in columns], columns))
+    count = 0
+    for item in items:
+        if output_format == OUTPUT_FORMAT_NDJSON:
+            stream.write(json.dumps(vars(item), sort_keys=True) + '\n')
+        else:
+            stream.write(_make_table_line([str(getattr(item, name)) for name, _ in columns], columns))
+        stream.flush()
+        count += 1
+    return count
+
+
+def _make_table_line(values, columns):
+    # widths are fixed since rows are written before the longest value is known
+    return '  '.join(value.ljust(width) for value, (_, width) in zip(values, columns)).rstrip() + '\n'
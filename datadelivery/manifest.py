@@ -0,0 +1,127 @@
+from __future__ import absolute_import
+import csv
+import json
+import os
+
+CSV_EXTENSIONS = ['.csv']
+YAML_EXTENSIONS = ['.yml', '.yaml']
+NDJSON_EXTENSIONS = ['.ndjson', '.jsonl']
+JSON_EXTENSIONS = ['.json']
+TRUE_STRINGS = ['true', 'yes', 'y', '1']
+
+
+def read_manifest(filename):
+    """
+    Read the rows of a delivery manifest. The format is determined by the file extension:
+    .csv with a header row, .yml/.yaml containing a list of mappings, .ndjson/.jsonl one object per line
+    and .json either a list of objects or one object per line.
+    Each row must have bucket_name and email and may have msg_file and resend.
+    Raises ManifestException when the file cannot be read or parsed.
+    :param filename: str: path to the manifest file
+    :return: [ManifestRow]: rows in the order they appear in the file
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in CSV_EXTENSIONS + YAML_EXTENSIONS + NDJSON_EXTENSIONS + JSON_EXTENSIONS:
+        raise ManifestException("Unsupported manifest file type {}".format(filename))
+    try:
+        with open(filename, 'r') as stream:
+            if extension in CSV_EXTENSIONS:
+                items = _read_csv(filename, stream)
+            elif extension in YAML_EXTENSIONS:
+                items = _read_yaml(filename, stream)
+            elif extension in JSON_EXTENSIONS:
+                items = _read_json(filename, stream)
+            else:
+                items = _read_ndjson(filename, stream)
+    except (IOError, OSError) as ex:
+        raise ManifestException("Unable to read manifest {}: {}".format(filename, ex))
+    if not isinstance(items, list):
+        raise ManifestException("Manifest {} must contain a list of rows".format(filename))
+    return [ManifestRow.from_dict(line_num, item) for line_num, item in enumerate(items, start=1)]
+
+
+def _read_csv(filename, stream):
+    try:
+        return list(csv.DictReader(stream))
+    except csv.Error as ex:
+        raise ManifestException("Manifest {} is not valid CSV: {}".format(filename, ex))
+
+
+def _read_yaml(filename, stream):
+    import yaml
+    try:
+        return yaml.safe_load(stream) or []
+    except yaml.YAMLError as ex:
+        raise ManifestException("Manifest {} is not valid YAML: {}".format(filename, ex))
+
+
+def _read_json(filename, stream):
+    contents = stream.read()
+    if not contents.lstrip().startswith('['):
+        return _read_ndjson(filename, contents.splitlines())
+    try:
+        return json.loads(contents)
+    except ValueError as ex:
+        raise ManifestException("Manifest {} is not valid JSON: {}".format(filename, ex))
+
+
+def _read_ndjson(filename, lines):
+    items = []
+    for line_num, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                items.append(json.loads(line))
+            except ValueError as ex:
+                raise ManifestException("Manifest {} line {} is not valid JSON: {}".format(filename, line_num, ex))
+    return items
+
+
+class ManifestRow(object):
+    def __init__(self, row_num, bucket_name, email, msg_file=None, resend=False):
+        """
+        A single bucket delivery requested by a manifest.
+        :param row_num: int: 1 based position of this row in the manifest
+        :param bucket_name: str: name of the bucket to deliver
+        :param email: str: email of the user to deliver the bucket to
+        :param msg_file: str: optional filename containing a message to be sent with the delivery
+        :param resend: bool: is this a resend of an existing delivery
+        """
+        self.row_num = row_num
+        self.bucket_name = bucket_name
+        self.email = email
+        self.msg_file = msg_file
+        self.resend = resend
+
+    @staticmethod
+    def from_dict(row_num, data):
+        if not isinstance(data, dict):
+            raise ManifestException("Manifest row {} is not a mapping".format(row_num))
+        bucket_name = data.get('bucket_name')
+        email = data.get('email')
+        if not bucket_name or not email:
+            raise ManifestException("Manifest row {} requires bucket_name and email".format(row_num))
+        return ManifestRow(row_num, bucket_name, email,
+                           msg_file=data.get('msg_file') or None,
+                           resend=ManifestRow._parse_bool(data.get('resend')))
+
+    @staticmethod
+    def _parse_bool(value):
+        if isinstance(value, bool):
+            return value
+        if value is None:
+            return False
+        return str(value).strip().lower() in TRUE_STRINGS
+
+    def read_user_message(self):
+        """
+        return the contents of msg_file or "" if there is no msg_file
+        :return: str: message to send with the delivery
+        """
+        if self.msg_file:
+            with open(self.msg_file, 'r') as infile:
+                return infile.read()
+        return ""
+
+
+class ManifestException(Exception):
+    pass
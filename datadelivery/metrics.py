@@ -0,0 +1,242 @@
+from __future__ import absolute_import
+import atexit
+import bisect
+import os
+import socket
+import tempfile
+import threading
+import time
+
+# upper bounds in seconds of the request latency histogram buckets, the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+OTHER_ROUTE = 'other'
+# (route, url prefix, text the url must contain) checked in order, the first match is used
+ROUTE_PATTERNS = (
+    ('s3-endpoints', 's3-endpoints/', None),
+    ('users/current-user', 'users/current-user/', None),
+    ('s3-users', 's3-users/', None),
+    ('s3-buckets', 's3-buckets/', None),
+    ('s3-deliveries/send', 's3-deliveries/', '/send/'),
+    ('s3-deliveries', 's3-deliveries/', None),
+)
+SEND_DELIVERY_ROUTE = 's3-deliveries/send'
+STATUS_ERROR = 'error'
+DEFAULT_STATSD_PREFIX = 'datadelivery'
+
+_local = threading.local()
+_process_metrics = None
+_process_metrics_lock = threading.Lock()
+
+
+class RouteMetrics(object):
+    def __init__(self, method, route):
+        """
+        Counters and latency histogram for one method and route, allocated before any request is recorded.
+        :param method: str: HTTP method
+        :param route: str: route name from ROUTE_PATTERNS or OTHER_ROUTE
+        """
+        self.method = method
+        self.route = route
+        self.count = 0
+        self.retries = 0
+        self.latency_sum = 0.0
+        # bucket_counts[idx] counts requests taking at most LATENCY_BUCKETS[idx] (and over the previous bound)
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.status_counts = {}
+
+
+class RequestMetrics(object):
+    def __init__(self):
+        """
+        Request hook recording counts, status codes, retries and latency of the requests made by S3 clients.
+        Every method/route combination is allocated up front so recording a request only updates numbers.
+        Register it with S3.add_request_hook and call write_prometheus_textfile or push_statsd to export.
+        """
+        self.started = time.time()
+        self.deliveries_sent = 0
+        # method -> route -> RouteMetrics, nested so finding the metrics for a request does not build a key
+        self.routes = {}
+        self._lock = threading.Lock()
+        for method in METHODS:
+            self._add_method(method)
+
+    def _add_method(self, method):
+        with self._lock:
+            if method not in self.routes:
+                method_routes = dict((route, RouteMetrics(method, route)) for route, _, _ in ROUTE_PATTERNS)
+                method_routes[OTHER_ROUTE] = RouteMetrics(method, OTHER_ROUTE)
+                self.routes[method] = method_routes
+            return self.routes[method]
+
+    def request_started(self, method, url_suffix, retry):
+        method_routes = self.routes.get(method)
+        if method_routes is None:
+            method_routes = self._add_method(method)
+        route_metrics = method_routes[_match_route(url_suffix)]
+        if retry:
+            with self._lock:
+                route_metrics.retries += 1
+        _local.start = time.time()
+        return route_metrics
+
+    def request_finished(self, route_metrics, response, error):
+        seconds = time.time() - _local.start
+        status = response.status_code if response is not None else STATUS_ERROR
+        with self._lock:
+            route_metrics.count += 1
+            route_metrics.latency_sum += seconds
+            route_metrics.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            route_metrics.status_counts[status] = route_metrics.status_counts.get(status, 0) + 1
+            if route_metrics.route == SEND_DELIVERY_ROUTE and status != STATUS_ERROR and status < 300:
+                self.deliveries_sent += 1
+
+    def _recorded_routes(self):
+        with self._lock:
+            return [route_metrics for method in sorted(self.routes)
+                    for _, route_metrics in sorted(self.routes[method].items()) if route_metrics.count]
+
+    @property
+    def deliveries_per_second(self):
+        elapsed = time.time() - self.started
+        return self.deliveries_sent / elapsed if elapsed > 0 else 0.0
+
+    def format_prometheus(self):
+        """
+        Create the metrics in the Prometheus text exposition format.
+        :return: str: metrics text
+        """
+        route_metrics_list = self._recorded_routes()
+        lines = [
+            '# HELP datadelivery_api_requests_total D4S2 api requests by response status.',
+            '# TYPE datadelivery_api_requests_total counter',
+        ]
+        for route_metrics in route_metrics_list:
+            for status, count in sorted(route_metrics.status_counts.items(), key=lambda item: str(item[0])):
+                lines.append('datadelivery_api_requests_total{{{},status="{}"}} {}'.format(
+                    _prometheus_labels(route_metrics), status, count))
+        lines.extend([
+            '# HELP datadelivery_api_retries_total D4S2 api requests that were retries of a failed attempt.',
+            '# TYPE datadelivery_api_retries_total counter',
+        ])
+        for route_metrics in route_metrics_list:
+            lines.append('datadelivery_api_retries_total{{{}}} {}'.format(
+                _prometheus_labels(route_metrics), route_metrics.retries))
+        lines.extend([
+            '# HELP datadelivery_api_request_duration_seconds D4S2 api request latency.',
+            '# TYPE datadelivery_api_request_duration_seconds histogram',
+        ])
+        for route_metrics in route_metrics_list:
+            labels = _prometheus_labels(route_metrics)
+            cumulative = 0
+            for upper_bound, count in zip(LATENCY_BUCKETS + ('+Inf',), route_metrics.bucket_counts):
+                cumulative += count
+                lines.append('datadelivery_api_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                    labels, upper_bound, cumulative))
+            lines.append('datadelivery_api_request_duration_seconds_sum{{{}}} {}'.format(
+                labels, route_metrics.latency_sum))
+            lines.append('datadelivery_api_request_duration_seconds_count{{{}}} {}'.format(
+                labels, route_metrics.count))
+        lines.extend([
+            '# HELP datadelivery_deliveries_sent_total Deliveries the D4S2 api accepted for sending.',
+            '# TYPE datadelivery_deliveries_sent_total counter',
+            'datadelivery_deliveries_sent_total {}'.format(self.deliveries_sent),
+            '# HELP datadelivery_deliveries_per_second Deliveries sent per second since the process started.',
+            '# TYPE datadelivery_deliveries_per_second gauge',
+            'datadelivery_deliveries_per_second {}'.format(self.deliveries_per_second),
+        ])
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus_textfile(self, filename):
+        """
+        Write the metrics for the node exporter textfile collector. The file is replaced atomically
+        so the collector never reads a partly written file.
+        :param filename: str: path of the .prom file to write
+        """
+        directory = os.path.dirname(filename) or '.'
+        fd, temp_filename = tempfile.mkstemp(dir=directory, prefix='.datadelivery-metrics')
+        try:
+            with os.fdopen(fd, 'w') as stream:
+                stream.write(self.format_prometheus())
+            os.chmod(temp_filename, 0o644)
+            os.rename(temp_filename, filename)
+        except Exception:
+            os.unlink(temp_filename)
+            raise
+
+    def format_statsd(self, prefix=DEFAULT_STATSD_PREFIX):
+        """
+        Create StatsD lines with the counts recorded since the process started.
+        :param prefix: str: prefix of every metric name
+        :return: [str]: one line per metric
+        """
+        lines = []
+        for route_metrics in self._recorded_routes():
+            name = '{}.api.{}.{}'.format(prefix, route_metrics.method.lower(), _statsd_name(route_metrics.route))
+            lines.append('{}.requests:{}|c'.format(name, route_metrics.count))
+            lines.append('{}.retries:{}|c'.format(name, route_metrics.retries))
+            for status, count in sorted(route_metrics.status_counts.items(), key=lambda item: str(item[0])):
+                lines.append('{}.status.{}:{}|c'.format(name, status, count))
+            lines.append('{}.latency_avg_ms:{:.3f}|g'.format(
+                name, route_metrics.latency_sum * 1000 / route_metrics.count))
+        lines.append('{}.deliveries.sent:{}|c'.format(prefix, self.deliveries_sent))
+        lines.append('{}.deliveries.per_second:{:.3f}|g'.format(prefix, self.deliveries_per_second))
+        return lines
+
+    def push_statsd(self, address, prefix=DEFAULT_STATSD_PREFIX):
+        """
+        Send the metrics to a StatsD server, one UDP datagram per metric.
+        :param address: str: host:port of the StatsD server
+        :param prefix: str: prefix of every metric name
+        """
+        host, port = address.rsplit(':', 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for line in self.format_statsd(prefix):
+                sock.sendto(line.encode('utf-8'), (host, int(port)))
+        finally:
+            sock.close()
+
+    def export(self, textfile=None, statsd_address=None):
+        """
+        Write the Prometheus textfile and/or push to StatsD, errors are ignored since this runs at exit.
+        :param textfile: str: path of the .prom file to write or None
+        :param statsd_address: str: host:port of the StatsD server or None
+        """
+        try:
+            if textfile:
+                self.write_prometheus_textfile(textfile)
+            if statsd_address:
+                self.push_statsd(statsd_address)
+        except (IOError, OSError, ValueError):
+            pass
+
+
+def get_process_metrics(textfile, statsd_address):
+    """
+    Return the RequestMetrics shared by every S3 client in this process, exported when the process exits.
+    :param textfile: str: path of the Prometheus .prom file to write at exit or None
+    :param statsd_address: str: host:port of a StatsD server to push to at exit or None
+    :return: RequestMetrics
+    """
+    global _process_metrics
+    with _process_metrics_lock:
+        if _process_metrics is None:
+            _process_metrics = RequestMetrics()
+            atexit.register(_process_metrics.export, textfile, statsd_address)
+        return _process_metrics
+
+
+def _match_route(url_suffix):
+    for route, prefix, contains in ROUTE_PATTERNS:
+        if url_suffix.startswith(prefix) and (contains is None or contains in url_suffix):
+            return route
+    return OTHER_ROUTE
+
+
+def _prometheus_labels(route_metrics):
+    return 'method="{}",route="{}"'.format(route_metrics.method, route_metrics.route)
+
+
+def _statsd_name(route):
+    return route.replace('/', '.').replace('-', '_')
@@ -0,0 +1,292 @@
+from __future__ import absolute_import
+import hashlib
+import json
+import random
+import threading
+import time
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs, urlencode
+
+API_PREFIX = '/api/v2/'
+DEFAULT_TOKEN = 'secret'
+DEFAULT_ENDPOINT_NAME = 'default'
+DELIVERY_STATE_NEW = 0
+DELIVERY_STATE_NOTIFIED = 1
+DELIVERY_STATE_ACCEPTED = 2
+DELIVERY_STATE_DECLINED = 3
+
+
+class MockD4S2Server(object):
+    def __init__(self, latency=0.0, error_rate=0.0, rate_limit=None, seed=None):
+        """
+        In memory stand in for the D4S2 s3 api served over HTTP on localhost, used by tests and benchmarks.
+        Starts with one endpoint named 'default' and a current user for DEFAULT_TOKEN.
+        :param latency: float: seconds to wait before responding to each request
+        :param error_rate: float: fraction of requests (0.0 - 1.0) that receive a 503 response
+        :param rate_limit: float: requests per second allowed before responding 429, None for no limit
+        :param seed: int: seed for choosing which requests fail
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_counts = {}
+        self.rate_limit_window = (0, 0)
+        self.endpoints = []
+        self.users = {}
+        self.s3users = []
+        self.buckets = []
+        self.deliveries = []
+        self.httpd = None
+        self.thread = None
+        self.current_user = self.add_user('joe@joe.com', token=DEFAULT_TOKEN)
+        self.endpoint = self.add_endpoint(DEFAULT_ENDPOINT_NAME)
+        self.current_s3user = self.add_s3user(self.current_user)
+
+    @property
+    def url(self):
+        """
+        Base url of the api to use as Config url.
+        """
+        host, port = self.httpd.server_address
+        return 'http://{}:{}{}'.format(host, port, API_PREFIX)
+
+    @property
+    def total_requests(self):
+        with self.lock:
+            return sum(self.request_counts.values())
+
+    def reset_request_counts(self):
+        with self.lock:
+            self.request_counts = {}
+
+    def start(self):
+        self.httpd = _ThreadingHTTPServer(('127.0.0.1', 0), _MockD4S2RequestHandler)
+        self.httpd.mock = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def add_endpoint(self, name):
+        endpoint = {'id': len(self.endpoints) + 1, 'name': name, 'url': 'https://{}.s3.example.com'.format(name)}
+        self.endpoints.append(endpoint)
+        return endpoint
+
+    def add_user(self, email, token=None):
+        user_id = len(self.users) + 1
+        username = email.split('@')[0]
+        user = {'id': user_id, 'username': username, 'first_name': username, 'last_name': '', 'email': email}
+        self.users[token or 'token{}'.format(user_id)] = user
+        return user
+
+    def add_s3user(self, user, endpoint=None):
+        s3user = {
+            'id': len(self.s3users) + 1,
+            'user': user['id'],
+            'endpoint': (endpoint or self.endpoint)['id'],
+            'email': user['email'],
+            'type': 'Normal',
+        }
+        self.s3users.append(s3user)
+        return s3user
+
+    def add_recipient(self, email):
+        """
+        Create a user with an s3 user at the default endpoint that can receive deliveries.
+        :param email: str: email of the recipient
+        :return: dict: s3 user
+        """
+        return self.add_s3user(self.add_user(email))
+
+    def add_bucket(self, name, owner=None):
+        bucket = {'id': len(self.buckets) + 1, 'name': name, 'owner': (owner or self.current_s3user)['id'],
+                  'endpoint': self.endpoint['id']}
+        self.buckets.append(bucket)
+        return bucket
+
+    def set_delivery_state(self, delivery_id, state, decline_reason=''):
+        """
+        Change the state of a delivery as if the recipient acted on it.
+        """
+        with self.lock:
+            delivery = self._find_delivery(str(delivery_id))
+            delivery['state'] = state
+            delivery['decline_reason'] = decline_reason
+
+    def handle(self, method, path, token, body, if_none_match=None):
+        """
+        Apply rate limiting, latency and error injection then route the request.
+        Responses to GET requests include an ETag, 304 is returned when it matches if_none_match.
+        :return: (int, object, dict): status code, JSON data and extra headers
+        """
+        parsed = urlparse(path)
+        route = parsed.path[len(API_PREFIX):] if parsed.path.startswith(API_PREFIX) else parsed.path
+        params = dict((key, values[0]) for key, values in parse_qs(parsed.query).items())
+        with self.lock:
+            route_name = '{} {}'.format(method, _route_name(route))
+            self.request_counts[route_name] = self.request_counts.get(route_name, 0) + 1
+            if self._over_rate_limit():
+                return 429, {'detail': 'Request was throttled.'}, {'Retry-After': '1'}
+            fail = self.random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return 503, {'detail': 'Service unavailable.'}, {}
+        user = self.users.get(token)
+        if not user:
+            return 401, {'detail': 'Invalid token.'}, {}
+        with self.lock:
+            status, data, headers = self._route(method, route, params, user, body)
+            if method == 'GET' and status == 200 and isinstance(data, list) and 'page_size' in params:
+                data = self._paginate(parsed.path, params, data)
+        if method == 'GET' and status == 200:
+            etag = '"{}"'.format(hashlib.md5(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest())
+            if etag == if_none_match:
+                return 304, None, {'ETag': etag}
+            headers = dict(headers, ETag=etag)
+        return status, data, headers
+
+    def _paginate(self, path, params, items):
+        """
+        Split list responses into pages like the django rest framework page number pagination.
+        """
+        page_size = int(params['page_size'])
+        page = int(params.get('page', 1))
+        start = (page - 1) * page_size
+        next_url = None
+        if start + page_size < len(items):
+            next_params = dict(params, page=page + 1)
+            host, port = self.httpd.server_address
+            next_url = 'http://{}:{}{}?{}'.format(host, port, path, urlencode(sorted(next_params.items())))
+        return {'count': len(items), 'next': next_url, 'previous': None, 'results': items[start:start + page_size]}
+
+    def _over_rate_limit(self):
+        if not self.rate_limit:
+            return False
+        window_start, count = self.rate_limit_window
+        now = time.time()
+        if now - window_start >= 1.0:
+            window_start, count = now, 0
+        count += 1
+        self.rate_limit_window = (window_start, count)
+        return count > self.rate_limit
+
+    def _route(self, method, route, params, user, body):
+        parts = [part for part in route.split('/') if part]
+        if method == 'GET' and parts == ['s3-endpoints']:
+            return 200, _filter(self.endpoints, params, ['name']), {}
+        if method == 'GET' and parts == ['users', 'current-user']:
+            return 200, user, {}
+        if method == 'GET' and parts == ['s3-users']:
+            return 200, _filter(self.s3users, params, ['endpoint', 'user', 'email']), {}
+        if parts and parts[0] == 's3-buckets':
+            return self._route_buckets(method, parts, params, body)
+        if parts and parts[0] == 's3-deliveries':
+            return self._route_deliveries(method, parts, params, body)
+        return 404, {'detail': 'Not found.'}, {}
+
+    def _route_buckets(self, method, parts, params, body):
+        if method == 'GET' and len(parts) == 1:
+            return 200, _filter(self.buckets, params, ['name', 'owner']), {}
+        if method == 'POST' and len(parts) == 1:
+            if _filter(self.buckets, {'name': body['name']}, ['name']):
+                return 400, {'name': ['S3 bucket with this name already exists.']}, {}
+            bucket = {'id': len(self.buckets) + 1, 'name': body['name'], 'owner': body['owner'],
+                      'endpoint': body['endpoint']}
+            self.buckets.append(bucket)
+            return 201, bucket, {}
+        return 404, {'detail': 'Not found.'}, {}
+
+    def _route_deliveries(self, method, parts, params, body):
+        if method == 'GET' and len(parts) == 1:
+            return 200, _filter(self.deliveries, params, ['bucket', 'from_user', 'to_user', 'state']), {}
+        if method == 'POST' and len(parts) == 1:
+            delivery = {
+                'id': len(self.deliveries) + 1, 'bucket': body['bucket'], 'from_user': body['from_user'],
+                'to_user': body['to_user'], 'state': DELIVERY_STATE_NEW, 'user_message': body['user_message'],
+                'decline_reason': '', 'performed_by': '', 'delivery_email_text': '',
+            }
+            self.deliveries.append(delivery)
+            return 201, delivery, {}
+        delivery = self._find_delivery(parts[1])
+        if not delivery:
+            return 404, {'detail': 'Not found.'}, {}
+        if method == 'GET' and len(parts) == 2:
+            return 200, delivery, {}
+        if method == 'POST' and parts[2:] == ['send']:
+            if delivery['state'] != DELIVERY_STATE_NEW and params.get('force') != 'true':
+                return 400, {'detail': 'Delivery already sent.'}, {}
+            delivery['state'] = DELIVERY_STATE_NOTIFIED
+            delivery['delivery_email_text'] = 'You have a delivery.'
+            return 200, delivery, {}
+        return 404, {'detail': 'Not found.'}, {}
+
+    def _find_delivery(self, delivery_id):
+        for delivery in self.deliveries:
+            if str(delivery['id']) == delivery_id:
+                return delivery
+        return None
+
+
+def _filter(items, params, fields):
+    matches = items
+    for field in fields:
+        if field in params:
+            matches = [item for item in matches if str(item[field]) == params[field]]
+    return matches
+
+
+def _route_name(route):
+    """
+    Replace ids in a route so requests for different objects are counted together (s3-deliveries/{id}/send/).
+    """
+    parts = ['{id}' if part.isdigit() else part for part in route.split('/')]
+    return '/'.join(parts)
+
+
+class _MockD4S2RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately so Nagle's algorithm would add delayed ACK waits to each response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._respond('GET', None)
+
+    def do_POST(self):
+        content_length = int(self.headers.get('content-length', 0))
+        body = json.loads(self.rfile.read(content_length).decode('utf-8') or 'null')
+        self._respond('POST', body)
+
+    def _respond(self, method, body):
+        authorization = self.headers.get('Authorization', '')
+        token = authorization[len('Token '):] if authorization.startswith('Token ') else None
+        status, data, headers = self.server.mock.handle(method, self.path, token, body,
+                                                        self.headers.get('If-None-Match'))
+        content = json.dumps(data).encode('utf-8') if status != 304 else b''
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
@@ -0,0 +1,35 @@
+from __future__ import absolute_import
+import sys
+import threading
+import six
+
+
+def run_in_parallel(*funcs):
+    """
+    Call each function at the same time, the last one in the current thread and the others in new threads.
+    If any function raises an exception the exception from the first such function is re-raised
+    after all functions have finished.
+    :param funcs: functions taking no arguments
+    :return: list: return values in the same order as funcs
+    """
+    results = [None] * len(funcs)
+    errors = [None] * len(funcs)
+
+    def run(idx):
+        try:
+            results[idx] = funcs[idx]()
+        except Exception:
+            errors[idx] = sys.exc_info()
+
+    threads = [threading.Thread(target=run, args=(idx,)) for idx in range(len(funcs) - 1)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    if funcs:
+        run(len(funcs) - 1)
+    for thread in threads:
+        thread.join()
+    for error in errors:
+        if error:
+            six.reraise(*error)
+    return results
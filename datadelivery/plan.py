@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+from collections import OrderedDict
+from datadelivery.batch import DeliveryResult, DEFAULT_NUM_WORKERS
+from datadelivery.recipients import RecipientLookup
+from datadelivery.s3 import NotFoundException, S3Exception
+
+# current endpoint, current user and current s3 user
+IDENTITY_REQUEST_COUNT = 3
+# requests made by a separate deliver command: identity, recipient, bucket, create delivery and send
+DELIVER_REQUEST_COUNT = IDENTITY_REQUEST_COUNT + 4
+
+
+class DeliveryPlan(object):
+    def __init__(self, rows):
+        """
+        Deduplicated api calls needed to deliver every row of a manifest.
+        Each recipient email is looked up once and each bucket is found or created once,
+        only creating and sending a delivery is done per row.
+        :param rows: [ManifestRow]: deliveries to perform
+        """
+        self.rows = rows
+        self.emails = list(OrderedDict.fromkeys(row.email for row in rows))
+        self.bucket_names = list(OrderedDict.fromkeys(row.bucket_name for row in rows))
+
+    @property
+    def min_request_count(self):
+        """
+        Requests made when every bucket already exists.
+        """
+        return IDENTITY_REQUEST_COUNT + len(self.emails) + len(self.bucket_names) + 2 * len(self.rows)
+
+    @property
+    def max_request_count(self):
+        """
+        Requests made when every bucket has to be created.
+        """
+        return self.min_request_count + len(self.bucket_names)
+
+    @property
+    def naive_request_count(self):
+        """
+        Requests made by running a separate deliver command for each row.
+        """
+        return DELIVER_REQUEST_COUNT * len(self.rows)
+
+    def format(self):
+        """
+        Create a plain text description of the requests the plan will make.
+        :return: str: plan text
+        """
+        lines = ['Identity lookups: {}'.format(IDENTITY_REQUEST_COUNT),
+                 '  GET s3-endpoints/, GET users/current-user/, GET s3-users/',
+                 'Recipient lookups: {}'.format(len(self.emails))]
+        lines.extend('  GET s3-users/ email={}'.format(email) for email in self.emails)
+        lines.append('Bucket lookups: {}'.format(len(self.bucket_names)))
+        lines.extend('  GET s3-buckets/ name={} (POST s3-buckets/ if missing)'.format(bucket_name)
+                     for bucket_name in self.bucket_names)
+        lines.append('Deliveries: {}'.format(len(self.rows)))
+        for row in self.rows:
+            lines.append('  row {}: POST s3-deliveries/ {} -> {}, POST s3-deliveries/{{id}}/send/{}'.format(
+                row.row_num, row.bucket_name, row.email, ' (force)' if row.resend else ''))
+        lines.append('Total requests: {} - {} (separate deliver commands: {})'.format(
+            self.min_request_count, self.max_request_count, self.naive_request_count))
+        return '\n'.join(lines)
+
+    def execute(self, s3, num_workers=DEFAULT_NUM_WORKERS):
+        """
+        Perform the plan: look up recipients and find or create buckets, then create and send each delivery.
+        A row fails if its recipient or bucket could not be resolved, this does not stop the other rows.
+        :param s3: S3: client used for every request
+        :param num_workers: int: number of requests to run at the same time
+        :return: [DeliveryResult]: results in the same order as rows
+        """
+        from multiprocessing.pool import ThreadPool
+        recipients = RecipientLookup(s3)
+        pool = ThreadPool(num_workers)
+        try:
+            recipients.prefetch(self.emails, num_workers)
+            buckets = dict(zip(self.bucket_names, pool.map(lambda name: _resolve_bucket(s3, name), self.bucket_names)))
+            return pool.map(lambda row: self._deliver_row(s3, recipients, buckets[row.bucket_name], row), self.rows)
+        finally:
+            pool.close()
+            pool.join()
+
+    @staticmethod
+    def _deliver_row(s3, recipients, bucket_or_error, row):
+        try:
+            if isinstance(bucket_or_error, Exception):
+                raise bucket_or_error
+            user_message = row.read_user_message()
+            s3 = s3.with_deadline()
+            to_s3user = recipients.get_s3user_by_email(row.email, s3)
+            delivery = s3.create_delivery(bucket_or_error, to_s3user, user_message)
+            return DeliveryResult(row, delivery=s3.send_delivery(delivery, row.resend))
+        except (S3Exception, NotFoundException, IOError) as ex:
+            return DeliveryResult(row, error=ex)
+
+
+def _resolve_bucket(s3, bucket_name):
+    """
+    Find or create the bucket, returning the error instead of raising it so one failure does not stop the others.
+    """
+    s3 = s3.with_deadline()
+    try:
+        try:
+            return s3.get_bucket_by_name(bucket_name)
+        except NotFoundException:
+            return s3.create_bucket(bucket_name)
+    except (S3Exception, NotFoundException) as ex:
+        return ex
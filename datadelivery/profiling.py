@@ -0,0 +1,105 @@
+from __future__ import print_function, absolute_import
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+DEFAULT_PROFILE_PREFIX = 'datadelivery-profile'
+DEFAULT_SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 25
+
+
+class StackSampler(object):
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        """
+        Records the stack of every thread each interval seconds. Unlike cProfile, which only sees the thread
+        that enabled it, this includes worker threads and time spent waiting on the network.
+        :param interval: float: seconds between samples
+        """
+        self.interval = interval
+        self.counts = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='StackSampler')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        own_thread_id = threading.current_thread().ident
+        while not self._stop_event.wait(self.interval):
+            thread_names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_thread_id:
+                    self.sample(thread_names.get(thread_id, str(thread_id)), frame)
+
+    def sample(self, thread_name, frame):
+        """
+        Count one sample of the stack ending at frame.
+        :param thread_name: str: name of the thread, used as the root of the stack
+        :param frame: frame: innermost frame of the thread
+        """
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        names.append(thread_name)
+        stack = ';'.join(reversed(names))
+        self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    def write_collapsed(self, stream):
+        """
+        Write one 'frame;frame;frame count' line per distinct stack, the input format of flamegraph.pl,
+        speedscope and inferno.
+        :param stream: file to write to
+        """
+        for stack, count in sorted(self.counts.items()):
+            stream.write('{} {}\n'.format(stack, count))
+
+
+@contextmanager
+def profiling(filename_prefix, summary_stream=None):
+    """
+    Profile the code run within this context. On exit writes filename_prefix.pstats with cProfile statistics
+    of the current thread, filename_prefix.collapsed with sampled stacks of every thread and prints the
+    functions with the most cumulative time.
+    :param filename_prefix: str: path of the files to write without extension
+    :param summary_stream: file to print the summary to, defaults to stderr
+    """
+    import cProfile
+    profile = cProfile.Profile()
+    sampler = StackSampler().start()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        sampler.stop()
+        write_profile(profile, sampler, filename_prefix, summary_stream or sys.stderr)
+
+
+def write_profile(profile, sampler, filename_prefix, summary_stream):
+    """
+    Write the pstats and collapsed stack files and print a summary of the top functions.
+    :param profile: cProfile.Profile: disabled profile
+    :param sampler: StackSampler: stopped sampler
+    :param filename_prefix: str: path of the files to write without extension
+    :param summary_stream: file to print the summary to
+    """
+    import pstats
+    pstats_filename = filename_prefix + '.pstats'
+    collapsed_filename = filename_prefix + '.collapsed'
+    profile.dump_stats(pstats_filename)
+    with open(collapsed_filename, 'w') as outfile:
+        sampler.write_collapsed(outfile)
+    print("Top {} functions by cumulative time in the main thread:".format(TOP_FUNCTIONS), file=summary_stream)
+    pstats.Stats(profile, stream=summary_stream).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    print("Wrote {} (python -m pstats) and {} (flamegraph.pl, speedscope)".format(
+        pstats_filename, collapsed_filename), file=summary_stream)
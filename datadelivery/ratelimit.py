@@ -0,0 +1,90 @@
+from __future__ import absolute_import
+import json
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # windows: only requests within this process are limited
+
+
+class RateLimiter(object):
+    def __init__(self, rate, burst=None, state_filename=None):
+        """
+        Token bucket limiting how fast requests are sent. When state_filename is given the bucket is kept in that
+        file and locked while it is updated, so every process on the host using the same file shares one limit.
+        A request that finds the bucket empty reserves the next token and waits for it, so waiting requests
+        are spread out at the limit instead of all retrying at once.
+        :param rate: float: requests per second allowed on average
+        :param burst: float: requests allowed at once after being idle, defaults to one second worth of requests
+        :param state_filename: str: path to the shared state file, None to only limit this process
+        """
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self.state_filename = state_filename
+        self._lock = threading.Lock()
+        self._state = None
+
+    def acquire(self):
+        """
+        Wait until a request may be sent.
+        :return: float: seconds waited
+        """
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def reserve(self):
+        """
+        Take a token from the bucket.
+        :return: float: seconds to wait before the request may be sent
+        """
+        with self._lock:
+            if self.state_filename and fcntl:
+                return self._reserve_shared()
+            self._state = self._take_token(self._state)
+            return self._get_delay(self._state)
+
+    def _reserve_shared(self):
+        with open(self.state_filename, 'a+') as stream:
+            fcntl.flock(stream.fileno(), fcntl.LOCK_EX)
+            try:
+                stream.seek(0)
+                state = self._take_token(_parse_state(stream.read()))
+                stream.seek(0)
+                stream.truncate()
+                stream.write(json.dumps(state))
+                stream.flush()
+            finally:
+                fcntl.flock(stream.fileno(), fcntl.LOCK_UN)
+        return self._get_delay(state)
+
+    def _take_token(self, state):
+        """
+        Refill the bucket for the time since it was last updated and take one token.
+        Tokens go negative when requests are waiting for their turn.
+        :param state: dict: tokens and updated time or None for a full bucket
+        :return: dict: new state
+        """
+        now = time.time()
+        if state is None:
+            tokens = self.burst
+        else:
+            elapsed = max(0.0, now - state['updated'])
+            tokens = min(self.burst, state['tokens'] + elapsed * self.rate)
+        return {'tokens': tokens - 1, 'updated': now}
+
+    def _get_delay(self, state):
+        if state['tokens'] >= 0:
+            return 0.0
+        return -state['tokens'] / self.rate
+
+
+def _parse_state(contents):
+    try:
+        state = json.loads(contents)
+        return {'tokens': float(state['tokens']), 'updated': float(state['updated'])}
+    except (ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,140 @@
+from __future__ import absolute_import
+import threading
+import time
+from collections import OrderedDict
+from datadelivery.s3 import NotFoundException
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_TTL = 5 * 60
+DEFAULT_NEGATIVE_TTL = 60
+DEFAULT_PREFETCH_WORKERS = 4
+
+
+class RecipientLookup(object):
+    def __init__(self, s3, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        """
+        Remembers recipient s3 users by email so repeated lookups do not each cost a request.
+        Concurrent lookups of the same email share a single request, found users are kept for ttl seconds
+        and unknown emails for negative_ttl seconds in a cache holding at most max_size emails.
+        :param s3: S3: client used to look up emails that are not cached
+        :param max_size: int: number of emails to remember, the least recently used are forgotten first
+        :param ttl: float: seconds to remember a found s3 user
+        :param negative_ttl: float: seconds to remember that an email has no s3 user, 0 disables
+        """
+        self.s3 = s3
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get_s3user_by_email(self, email, s3=None):
+        """
+        Return the s3 user for email from the cache or fetch it, see S3.get_s3user_by_email.
+        :param email: str: email address of user to fetch
+        :param s3: S3: client to fetch with when this call sends the request, defaults to the lookup's client
+        :return: S3User or NotFoundException
+        """
+        with self._lock:
+            entry = self._get_entry(email)
+            pending = None
+            if entry is None:
+                pending = self._pending.get(email)
+                if pending is None:
+                    pending = _PendingLookup()
+                    self._pending[email] = pending
+                    leader = True
+                else:
+                    leader = False
+        if entry is not None:
+            return entry.result()
+        if leader:
+            self._fetch(email, pending, s3 or self.s3)
+        else:
+            pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.s3user
+
+    def prefetch(self, emails, num_workers=DEFAULT_PREFETCH_WORKERS):
+        """
+        Look up all distinct emails that are not cached. The s3-users api filters on a single email
+        so the lookups are sent at the same time over the pooled session instead of as one query.
+        Unknown emails are remembered, other errors are left for the next get_s3user_by_email to raise.
+        :param emails: [str]: email addresses to look up
+        :param num_workers: int: number of lookups to send at the same time
+        """
+        with self._lock:
+            missing = [email for email in OrderedDict.fromkeys(emails) if self._get_entry(email) is None]
+        if not missing:
+            return
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(num_workers, len(missing)))
+        try:
+            pool.map(self._prefetch_email, missing)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _prefetch_email(self, email):
+        try:
+            self.get_s3user_by_email(email)
+        except Exception:
+            pass  # errors are raised again when the email is used
+
+    def _fetch(self, email, pending, s3):
+        try:
+            pending.s3user = s3.get_s3user_by_email(email)
+            self._store(email, _CacheEntry(pending.s3user, None, self.ttl))
+        except NotFoundException as ex:
+            pending.error = ex
+            if self.negative_ttl:
+                self._store(email, _CacheEntry(None, str(ex), self.negative_ttl))
+        except Exception as ex:
+            pending.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._pending[email]
+            pending.done.set()
+
+    def _get_entry(self, email):
+        # caller must hold _lock
+        entry = self._entries.pop(email, None)
+        if entry is None or entry.expired():
+            return None
+        self._entries[email] = entry
+        return entry
+
+    def _store(self, email, entry):
+        with self._lock:
+            self._entries.pop(email, None)
+            self._entries[email] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class _PendingLookup(object):
+    def __init__(self):
+        """
+        Lookup in progress that other threads asking for the same email wait on.
+        """
+        self.done = threading.Event()
+        self.s3user = None
+        self.error = None
+
+
+class _CacheEntry(object):
+    def __init__(self, s3user, not_found_message, ttl):
+        self.s3user = s3user
+        self.not_found_message = not_found_message
+        self.expires_at = time.time() + ttl
+
+    def expired(self):
+        return time.time() >= self.expires_at
+
+    def result(self):
+        if self.s3user is None:
+            raise NotFoundException(self.not_found_message)
+        return self.s3user
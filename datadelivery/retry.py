@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+import email.utils
+import random
+import threading
+import time
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF_BASE = 0.5
+MAX_BACKOFF = 30.0
+MAX_RETRY_AFTER = 120.0
+RETRY_STATUS_CODES = [429, 502, 503, 504]
+DEFAULT_BUDGET_RATIO = 0.2
+DEFAULT_BUDGET_MIN_RETRIES = 10
+
+
+class RetryPolicy(object):
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, backoff_base=DEFAULT_BACKOFF_BASE, budget=None):
+        """
+        Decides if and when a failed request should be tried again.
+        Waits use exponential backoff with full jitter unless the server sends a Retry-After header.
+        :param max_attempts: int: total number of attempts for a single request including the first
+        :param backoff_base: float: seconds to wait (before jitter) after the first failed attempt
+        :param budget: RetryBudget: limits retries across all requests, a default budget is created when None
+        """
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.budget = budget or RetryBudget()
+
+    def record_request(self):
+        """
+        Record that a new request (not a retry) is being made.
+        """
+        self.budget.record_request()
+
+    def get_retry_delay(self, attempt, retry_safe, response=None):
+        """
+        Determine how long to wait before retrying a failed attempt.
+        Passing response=None means the request failed to connect.
+        :param attempt: int: 1 based number of the attempt that failed
+        :param retry_safe: bool: can this request be sent again without side effects
+        :param response: requests.Response: response received or None
+        :return: float: seconds to wait before retrying or None if the request should not be retried
+        """
+        if response is not None and response.status_code not in RETRY_STATUS_CODES:
+            return None
+        if not retry_safe or attempt >= self.max_attempts:
+            return None
+        delay = self._get_backoff(attempt)
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                if retry_after > MAX_RETRY_AFTER:
+                    return None
+                delay = retry_after
+        if not self.budget.try_spend():
+            return None
+        return delay
+
+    def _get_backoff(self, attempt):
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff_base * (2 ** (attempt - 1))))
+
+    @staticmethod
+    def sleep(seconds):
+        time.sleep(seconds)
+
+
+class RetryBudget(object):
+    def __init__(self, ratio=DEFAULT_BUDGET_RATIO, min_retries=DEFAULT_BUDGET_MIN_RETRIES):
+        """
+        Limits retries to a fraction of the requests made so an outage doesn't multiply the load on the server.
+        :param ratio: float: retries allowed per request made
+        :param min_retries: int: retries always allowed regardless of the number of requests
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_spend(self):
+        """
+        Use one retry from the budget if one is available.
+        :return: bool: True if the retry is allowed
+        """
+        with self._lock:
+            if self.retries >= self.min_retries + self.ratio * self.requests:
+                return False
+            self.retries += 1
+            return True
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header that contains either a number of seconds or an HTTP date.
+    :param value: str: header value or None
+    :return: float: seconds to wait or None if value is missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = email.utils.parsedate_tz(value)
+    if not parsed:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
@@ -1,15 +1,151 @@
-import requests
+import copy
+import threading
+from contextlib import contextmanager
+from six.moves.urllib.parse import urlencode, urlsplit
+from datadelivery.deadline import Deadline
+from datadelivery.parallel import run_in_parallel
+from datadelivery.retry import RetryPolicy
+
+# requests is slow to import so it is only imported once an S3 client is created, see _import_requests
+requests = None
 
 
 CONTENT_TYPE = 'application/json'
+DEFAULT_PAGE_SIZE = 100
+DELIVERY_STATE_NEW = 0
+# status of the response to sending a delivery that was already sent without force
+ALREADY_SENT_STATUS_CODE = 400
+INVALIDATE_IDENTITY_STATUS_CODES = [401]
+# requests that use the cached endpoint or s3 user, a 404 response means the cached ids may be stale
+IDENTITY_REQUESTS = [
+    ('GET', 's3-endpoints/'),
+    ('GET', 'users/current-user/'),
+    ('GET', 's3-users/'),
+    ('POST', 's3-buckets/'),
+    ('POST', 's3-deliveries/'),
+]
 
 
 class S3(object):
-    def __init__(self, config, user_agent_str):
+    def __init__(self, config, user_agent_str, session=None, identity_cache=None, retry_policy=None,
+                 rate_limiter=None, http_cache=None):
+        """
+        Create client for the D4S2 s3 api.
+        :param config: Config: settings for url, token, endpoint and connection pool
+        :param user_agent_str: str: value sent in the user-agent header
+        :param session: requests.Session: optional session to share, by default a pooled session is created
+        :param identity_cache: IdentityCache: optional cache of current endpoint and s3 user between runs
+        :param retry_policy: RetryPolicy: decides when failed requests are retried, by default built from config
+        :param rate_limiter: RateLimiter: optional limit on how fast requests (including retries) are sent
+        :param http_cache: HttpCache: optional cache of GET responses that are revalidated with the server
+        """
+        _import_requests()
         self.config = config
         self.user_agent_str = user_agent_str
-        self.current_endpoint = self._get_current_endpoint()
-        self.current_s3user = self._get_current_s3user()
+        self.session = session or self._create_session(config)
+        self.identity_cache = identity_cache
+        self.retry_policy = retry_policy or RetryPolicy(config.retry_max_attempts, config.retry_backoff)
+        self.rate_limiter = rate_limiter
+        self.http_cache = http_cache
+        self.deadline = Deadline()
+        self.request_hooks = []
+        self._identity = _CurrentIdentity()
+
+    def with_deadline(self, seconds=None):
+        """
+        Return a copy of this client whose requests must all finish within seconds.
+        The copy shares the session and current endpoint/s3 user with this client.
+        :param seconds: float: seconds allowed, defaults to config.deliver_deadline (None means no deadline)
+        :return: S3
+        """
+        if seconds is None:
+            seconds = self.config.deliver_deadline
+        s3 = copy.copy(self)
+        s3.deadline = Deadline(seconds)
+        return s3
+
+    def with_new_session(self):
+        """
+        Return a copy of this client with its own connection pool, for use by another thread.
+        The copy shares the current endpoint/s3 user, caches, rate limiter and request hooks with this client.
+        :return: S3
+        """
+        return self.with_session(self._create_session(self.config))
+
+    def with_session(self, session):
+        """
+        Return a copy of this client that sends requests using session, keeping the deadline of this client.
+        :param session: requests.Session: session the copy should use
+        :return: S3
+        """
+        s3 = copy.copy(self)
+        s3.session = session
+        return s3
+
+    @property
+    def current_endpoint(self):
+        """
+        S3Endpoint matching config.endpoint_name, fetched on first use.
+        """
+        identity = self._identity
+        if identity.endpoint is None:
+            with identity.endpoint_lock:
+                if identity.endpoint is None:
+                    identity.endpoint = self._get_cached_identity('endpoint', S3Endpoint, self._get_current_endpoint)
+        return identity.endpoint
+
+    @property
+    def current_s3user(self):
+        """
+        S3User for the current user at current_endpoint, fetched on first use.
+        """
+        identity = self._identity
+        if identity.s3user is None:
+            with identity.s3user_lock:
+                if identity.s3user is None:
+                    identity.s3user = self._get_cached_identity('s3user', S3User, self._get_current_s3user)
+        return identity.s3user
+
+    def _identity_cache_key(self):
+        return self.identity_cache.make_key(self.config.url, self.config.endpoint_name, self.config.token)
+
+    def _get_cached_identity(self, name, constructor, fetch_func):
+        """
+        Return the identity saved in identity_cache under name or call fetch_func and save the result.
+        :param name: str: name of the identity in the cache
+        :param constructor: class used to create the identity from cached data
+        :param fetch_func: function that fetches the identity from the api
+        :return: object created by constructor or returned by fetch_func
+        """
+        if not self.identity_cache:
+            return fetch_func()
+        key = self._identity_cache_key()
+        data = self.identity_cache.get(key, name)
+        if data:
+            return constructor(data)
+        identity = fetch_func()
+        self.identity_cache.put(key, name, vars(identity))
+        return identity
+
+    @staticmethod
+    def _create_session(config):
+        """
+        Create a session that keeps connections alive and reuses them across requests.
+        :param config: Config: determines the size of the connection pool
+        :return: requests.Session
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=config.http_pool_size,
+                                                pool_maxsize=config.http_pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        """
+        Release the pooled connections held by this client.
+        """
+        self.session.close()
 
     def _build_url(self, url_suffix):
         return '{}{}'.format(self.config.url, url_suffix)
@@ -21,29 +157,190 @@ class S3(object):
             'content-type': CONTENT_TYPE,
         }
 
-    def _get_request(self, url_suffix):
-        url = self._build_url(url_suffix)
+    def _get_request(self, url_suffix, use_cache=True):
+        """
+        GET url_suffix returning the response JSON. With an http_cache the saved response is revalidated
+        using its ETag/Last-Modified and returned without transferring the body when the server responds 304.
+        :param url_suffix: str: path relative to config.url
+        :param use_cache: bool: set to False to bypass http_cache for this request
+        :return: response JSON
+        """
+        if not self.http_cache or not use_cache:
+            return self._conditional_get(url_suffix).json()
+        cache_key = self.http_cache.make_key(self._build_url(url_suffix), self.config.token)
+        cached = self.http_cache.get(cache_key) or {}
+        response = self._conditional_get(url_suffix, cached.get('etag'), cached.get('last_modified'))
+        if response.status_code == 304:
+            return cached['data']
+        data = response.json()
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.http_cache.put(cache_key, data, etag, last_modified)
+        return data
+
+    def _conditional_get(self, url_suffix, etag=None, last_modified=None):
+        """
+        GET url_suffix sending etag as If-None-Match and last_modified as If-Modified-Since so an unchanged
+        resource costs an empty 304 response.
+        :param url_suffix: str: path relative to config.url
+        :param etag: str: ETag from a previous response or None
+        :param last_modified: str: Last-Modified from a previous response or None
+        :return: requests.Response: 304 response when not modified otherwise a successful response
+        """
         headers = self._build_headers()
-        try:
-            response = requests.get(url, headers=headers)
-        except requests.exceptions.ConnectionError as ex:
-            raise S3Exception("Failed to connect to {}\n{}".format(self.config.url, ex))
-        self._check_response(response)
-        return response.json()
-
-    def _post_request(self, url_suffix, data):
-        url = self._build_url(url_suffix)
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = self._send_request('GET', self.session.get, True, url_suffix, headers=headers)
+        if response.status_code != 304 or not (etag or last_modified):
+            self._check_response(response, 'GET', url_suffix)
+        return response
+
+    def _get_pages(self, url_suffix, params, page_size=DEFAULT_PAGE_SIZE, use_cache=False):
+        """
+        Generator yielding the items of a list endpoint one page at a time, following the 'next' link of
+        paginated responses. Responses that are a plain list are treated as a single page.
+        :param url_suffix: str: path relative to config.url
+        :param params: dict: filters to send as query parameters, None values are left out
+        :param page_size: int: number of items to request per page
+        :param use_cache: bool: save and revalidate pages with http_cache, off by default since long listings
+        would write every page to disk
+        """
+        query = dict((key, value) for key, value in params.items() if value is not None)
+        query['page_size'] = page_size
+        list_url_suffix = url_suffix
+        url_suffix = '{}?{}'.format(list_url_suffix, urlencode(sorted(query.items())))
+        while url_suffix:
+            data = self._get_request(url_suffix, use_cache)
+            if isinstance(data, list):
+                for item in data:
+                    yield item
+                return
+            for item in data['results']:
+                yield item
+            url_suffix = self._make_url_suffix(data.get('next'), list_url_suffix)
+
+    def _make_url_suffix(self, url, list_url_suffix):
+        """
+        Convert the next page link of a paginated response to a path relative to config.url.
+        A link outside config.url (ie. http:// built behind a TLS proxy or another host) is not followed since
+        the token would be sent there, only its query string is reused with list_url_suffix.
+        :param url: str: next link from the response or None
+        :param list_url_suffix: str: path of the list endpoint relative to config.url
+        :return: str: path relative to config.url or None when there is no next page
+        """
+        if not url:
+            return None
+        if url.startswith(self.config.url):
+            return url[len(self.config.url):]
+        query = urlsplit(url).query
+        return '{}?{}'.format(list_url_suffix, query) if query else list_url_suffix
+
+    def _post_request(self, url_suffix, data, retry_safe=False):
+        """
+        Post data to the api, POSTs are only retried when retry_safe is True.
+        :param url_suffix: str: path relative to config.url
+        :param data: dict: JSON payload to send
+        :param retry_safe: bool: can this request be sent again without creating duplicates
+        :return: response JSON
+        """
         headers = self._build_headers()
-        response = requests.post(url, headers=headers, json=data)
-        self._check_response(response)
+        response = self._send_request('POST', self.session.post, retry_safe, url_suffix, headers=headers, json=data)
+        self._check_response(response, 'POST', url_suffix)
         return response.json()
 
-    @staticmethod
-    def _check_response(response):
+    def add_request_hook(self, hook):
+        """
+        Register an object to be notified about every HTTP request this client (and its copies) sends.
+        Before each attempt hook.request_started(method, url_suffix, retry) is called where retry is 0 for the
+        first attempt, its return value is passed to hook.request_finished(context, response, error) afterwards.
+        When no hooks are registered requests pay no tracing overhead.
+        :param hook: object with request_started and request_finished methods
+        """
+        self.request_hooks.append(hook)
+
+    def _send_request(self, method, send_func, retry_safe, url_suffix, attempts=None, **kwargs):
+        """
+        Call send_func retrying connection errors, timeouts and retryable responses as allowed by retry_policy.
+        Each attempt waits for rate_limiter and uses the connect and read timeouts from config shortened to fit
+        within deadline. Other errors from requests are raised as S3Exception without retrying.
+        :param method: str: HTTP method send_func uses, passed to request hooks
+        :param send_func: function: session method to call
+        :param retry_safe: bool: can this request be sent again without side effects
+        :param url_suffix: str: path relative to config.url
+        :param attempts: list: when given the 1 based number of each attempt is appended as it is sent
+        :param kwargs: additional arguments for send_func
+        :return: requests.Response: the last response received
+        """
+        url = self._build_url(url_suffix)
+        self.retry_policy.record_request()
+        attempt = 1
+        while True:
+            if attempts is not None:
+                attempts.append(attempt)
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            timeout = self._get_timeout(url)
+            hook_contexts = None
+            if self.request_hooks:
+                hook_contexts = [hook.request_started(method, url_suffix, attempt - 1) for hook in self.request_hooks]
+            try:
+                response = send_func(url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+                if hook_contexts:
+                    self._finish_request_hooks(hook_contexts, None, ex)
+                delay = self._get_retry_delay(attempt, retry_safe)
+                if delay is None:
+                    if isinstance(ex, requests.exceptions.Timeout):
+                        raise S3Exception("Request to {} timed out\n{}".format(url, ex))
+                    raise S3Exception("Failed to connect to {}\n{}".format(self.config.url, ex))
+            except BaseException as ex:
+                # hooks such as AdaptiveConcurrency must see every attempt finish or they wait forever
+                if hook_contexts:
+                    self._finish_request_hooks(hook_contexts, None, ex)
+                if isinstance(ex, requests.exceptions.RequestException):
+                    raise S3Exception("Request to {} failed\n{}".format(url, ex))
+                raise
+            else:
+                if hook_contexts:
+                    self._finish_request_hooks(hook_contexts, response, None)
+                delay = self._get_retry_delay(attempt, retry_safe, response)
+                if delay is None:
+                    return response
+            self.retry_policy.sleep(delay)
+            attempt += 1
+
+    def _finish_request_hooks(self, hook_contexts, response, error):
+        for hook, context in zip(self.request_hooks, hook_contexts):
+            hook.request_finished(context, response, error)
+
+    def _get_timeout(self, url):
+        """
+        Return (connect, read) timeouts for the next attempt limited by deadline.
+        The read timeout applies to each socket read so a slowly streamed response can still overrun the deadline.
+        :param url: str: url of the request, used in the error message when the deadline has passed
+        :return: (float, float): connect and read timeouts in seconds
+        """
+        if self.deadline.expired():
+            raise DeadlineExceededException("Deadline exceeded before sending request to {}".format(url))
+        return (self.deadline.limit_timeout(self.config.connect_timeout),
+                self.deadline.limit_timeout(self.config.read_timeout))
+
+    def _get_retry_delay(self, attempt, retry_safe, response=None):
+        delay = self.retry_policy.get_retry_delay(attempt, retry_safe, response)
+        remaining = self.deadline.remaining()
+        if delay is not None and remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+    def _check_response(self, response, method, url_suffix):
         try:
             response.raise_for_status()
         except requests.HTTPError:
-            raise S3Exception(S3.make_message_for_http_error(response))
+            if self.identity_cache and should_invalidate_identity(method, url_suffix, response.status_code):
+                self.identity_cache.invalidate(self._identity_cache_key())
+            raise S3Exception(S3.make_message_for_http_error(response), response.status_code)
 
     @staticmethod
     def make_message_for_http_error(response):
@@ -66,54 +363,87 @@ class S3(object):
             return S3Endpoint(endpoint_response)
         raise NotFoundException("No endpoint found for s3 url: {}".format(self.config.url))
 
-    def get_current_user(self):
+    def get_current_user(self, use_cache=True):
         """
         Find the User that matches the current user under the endpoint
+        :param use_cache: bool: set to False to bypass http_cache
         :return: User
         """
-        return User(self._get_request('users/current-user/'))
+        return User(self._get_request('users/current-user/', use_cache))
 
     def _get_current_s3user(self):
-        user = self.get_current_user()
+        # the current user and endpoint lookups are independent so fetch them at the same time
+        _, user = run_in_parallel(lambda: self.current_endpoint, self.get_current_user)
         return self.get_s3user_by_user(user)
 
-    def get_s3user_by_user(self, user):
+    def get_s3user_by_user(self, user, use_cache=True):
         """
         Fetch s3 user that has the current endpoint and user
         :param endpoint: S3Endpoint: the s3 service are we using
         :param user: User: user who we want to find a S3User for
+        :param use_cache: bool: set to False to bypass http_cache
         :return: S3User or NotFoundException
         """
         url_suffix = 's3-users/?endpoint={}&user={}'.format(self.current_endpoint.id, user.id)
-        for endpoint_response in self._get_request(url_suffix):
+        for endpoint_response in self._get_request(url_suffix, use_cache):
             return S3User(endpoint_response)
         raise NotFoundException("No s3 user found for endpoint {} and user {}".format(
             self.current_endpoint.id, user.id))
 
-    def get_s3user_by_email(self, email):
+    def get_s3user_by_email(self, email, use_cache=True):
         """
         Fetch s3 user that has the current endpoint and email
         :param email: str: email address of user to fetch
+        :param use_cache: bool: set to False to bypass http_cache
         :return: S3User or NotFoundException
         """
         url_suffix = 's3-users/?endpoint={}&email={}'.format(self.current_endpoint.id, email)
-        for endpoint_response in self._get_request(url_suffix):
+        for endpoint_response in self._get_request(url_suffix, use_cache):
             return S3User(endpoint_response)
         raise NotFoundException("No s3 user found with email {} at endpoint {}".format(
             email, self.current_endpoint.id))
 
-    def get_bucket_by_name(self, bucket_name):
+    def get_bucket_by_name(self, bucket_name, use_cache=True):
         """
         Return S3Bucket or None if not found
         :param bucket_name: str: name of the bucket
+        :param use_cache: bool: set to False to bypass http_cache
         :return: S3Bucket
         """
         url_suffix = 's3-buckets/?name={}'.format(bucket_name)
-        items = self._get_request(url_suffix)
+        items = self._get_request(url_suffix, use_cache)
         if items:
             return S3Bucket(items[0])
         raise NotFoundException("No bucket found with name {}".format(bucket_name))
 
+    def iter_buckets(self, name=None, owner=None, page_size=DEFAULT_PAGE_SIZE, use_cache=False):
+        """
+        Generator yielding buckets a page at a time.
+        :param name: str: only include the bucket with this name
+        :param owner: int: only include buckets owned by this s3 user id
+        :param page_size: int: number of buckets to fetch per request
+        :param use_cache: bool: save and revalidate each page with http_cache
+        :return: S3Bucket generator
+        """
+        for item in self._get_pages('s3-buckets/', {'name': name, 'owner': owner}, page_size, use_cache):
+            yield S3Bucket(item)
+
+    def iter_deliveries(self, bucket=None, from_user=None, to_user=None, state=None, page_size=DEFAULT_PAGE_SIZE,
+                        use_cache=False):
+        """
+        Generator yielding deliveries a page at a time.
+        :param bucket: int: only include deliveries of this bucket id
+        :param from_user: int: only include deliveries sent by this s3 user id
+        :param to_user: int: only include deliveries sent to this s3 user id
+        :param state: int: only include deliveries in this state
+        :param page_size: int: number of deliveries to fetch per request
+        :param use_cache: bool: save and revalidate each page with http_cache
+        :return: S3Delivery generator
+        """
+        params = {'bucket': bucket, 'from_user': from_user, 'to_user': to_user, 'state': state}
+        for item in self._get_pages('s3-deliveries/', params, page_size, use_cache):
+            yield S3Delivery(item)
+
     def create_bucket(self, bucket_name):
         """
         Create bucket with specified params.
@@ -144,6 +474,18 @@ class S3(object):
         }
         return S3Delivery(self._post_request('s3-deliveries/', data=data))
 
+    def get_delivery(self, delivery_id, etag=None):
+        """
+        Fetch a delivery unless it is unchanged since the response that returned etag.
+        :param delivery_id: int: id of the delivery
+        :param etag: str: ETag returned by a previous call or None
+        :return: (S3Delivery, str): delivery or None if not modified, ETag to pass to the next call
+        """
+        response = self._conditional_get('s3-deliveries/{}/'.format(delivery_id), etag)
+        if response.status_code == 304:
+            return None, etag
+        return S3Delivery(response.json()), response.headers.get('ETag')
+
     def send_delivery(self, delivery, force=None):
         """
         Request the datadelivery service to process the delivery.
@@ -153,8 +495,93 @@ class S3(object):
         """
         url_suffix = 's3-deliveries/{}/send/'.format(delivery.id)
         if force:
-            url_suffix += "?force=true"
-        return S3Delivery(self._post_request(url_suffix, data={}))
+            return S3Delivery(self._post_request(url_suffix + "?force=true", data={}))
+        # sending again without force is rejected by the server instead of emailing the recipient twice
+        attempts = []
+        response = self._send_request('POST', self.session.post, True, url_suffix, attempts=attempts,
+                                      headers=self._build_headers(), json={})
+        if len(attempts) > 1 and response.status_code == ALREADY_SENT_STATUS_CODE:
+            # an earlier attempt whose response was lost may have sent it, so the retry was rejected as a resend
+            sent_delivery, _ = self.get_delivery(delivery.id)
+            if sent_delivery.state != DELIVERY_STATE_NEW:
+                return sent_delivery
+        self._check_response(response, 'POST', url_suffix)
+        return S3Delivery(response.json())
+
+
+class SessionPool(object):
+    def __init__(self, s3):
+        """
+        Sessions lent to one thread at a time so threads sending requests at the same time do not share a
+        requests.Session. Returned sessions keep their open connections for the next thread that borrows them.
+        :param s3: S3: client whose settings new sessions are created with
+        """
+        self.s3 = s3
+        self._free_sessions = []
+        self._lock = threading.Lock()
+
+    @property
+    def free_count(self):
+        with self._lock:
+            return len(self._free_sessions)
+
+    @contextmanager
+    def lend(self, count):
+        """
+        Lend count sessions that no other thread is using, they are returned to the pool on exit.
+        :param count: int: number of sessions needed
+        :return: [requests.Session]
+        """
+        with self._lock:
+            sessions = [self._free_sessions.pop() for _ in range(min(count, len(self._free_sessions)))]
+        while len(sessions) < count:
+            sessions.append(self.s3.with_new_session().session)
+        try:
+            yield sessions
+        finally:
+            with self._lock:
+                self._free_sessions.extend(sessions)
+
+    def close(self):
+        """
+        Close the sessions that are not currently lent.
+        """
+        with self._lock:
+            sessions = self._free_sessions
+            self._free_sessions = []
+        for session in sessions:
+            session.close()
+
+
+class _CurrentIdentity(object):
+    def __init__(self):
+        """
+        Current endpoint and s3 user shared between an S3 client and the copies made by with_deadline.
+        """
+        self.endpoint = None
+        self.s3user = None
+        self.endpoint_lock = threading.Lock()
+        self.s3user_lock = threading.Lock()
+
+
+def should_invalidate_identity(method, url_suffix, status_code):
+    """
+    Does an error response mean the cached endpoint and s3 user can no longer be trusted.
+    Only a 401 or a 404 from a request that uses the cached ids does, a missing delivery keeps the cache.
+    :param method: str: HTTP method of the request
+    :param url_suffix: str: path relative to config.url
+    :param status_code: int: HTTP status of the response
+    :return: bool
+    """
+    if status_code in INVALIDATE_IDENTITY_STATUS_CODES:
+        return True
+    return status_code == 404 and (method, url_suffix.split('?', 1)[0]) in IDENTITY_REQUESTS
+
+
+def _import_requests():
+    global requests
+    if requests is None:
+        import requests
 
 
 class User(object):
@@ -207,4 +634,14 @@ class NotFoundException(Exception):
 
 
 class S3Exception(Exception):
+    def __init__(self, message, status_code=None):
+        """
+        :param message: str: description of the error
+        :param status_code: int: HTTP status of the response that caused the error, None if there was no response
+        """
+        super(S3Exception, self).__init__(message)
+        self.status_code = status_code
+
+
+class DeadlineExceededException(S3Exception):
     pass
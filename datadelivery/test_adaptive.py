@@ -0,0 +1,88 @@
+from __future__ import absolute_import
+import threading
+from unittest import TestCase
+from mock import MagicMock, patch
+from datadelivery.adaptive import AdaptiveConcurrency
+
+
+class AdaptiveConcurrencyTestCase(TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = patch('datadelivery.adaptive.time')
+        self.mock_time = patcher.start()
+        self.mock_time.time.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def send(self, concurrency, latency=0.01, status_code=200, error=None):
+        context = concurrency.request_started('GET', 's3-users/', 0)
+        self.now += latency
+        response = None if error else MagicMock(status_code=status_code)
+        concurrency.request_finished(context, response, error)
+
+    def test_increases_after_healthy_window(self):
+        on_adjust = MagicMock()
+        concurrency = AdaptiveConcurrency(maximum=6, initial=4, window=5, on_adjust=on_adjust)
+        for _ in range(5):
+            self.send(concurrency)
+        self.assertEqual(concurrency.current_limit, 5)
+        on_adjust.assert_called_with(concurrency, 4, 'healthy, p95 latency 10ms')
+        for _ in range(20):
+            self.send(concurrency)
+        self.assertEqual(concurrency.current_limit, 6)
+
+    def test_decreases_on_overload_response(self):
+        concurrency = AdaptiveConcurrency(maximum=32, initial=8, window=5)
+        self.send(concurrency, status_code=429)
+        self.assertEqual(concurrency.current_limit, 4)
+        self.assertEqual(concurrency.adjustments, [(8, 4, '429 response')])
+        self.now += 1
+        self.send(concurrency, error=ValueError('reset'))
+        self.assertEqual(concurrency.current_limit, 2)
+        self.assertEqual(concurrency.adjustments[-1], (4, 2, 'error: ValueError'))
+
+    def test_client_errors_are_not_overload(self):
+        concurrency = AdaptiveConcurrency(maximum=32, initial=8, window=5)
+        self.send(concurrency, status_code=404)
+        self.assertEqual(concurrency.current_limit, 8)
+
+    def test_decreases_once_for_requests_sent_before_decrease(self):
+        concurrency = AdaptiveConcurrency(maximum=32, initial=8)
+        contexts = [concurrency.request_started('GET', 's3-users/', 0) for _ in range(3)]
+        self.now += 0.01
+        for context in contexts:
+            concurrency.request_finished(context, MagicMock(status_code=503), None)
+        self.assertEqual(concurrency.current_limit, 4)
+
+    def test_never_below_one(self):
+        concurrency = AdaptiveConcurrency(maximum=4, initial=1)
+        self.send(concurrency, status_code=503)
+        self.assertEqual(concurrency.current_limit, 1)
+        self.assertEqual(concurrency.adjustments, [])
+
+    def test_decreases_when_p95_latency_rises(self):
+        concurrency = AdaptiveConcurrency(maximum=32, initial=8, window=5)
+        for _ in range(5):
+            self.send(concurrency, latency=0.1)
+        self.assertEqual(concurrency.current_limit, 9)
+        for _ in range(5):
+            self.send(concurrency, latency=0.3)
+        self.assertEqual(concurrency.current_limit, 4)
+        self.assertEqual(concurrency.adjustments[-1], (9, 4, 'p95 latency 300ms over 200ms'))
+
+    def test_limits_requests_in_flight(self):
+        self.mock_time.time.side_effect = None
+        self.mock_time.time.return_value = 100.0
+        concurrency = AdaptiveConcurrency(maximum=4, initial=2)
+        contexts = [concurrency.request_started('GET', 's3-users/', 0) for _ in range(2)]
+        started = threading.Event()
+
+        def third_request():
+            concurrency.request_started('GET', 's3-users/', 0)
+            started.set()
+        thread = threading.Thread(target=third_request)
+        thread.start()
+        self.assertFalse(started.wait(0.1))
+        concurrency.request_finished(contexts[0], MagicMock(status_code=200), None)
+        self.assertTrue(started.wait(5))
+        thread.join()
+        self.assertEqual(concurrency.in_flight, 2)
@@ -0,0 +1,155 @@
+from __future__ import absolute_import
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+from unittest import TestCase, skipIf
+import requests
+from mock import MagicMock, patch
+from datadelivery.agent import DeliveryAgent, forward_command
+from datadelivery.commands import Commands
+from datadelivery.config import Config
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN
+from datadelivery.s3 import S3Exception, SessionPool
+
+
+@skipIf(not hasattr(socket, 'AF_UNIX'), "agent requires Unix sockets")
+class DeliveryAgentTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.socket_filename = os.path.join(self.temp_dir, 'agent.sock')
+        self.commands = MagicMock()
+        self.agent = None
+
+    def tearDown(self):
+        if self.agent:
+            self.agent.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def start_agent(self, commands):
+        self.agent = DeliveryAgent(commands, self.socket_filename).start()
+        thread = threading.Thread(target=self.agent.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def test_forward_command(self):
+        self.start_agent(self.commands)
+
+        self.assertTrue(forward_command(self.socket_filename, 'deliver', ['bucket1', 'bob@bob.com', 'Hi', False]))
+
+        self.commands.deliver.assert_called_with('bucket1', 'bob@bob.com', 'Hi', False)
+
+    def test_socket_is_only_accessible_by_owner(self):
+        self.start_agent(self.commands)
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_filename).st_mode), 0o600)
+
+    def test_forward_command_raises_agent_errors(self):
+        self.commands.deliver.side_effect = S3Exception('Not found', 404)
+        self.start_agent(self.commands)
+
+        with self.assertRaises(S3Exception) as raised:
+            forward_command(self.socket_filename, 'deliver', ['bucket1', 'bob@bob.com', '', False])
+
+        self.assertEqual(str(raised.exception), 'Not found')
+        self.assertEqual(raised.exception.status_code, 404)
+
+    def test_forward_unsupported_command(self):
+        self.start_agent(self.commands)
+
+        with self.assertRaises(S3Exception) as raised:
+            forward_command(self.socket_filename, 'serve', [])
+
+        self.assertEqual(str(raised.exception), 'Unsupported agent command: serve')
+        self.commands.serve.assert_not_called()
+
+    def test_forward_command_without_agent(self):
+        self.assertFalse(forward_command(self.socket_filename, 'deliver', []))
+
+    def test_forward_command_with_stale_socket(self):
+        DeliveryAgent(self.commands, self.socket_filename).start().server.server_close()
+        self.assertTrue(os.path.exists(self.socket_filename))
+
+        self.assertFalse(forward_command(self.socket_filename, 'deliver', []))
+
+        # a new agent replaces the stale socket
+        self.start_agent(self.commands)
+        self.assertTrue(forward_command(self.socket_filename, 'deliver', []))
+
+    def test_start_when_agent_already_running(self):
+        self.start_agent(self.commands)
+        with self.assertRaises(S3Exception):
+            DeliveryAgent(self.commands, self.socket_filename).start()
+
+    def create_serving_commands(self, mock_config_file, server):
+        """
+        Commands set up the way serve does with the current endpoint and user already looked up.
+        """
+        mock_config_file.return_value.delivery_index_filename = os.path.join(self.temp_dir, 'index.sqlite')
+        mock_config_file.return_value.read_or_create_config.return_value = Config({
+            'token': DEFAULT_TOKEN,
+            'url': server.url,
+            'identity_cache_ttl': 0,
+            'http_cache_size': 0,
+        })
+        agent_commands = Commands(version_str='1.0')
+        agent_commands.shared_s3 = agent_commands._create_s3()
+        agent_commands.session_pool = SessionPool(agent_commands.shared_s3)
+        self.addCleanup(agent_commands.session_pool.close)
+        agent_commands.shared_s3.current_s3user
+        return agent_commands
+
+    @patch('datadelivery.commands.ConfigFile')
+    def test_forwarded_deliver_uses_warm_client(self, mock_config_file):
+        server = MockD4S2Server().start()
+        self.addCleanup(server.stop)
+        server.add_recipient('bob@bob.com')
+        server.add_bucket('bucket1')
+        self.start_agent(self.create_serving_commands(mock_config_file, server))
+        server.reset_request_counts()
+
+        Commands(version_str='1.0', agent_socket_filename=self.socket_filename).deliver(
+            'bucket1', 'bob@bob.com', '', False)
+
+        # the endpoint and current user were looked up when the agent started
+        self.assertEqual(server.request_counts, {
+            'GET s3-users/': 1,
+            'GET s3-buckets/': 1,
+            'POST s3-deliveries/': 1,
+            'POST s3-deliveries/{id}/send/': 1,
+        })
+
+    @patch('datadelivery.commands.ConfigFile')
+    def test_concurrent_forwarded_delivers_do_not_share_sessions(self, mock_config_file):
+        server = MockD4S2Server(latency=0.05).start()
+        self.addCleanup(server.stop)
+        emails = [server.add_recipient('user{}@example.com'.format(idx))['email'] for idx in range(4)]
+        self.start_agent(self.create_serving_commands(mock_config_file, server))
+        lock = threading.Lock()
+        active_counts = {}
+        max_active_counts = {}
+        request = requests.Session.request
+
+        def record_request(session, *args, **kwargs):
+            with lock:
+                active_counts[id(session)] = active_counts.get(id(session), 0) + 1
+                max_active_counts[id(session)] = max(max_active_counts.get(id(session), 0), active_counts[id(session)])
+            try:
+                return request(session, *args, **kwargs)
+            finally:
+                with lock:
+                    active_counts[id(session)] -= 1
+
+        def forward_deliver(email):
+            forward_command(self.socket_filename, 'deliver', ['bucket-' + email, email, '', False])
+
+        with patch.object(requests.Session, 'request', record_request):
+            threads = [threading.Thread(target=forward_deliver, args=(email,)) for email in emails]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(server.deliveries), 4)
+        self.assertEqual(set(max_active_counts.values()), set([1]))
@@ -49,3 +49,134 @@ class ArgParserTestCase(TestCase):
         arg_parser.parse_and_run_commands(command_line_args.split(' '))
         target_object.deliver.assert_called_with('bucket1', 'joe@joe.com', '', True)
 
+    def test_deliver_many_command(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('deliver-many -m manifest.csv'.split(' '))
+        target_object.deliver_many.assert_called_with('manifest.csv', 4, None, None)
+
+    def test_deliver_many_command_workers(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('deliver-many --manifest manifest.yml --workers 8'.split(' '))
+        target_object.deliver_many.assert_called_with('manifest.yml', 8, None, None)
+
+    def test_deliver_many_command_journal(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('deliver-many -m manifest.csv --journal run.journal'.split(' '))
+        target_object.deliver_many.assert_called_with('manifest.csv', 4, 'run.journal', None)
+
+    def test_deliver_many_command_max_workers(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('deliver-many -m manifest.csv --max-workers 32'.split(' '))
+        target_object.deliver_many.assert_called_with('manifest.csv', 4, None, 32)
+
+    @patch('sys.stderr')
+    def test_workers_must_be_positive(self, mock_stderr):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        for command_line_args in ['deliver-many -m manifest.csv --workers 0',
+                                  'deliver-many -m manifest.csv --max-workers -2',
+                                  'plan -m manifest.csv --workers x']:
+            with self.assertRaises(SystemExit):
+                arg_parser.parse_and_run_commands(command_line_args.split(' '))
+        target_object.deliver_many.assert_not_called()
+        target_object.plan.assert_not_called()
+
+    def test_plan_command(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('plan -m manifest.csv'.split(' '))
+        target_object.plan.assert_called_with('manifest.csv', False, 4)
+
+    def test_plan_command_execute(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('plan -m manifest.csv --execute --workers 2'.split(' '))
+        target_object.plan.assert_called_with('manifest.csv', True, 2)
+
+    def test_list_buckets_command(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('list-buckets --owner 5'.split(' '))
+        target_object.list_buckets.assert_called_with(None, 5, 'table')
+
+    def test_list_deliveries_command(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('list-deliveries --bucket 3 --state 1 --format ndjson'.split(' '))
+        target_object.list_deliveries.assert_called_with(3, None, None, 1, 'ndjson')
+
+    def test_status_command(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('status -d 8 9'.split(' '))
+        target_object.status.assert_called_with([8, 9])
+
+    def test_watch_command(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('watch --delivery-id 8 --timeout 600'.split(' '))
+        target_object.watch.assert_called_with([8], 600.0)
+
+    @patch('datadelivery.profiling.profiling')
+    def test_profile_option(self, mock_profiling):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('--profile status -d 8'.split(' '))
+        mock_profiling.assert_called_with('datadelivery-profile')
+        target_object.status.assert_called_with([8])
+
+        arg_parser.parse_and_run_commands('--profile-prefix /tmp/slow-run status -d 8'.split(' '))
+        mock_profiling.assert_called_with('/tmp/slow-run')
+
+    @patch('datadelivery.profiling.profiling')
+    def test_no_profile_option(self, mock_profiling):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('status -d 8'.split(' '))
+        mock_profiling.assert_not_called()
+
+    def test_serve_command(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands(['serve'])
+        target_object.serve.assert_called_with()
+
+    def test_trace_prints_summary(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('--trace deliver -b bucket1 --email joe@joe.com'.split(' '))
+        target_object.tracing.assert_called_with('')
+        target_object.deliver.assert_called_with('bucket1', 'joe@joe.com', '', False)
+
+    def test_trace_file(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('--trace-file trace.ndjson deliver -b bucket1 --email joe@joe.com'.split(' '))
+        target_object.tracing.assert_called_with('trace.ndjson')
+
+    def test_no_trace(self):
+        target_object = MagicMock()
+
+        arg_parser = ArgParser('1.0', target_object)
+        arg_parser.parse_and_run_commands('deliver -b bucket1 --email joe@joe.com'.split(' '))
+        target_object.tracing.assert_not_called()
@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+from unittest import TestCase, skipIf
+from mock import MagicMock
+from datadelivery.config import Config
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN
+from datadelivery.s3 import NotFoundException, S3Exception
+
+try:
+    import asyncio
+    from datadelivery.async_s3 import AsyncS3, aiohttp
+except (ImportError, SyntaxError):
+    aiohttp = None
+
+
+@skipIf(aiohttp is None, 'requires python 3 and aiohttp')
+class AsyncS3TestCase(TestCase):
+    def setUp(self):
+        self.server = MockD4S2Server().start()
+        self.config = Config({'token': DEFAULT_TOKEN, 'url': self.server.url, 'retry_backoff': 0.01})
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.s3 = AsyncS3(self.config, user_agent_str='test')
+
+    def tearDown(self):
+        self.run_async(self.s3.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.server.stop()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_identity_is_fetched_once(self):
+        s3users = self.run_async(asyncio.gather(*[self.s3.get_current_s3user() for _ in range(5)]))
+        self.assertEqual(set(s3user.id for s3user in s3users), set([self.server.current_s3user['id']]))
+        self.assertEqual(self.server.request_counts, {
+            'GET s3-endpoints/': 1,
+            'GET users/current-user/': 1,
+            'GET s3-users/': 1,
+        })
+
+    def test_get_s3user_by_email(self):
+        recipient = self.server.add_recipient('bob@bob.com')
+        s3user = self.run_async(self.s3.get_s3user_by_email('bob@bob.com'))
+        self.assertEqual(s3user.id, recipient['id'])
+        with self.assertRaises(NotFoundException):
+            self.run_async(self.s3.get_s3user_by_email('tom@tom.com'))
+
+    def test_create_and_get_bucket(self):
+        with self.assertRaises(NotFoundException):
+            self.run_async(self.s3.get_bucket_by_name('mybucket'))
+        bucket = self.run_async(self.s3.create_bucket('mybucket'))
+        self.assertEqual(bucket.name, 'mybucket')
+        self.assertEqual(self.run_async(self.s3.get_bucket_by_name('mybucket')).id, bucket.id)
+
+    def test_send_delivery_retry_rejected_after_lost_response(self):
+        self.server.add_recipient('bob@bob.com')
+        handle = self.server.handle
+        lost = []
+
+        def gateway_timeout_after_send(method, path, *args):
+            response = handle(method, path, *args)
+            if path.endswith('/send/') and not lost:
+                # the delivery was sent but a proxy timed out waiting for the response
+                lost.append(path)
+                return 504, {'detail': 'Gateway timeout.'}, {}
+            return response
+        self.server.handle = gateway_timeout_after_send
+
+        delivery = self.run_async(self.s3.deliver('mybucket', 'bob@bob.com', 'Hi'))
+
+        self.assertEqual(len(lost), 1)
+        self.assertEqual(delivery.delivery_email_text, 'You have a delivery.')
+        self.assertEqual(self.server.request_counts['POST s3-deliveries/{id}/send/'], 2)
+
+    def test_create_bucket_error_uses_s3_error_message(self):
+        self.server.add_bucket('mybucket')
+        with self.assertRaises(S3Exception) as raised_exception:
+            self.run_async(self.s3.create_bucket('mybucket'))
+        self.assertIn('S3 bucket with this name already exists.', str(raised_exception.exception))
+
+    def test_create_and_send_delivery(self):
+        recipient = self.run_async(self.s3.get_s3user_by_email(self.server.add_recipient('bob@bob.com')['email']))
+        bucket = self.run_async(self.s3.create_bucket('mybucket'))
+        delivery = self.run_async(self.s3.create_delivery(bucket, recipient, 'Hey'))
+        self.assertEqual(delivery.state, 0)
+        sent_delivery = self.run_async(self.s3.send_delivery(delivery))
+        self.assertEqual(sent_delivery.state, 1)
+        with self.assertRaises(S3Exception):
+            self.run_async(self.s3.send_delivery(delivery))
+        self.assertEqual(self.run_async(self.s3.send_delivery(delivery, force=True)).state, 1)
+
+    def test_many_deliveries_share_identity_and_session(self):
+        emails = [self.server.add_recipient('user{}@example.com'.format(idx))['email'] for idx in range(20)]
+        deliveries = self.run_async(asyncio.gather(*[
+            self.s3.deliver('bucket{}'.format(idx), email, '') for idx, email in enumerate(emails)]))
+        self.assertEqual(len(set(delivery.id for delivery in deliveries)), 20)
+        self.assertEqual(self.server.request_counts['GET s3-endpoints/'], 1)
+        self.assertEqual(self.server.request_counts['POST s3-deliveries/{id}/send/'], 20)
+        self.assertEqual(self.s3.session.connector.limit, self.config.http_pool_size)
+
+    def test_retries_unavailable_responses(self):
+        self.server.error_rate = 1.0
+        with self.assertRaises(S3Exception):
+            self.run_async(self.s3.get_current_user())
+        self.assertEqual(self.server.request_counts, {'GET users/current-user/': 3})
+
+    def test_invalid_token_invalidates_identity_cache(self):
+        self.config.token = 'bad'
+        identity_cache = MagicMock()
+        s3 = AsyncS3(self.config, user_agent_str='test', identity_cache=identity_cache)
+        with self.assertRaises(S3Exception):
+            self.run_async(s3.get_current_user())
+        self.run_async(s3.close())
+        identity_cache.invalidate.assert_called_with(identity_cache.make_key.return_value)
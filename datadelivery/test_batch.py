@@ -0,0 +1,147 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import MagicMock, patch, call
+from datadelivery.batch import BatchDelivery, DeliveryResult, format_results_table
+from datadelivery.journal import DeliveryJournal
+from datadelivery.manifest import ManifestRow
+from datadelivery.s3 import S3Bucket, S3Delivery, NotFoundException, S3Exception
+
+
+class BatchDeliveryTestCase(TestCase):
+    def setUp(self):
+        self.s3 = MagicMock()
+        self.s3.with_deadline.return_value = self.s3
+        self.rows = [
+            ManifestRow(1, 'bucket1', 'joe@joe.com'),
+            ManifestRow(2, 'bucket2', 'bob@bob.com', resend=True),
+        ]
+
+    def test_run_delivers_each_row(self):
+        results = BatchDelivery(self.s3, num_workers=2).run(self.rows)
+
+        self.assertEqual([result.row for result in results], self.rows)
+        self.assertTrue(all(result.succeeded for result in results))
+        self.assertEqual(self.s3.with_deadline.call_count, 2)
+        self.assertEqual(results[0].delivery, self.s3.send_delivery.return_value)
+        self.s3.get_s3user_by_email.assert_has_calls([call('joe@joe.com'), call('bob@bob.com')], any_order=True)
+        self.s3.get_bucket_by_name.assert_has_calls([call('bucket1'), call('bucket2')], any_order=True)
+        self.s3.create_bucket.assert_not_called()
+        self.assertEqual(self.s3.create_delivery.call_count, 2)
+        self.s3.send_delivery.assert_has_calls([
+            call(self.s3.create_delivery.return_value, False),
+            call(self.s3.create_delivery.return_value, True),
+        ], any_order=True)
+
+    def test_run_creates_missing_bucket(self):
+        self.s3.get_bucket_by_name.side_effect = NotFoundException
+
+        BatchDelivery(self.s3, num_workers=1).run(self.rows[:1])
+
+        self.s3.create_bucket.assert_called_with('bucket1')
+        self.s3.create_delivery.assert_called_with(self.s3.create_bucket.return_value,
+                                                   self.s3.get_s3user_by_email.return_value, '')
+
+    def test_run_records_errors_per_row(self):
+        self.s3.get_s3user_by_email.side_effect = [S3Exception('Bad email'), MagicMock()]
+
+        results = BatchDelivery(self.s3, num_workers=1).run(self.rows)
+
+        self.assertFalse(results[0].succeeded)
+        self.assertEqual(str(results[0].error), 'Bad email')
+        self.assertTrue(results[1].succeeded)
+
+    def test_run_looks_up_repeated_recipient_once(self):
+        rows = [ManifestRow(idx + 1, 'bucket{}'.format(idx), 'joe@joe.com') for idx in range(3)]
+
+        results = BatchDelivery(self.s3, num_workers=1).run(rows)
+
+        self.assertTrue(all(result.succeeded for result in results))
+        self.s3.get_s3user_by_email.assert_called_once_with('joe@joe.com')
+        self.assertEqual(self.s3.create_delivery.call_count, 3)
+
+    @patch('datadelivery.batch.sys')
+    def test_run_prints_progress_with_concurrency(self, mock_sys):
+        concurrency = MagicMock(current_limit=3)
+
+        BatchDelivery(self.s3, num_workers=1, concurrency=concurrency).run(self.rows)
+
+        mock_sys.stderr.write.assert_has_calls([
+            call('1 of 2 rows finished, row 1 sent, concurrency 3\n'),
+            call('2 of 2 rows finished, row 2 sent, concurrency 3\n'),
+        ])
+
+
+class BatchDeliveryJournalTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal_filename = os.path.join(self.temp_dir, 'run.journal')
+        self.s3 = MagicMock()
+        self.s3.with_deadline.return_value = self.s3
+        self.s3.get_bucket_by_name.return_value = S3Bucket({'id': 5, 'name': 'bucket1', 'owner': 1, 'endpoint': 1})
+        self.s3.create_delivery.return_value = self.make_delivery(state=0)
+        self.s3.send_delivery.return_value = self.make_delivery(state=1)
+        self.row = ManifestRow(1, 'bucket1', 'joe@joe.com')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def make_delivery(state):
+        return S3Delivery({'id': 8, 'bucket': 5, 'from_user': 1, 'to_user': 2, 'state': state, 'user_message': '',
+                           'decline_reason': '', 'performed_by': '', 'delivery_email_text': ''})
+
+    def run_batch(self):
+        return BatchDelivery(self.s3, num_workers=1, journal=DeliveryJournal(self.journal_filename)).run([self.row])
+
+    def test_rerun_skips_sent_rows(self):
+        self.run_batch()
+        self.s3.reset_mock()
+
+        results = self.run_batch()
+
+        self.assertTrue(results[0].succeeded)
+        self.assertEqual(results[0].delivery.id, 8)
+        self.assertEqual(results[0].delivery.state, 1)
+        self.s3.with_deadline.assert_not_called()
+        self.s3.get_s3user_by_email.assert_not_called()
+
+    def test_rerun_resumes_after_delivery_created(self):
+        self.s3.send_delivery.side_effect = S3Exception('Service unavailable')
+        self.assertFalse(self.run_batch()[0].succeeded)
+        self.s3.reset_mock()
+        self.s3.send_delivery.side_effect = None
+
+        self.assertTrue(self.run_batch()[0].succeeded)
+
+        self.s3.get_bucket_by_name.assert_not_called()
+        self.s3.create_delivery.assert_not_called()
+        delivery = self.s3.send_delivery.call_args[0][0]
+        self.assertEqual((delivery.id, delivery.state), (8, 0))
+
+    def test_rerun_resumes_after_bucket_resolved(self):
+        self.s3.create_delivery.side_effect = S3Exception('Service unavailable')
+        self.assertFalse(self.run_batch()[0].succeeded)
+        self.s3.reset_mock()
+        self.s3.create_delivery.side_effect = None
+
+        self.assertTrue(self.run_batch()[0].succeeded)
+
+        self.s3.get_bucket_by_name.assert_not_called()
+        self.s3.create_bucket.assert_not_called()
+        self.assertEqual(self.s3.create_delivery.call_args[0][0].id, 5)
+
+
+class FormatResultsTableTestCase(TestCase):
+    def test_format_results_table(self):
+        results = [
+            DeliveryResult(ManifestRow(1, 'bucket1', 'joe@joe.com'), delivery=MagicMock(id=888)),
+            DeliveryResult(ManifestRow(2, 'b2', 'bob@bob.com'), error=S3Exception('Bad email')),
+        ]
+        self.assertEqual(format_results_table(results).split('\n'), [
+            'Row  Bucket   Email        Status  Details',
+            '1    bucket1  joe@joe.com  sent    delivery 888',
+            '2    b2       bob@bob.com  failed  Bad email',
+        ])
@@ -0,0 +1,52 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import patch
+from datadelivery.benchmark import BenchmarkResult, run_benchmarks, benchmark_config_loading
+
+
+class BenchmarkResultTestCase(TestCase):
+    def test_percentile(self):
+        result = BenchmarkResult('single', [0.1 * idx for idx in range(100, 0, -1)], elapsed=10, round_trips=700)
+        self.assertAlmostEqual(result.percentile(50), 5.0)
+        self.assertAlmostEqual(result.percentile(99), 9.9)
+        self.assertAlmostEqual(result.percentile(100), 10.0)
+
+    def test_summary(self):
+        result = BenchmarkResult('bulk', [0.010, 0.020], elapsed=0.5, round_trips=11)
+        self.assertEqual(result.summary(),
+                         'bulk: 2 deliveries, 5.5 round trips/delivery, p50 10.0ms, p99 20.0ms, 4.0 deliveries/s')
+
+
+class RunBenchmarksTestCase(TestCase):
+    def setUp(self):
+        self.home_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.home_dir)
+
+    def test_run_benchmarks(self):
+        with patch.dict(os.environ, {'HOME': self.home_dir}):
+            single, bulk = run_benchmarks(deliveries=2, rows=4, workers=2, latency=0, error_rate=0,
+                                          rate_limit=None)
+
+        # identity lookups, recipient, bucket lookup, bucket create, create and send delivery
+        self.assertEqual(single.count, 2)
+        self.assertEqual(single.round_trips, 2 * 8)
+        # identity lookups happen once for the whole batch
+        self.assertEqual(bulk.count, 4)
+        self.assertEqual(bulk.round_trips, 3 + 4 * 5)
+        # the delivery index is kept in a temporary directory instead of next to ~/.datadelivery.yml
+        self.assertEqual(os.listdir(self.home_dir), [])
+
+
+class BenchmarkConfigLoadingTestCase(TestCase):
+    def test_benchmark_config_loading(self):
+        results = dict(benchmark_config_loading(count=20))
+
+        self.assertIn('SafeLoader', results)
+        self.assertIn('compiled', results)
+        # the compiled config skips YAML parsing altogether
+        self.assertLess(results['compiled'], results['SafeLoader'])
@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from mock import patch
+from datadelivery.cache import IdentityCache, HttpCache
+
+
+class IdentityCacheTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'cache.json')
+        self.key = IdentityCache.make_key('someurl/', 'main_endpoint', 'secret')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_make_key_hashes_token(self):
+        self.assertTrue(self.key.startswith('someurl/|main_endpoint|'))
+        self.assertNotIn('secret', self.key)
+        self.assertNotEqual(self.key, IdentityCache.make_key('someurl/', 'main_endpoint', 'other'))
+
+    def test_get_missing_file(self):
+        cache = IdentityCache(self.filename)
+        self.assertEqual(cache.get(self.key, 'endpoint'), None)
+
+    def test_put_and_get(self):
+        IdentityCache(self.filename).put(self.key, 'endpoint', {'id': 123})
+        IdentityCache(self.filename).put(self.key, 's3user', {'id': 222})
+
+        cache = IdentityCache(self.filename)
+        self.assertEqual(cache.get(self.key, 'endpoint'), {'id': 123})
+        self.assertEqual(cache.get(self.key, 's3user'), {'id': 222})
+        self.assertEqual(cache.get('otherkey', 'endpoint'), None)
+        with open(self.filename) as infile:
+            self.assertNotIn('secret', infile.read())
+
+    @patch('datadelivery.cache.time')
+    def test_get_expired(self, mock_time):
+        mock_time.time.return_value = 1000
+        cache = IdentityCache(self.filename, ttl=60)
+        cache.put(self.key, 'endpoint', {'id': 123})
+
+        mock_time.time.return_value = 1059
+        self.assertEqual(cache.get(self.key, 'endpoint'), {'id': 123})
+        mock_time.time.return_value = 1060
+        self.assertEqual(cache.get(self.key, 'endpoint'), None)
+
+    def test_ttl_zero_disables_cache(self):
+        cache = IdentityCache(self.filename, ttl=0)
+        cache.put(self.key, 'endpoint', {'id': 123})
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual(cache.get(self.key, 'endpoint'), None)
+
+    def test_invalidate(self):
+        cache = IdentityCache(self.filename)
+        cache.put(self.key, 'endpoint', {'id': 123})
+        cache.put('otherkey', 'endpoint', {'id': 456})
+
+        cache.invalidate(self.key)
+
+        self.assertEqual(cache.get(self.key, 'endpoint'), None)
+        self.assertEqual(cache.get('otherkey', 'endpoint'), {'id': 456})
+
+    def test_corrupt_file_is_a_miss(self):
+        with open(self.filename, 'w') as outfile:
+            outfile.write('{not json')
+        cache = IdentityCache(self.filename)
+        self.assertEqual(cache.get(self.key, 'endpoint'), None)
+        cache.put(self.key, 'endpoint', {'id': 123})
+        with open(self.filename) as infile:
+            self.assertEqual(list(json.load(infile).keys()), [self.key])
+
+    def test_unwritable_directory_is_ignored(self):
+        cache = IdentityCache(os.path.join(self.temp_dir, 'missing', 'cache.json'))
+        cache.put(self.key, 'endpoint', {'id': 123})
+        self.assertEqual(cache.get(self.key, 'endpoint'), None)
+
+
+class HttpCacheTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.dirname = os.path.join(self.temp_dir, 'http-cache')
+        self.key = HttpCache.make_key('someurl/s3-buckets/', 'secret')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_make_key_hashes_token(self):
+        self.assertNotIn('secret', self.key)
+        self.assertNotEqual(self.key, HttpCache.make_key('someurl/s3-buckets/', 'other'))
+        self.assertNotEqual(self.key, HttpCache.make_key('someurl/s3-users/', 'secret'))
+
+    def test_get_missing(self):
+        self.assertEqual(HttpCache(self.dirname).get(self.key), None)
+
+    def test_put_and_get(self):
+        HttpCache(self.dirname).put(self.key, [{'id': 1}], '"abc"', 'Tue, 01 Sep 2026 10:00:00 GMT')
+
+        entry = HttpCache(self.dirname).get(self.key)
+        self.assertEqual(entry, {'data': [{'id': 1}], 'etag': '"abc"',
+                                 'last_modified': 'Tue, 01 Sep 2026 10:00:00 GMT'})
+
+    def test_put_evicts_least_recently_used(self):
+        cache = HttpCache(self.dirname, max_size=250)
+        cache.put('first', ['x' * 50], '"1"', None)
+        cache.put('second', ['x' * 50], '"2"', None)
+        os.utime(cache._filename('first'), (time.time() - 20, time.time() - 20))
+        os.utime(cache._filename('second'), (time.time() - 10, time.time() - 10))
+        cache.get('first')
+
+        cache.put('third', ['x' * 50], '"3"', None)
+
+        self.assertNotEqual(cache.get('first'), None)
+        self.assertEqual(cache.get('second'), None)
+        self.assertNotEqual(cache.get('third'), None)
+
+    def test_corrupt_file_is_a_miss(self):
+        cache = HttpCache(self.dirname)
+        cache.put(self.key, [], '"abc"', None)
+        with open(cache._filename(self.key), 'w') as outfile:
+            outfile.write('{not json')
+        self.assertEqual(cache.get(self.key), None)
+
+    def test_unwritable_directory_is_ignored(self):
+        filename = os.path.join(self.temp_dir, 'file')
+        with open(filename, 'w') as outfile:
+            outfile.write('')
+        cache = HttpCache(os.path.join(filename, 'http-cache'))
+        cache.put(self.key, [], '"abc"', None)
+        self.assertEqual(cache.get(self.key), None)
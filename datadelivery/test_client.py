@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+import requests
+from mock import patch
+from datadelivery.client import DeliveryClient
+from datadelivery.config import Config
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN
+from datadelivery.s3 import S3Delivery, S3Exception, NotFoundException
+
+
+class DeliveryClientTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.config_filename = os.path.join(self.temp_dir, 'datadelivery.yml')
+        self.server = MockD4S2Server().start()
+        self.config = Config({'token': DEFAULT_TOKEN, 'url': self.server.url, 'identity_cache_ttl': 0})
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def create_client(self):
+        client = DeliveryClient(self.config, config_filename=self.config_filename, version_str='1.0')
+        self.addCleanup(client.close)
+        return client
+
+    def test_deliver(self):
+        self.server.add_recipient('bob@bob.com')
+        client = self.create_client()
+
+        delivery = client.deliver('bucket1', 'bob@bob.com', 'Hi')
+
+        self.assertIsInstance(delivery, S3Delivery)
+        self.assertEqual(client.get_delivery(delivery.id).user_message, 'Hi')
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'datadelivery.deliveries.sqlite')))
+
+    def test_deliver_from_many_threads(self):
+        emails = [self.server.add_recipient('user{}@example.com'.format(idx))['email'] for idx in range(8)]
+        client = self.create_client()
+        deliveries = {}
+        s3_clients = {}
+
+        def deliver(email):
+            deliveries[email] = client.deliver('bucket-{}'.format(email), email)
+            s3_clients[email] = client.s3
+
+        threads = [threading.Thread(target=deliver, args=(email,)) for email in emails]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(delivery.id for delivery in deliveries.values())), 8)
+        # each thread has its own session but the current endpoint and user are looked up once
+        self.assertEqual(len(set(id(s3.session) for s3 in s3_clients.values())), 8)
+        self.assertEqual(self.server.request_counts['GET s3-endpoints/'], 1)
+        self.assertEqual(self.server.request_counts['GET users/current-user/'], 1)
+
+    def test_deliver_lookups_do_not_share_the_callers_session(self):
+        self.server.add_recipient('bob@bob.com')
+        client = self.create_client()
+        client.s3.current_s3user
+        session_threads = {}
+        request = requests.Session.request
+
+        def record_request(session, *args, **kwargs):
+            session_threads.setdefault(id(session), set()).add(threading.current_thread().ident)
+            return request(session, *args, **kwargs)
+
+        with patch.object(requests.Session, 'request', record_request):
+            client.deliver('bucket1', 'bob@bob.com')
+            client.deliver('bucket2', 'bob@bob.com')
+
+        self.assertEqual(session_threads[id(client.s3.session)], set([threading.current_thread().ident]))
+        # the sessions lent to the lookup threads are returned to the pool and reused
+        self.assertEqual(client._session_pool.free_count, 2)
+        self.assertEqual(len(session_threads), 3)
+
+    def test_s3_is_reused_within_a_thread(self):
+        client = self.create_client()
+        self.assertIs(client.s3, client.s3)
+
+    def test_deliver_to_unknown_recipient(self):
+        client = self.create_client()
+        with self.assertRaises(NotFoundException):
+            client.deliver('bucket1', 'nobody@example.com')
+
+    def test_get_missing_delivery(self):
+        client = self.create_client()
+        with self.assertRaises(S3Exception) as raised:
+            client.get_delivery(999)
+        self.assertEqual(raised.exception.status_code, 404)
+
+    def test_reads_config_file(self):
+        with open(self.config_filename, 'w') as outfile:
+            outfile.write('token: {}\nurl: {}\n'.format(DEFAULT_TOKEN, self.server.url))
+
+        client = DeliveryClient(config_filename=self.config_filename, version_str='1.0')
+        self.addCleanup(client.close)
+
+        self.assertEqual(client.config.url, self.server.url)
+        self.assertEqual(client.s3.current_s3user.email, 'joe@joe.com')
+
+    def test_missing_token(self):
+        with self.assertRaises(S3Exception):
+            DeliveryClient(config_filename=self.config_filename, version_str='1.0')
@@ -1,18 +1,113 @@
 from __future__ import absolute_import
+import os
+import shutil
+import sys
+import tempfile
+import time
 from unittest import TestCase
 from mock import MagicMock, patch, call
 from datadelivery.commands import Commands
-from datadelivery.s3 import NotFoundException
+from datadelivery.config import Config, ConfigFile
+from datadelivery.listing import BUCKET_COLUMNS, DELIVERY_COLUMNS
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN
+from datadelivery.s3 import NotFoundException, S3Exception
+
+STUB_LATENCY = 0.2
 
 
 class CommandsTestCase(TestCase):
     def setUp(self):
-        self.config = MagicMock()
+        self.config = MagicMock(metrics_textfile=None, statsd_address=None)
+
+    @patch('datadelivery.commands.IdentityCache')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_create_s3_uses_identity_cache(self, mock_s3, mock_config_file, mock_identity_cache):
+        self.config.rate_limit = None
+        self.config.http_cache_size = 0
+        mock_config_file.return_value.read_or_create_config.return_value = self.config
+
+        s3 = Commands(version_str='1.0')._create_s3()
+
+        self.assertEqual(s3, mock_s3.return_value)
+        mock_identity_cache.assert_called_with(mock_config_file.return_value.identity_cache_filename,
+                                               self.config.identity_cache_ttl)
+        mock_s3.assert_called_with(self.config, user_agent_str='datadelivery/1.0',
+                                   identity_cache=mock_identity_cache.return_value, rate_limiter=None,
+                                   http_cache=None)
+
+    @patch('datadelivery.commands.HttpCache')
+    @patch('datadelivery.commands.IdentityCache')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_create_s3_with_http_cache(self, mock_s3, mock_config_file, mock_identity_cache, mock_http_cache):
+        self.config.rate_limit = None
+        self.config.http_cache_size = 1024
+        mock_config_file.return_value.read_or_create_config.return_value = self.config
+
+        Commands(version_str='1.0')._create_s3()
+
+        mock_http_cache.assert_called_with(mock_config_file.return_value.http_cache_dirname, 1024)
+        self.assertEqual(mock_s3.call_args[1]['http_cache'], mock_http_cache.return_value)
+
+    @patch('datadelivery.commands.get_process_metrics')
+    @patch('datadelivery.commands.IdentityCache')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_create_s3_with_metrics(self, mock_s3, mock_config_file, mock_identity_cache, mock_get_process_metrics):
+        self.config.rate_limit = None
+        self.config.metrics_textfile = '/var/lib/node_exporter/datadelivery.prom'
+        mock_config_file.return_value.read_or_create_config.return_value = self.config
+
+        Commands(version_str='1.0')._create_s3()
 
+        mock_get_process_metrics.assert_called_with('/var/lib/node_exporter/datadelivery.prom', None)
+        mock_s3.return_value.add_request_hook.assert_called_with(mock_get_process_metrics.return_value)
+
+    @patch('datadelivery.commands.RateLimiter')
+    @patch('datadelivery.commands.IdentityCache')
     @patch('datadelivery.commands.ConfigFile')
     @patch('datadelivery.commands.S3')
-    def test_deliver_bucket(self, mock_s3, mock_config_file):
-        mock_s3_object = mock_s3.return_value
+    def test_create_s3_with_rate_limit(self, mock_s3, mock_config_file, mock_identity_cache, mock_rate_limiter):
+        self.config.rate_limit = 5
+        self.config.rate_limit_burst = 10
+        mock_config_file.return_value.read_or_create_config.return_value = self.config
+
+        Commands(version_str='1.0')._create_s3()
+
+        mock_rate_limiter.assert_called_with(5, 10, mock_config_file.return_value.rate_limit_filename)
+        self.assertEqual(mock_s3.call_args[1]['rate_limiter'], mock_rate_limiter.return_value)
+
+    @patch('datadelivery.tracing.Tracer')
+    @patch('datadelivery.commands.IdentityCache')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_tracing(self, mock_s3, mock_config_file, mock_identity_cache, mock_tracer):
+        commands = Commands(version_str='1.0')
+        with commands.tracing('trace.ndjson') as tracer:
+            s3 = commands._create_s3()
+
+        self.assertEqual(tracer, mock_tracer.return_value)
+        tracer.attach.assert_called_with(s3)
+        tracer.close.assert_called_with()
+        tracer.write.assert_called_with('trace.ndjson')
+        self.assertEqual(commands.tracer, None)
+
+    @patch('datadelivery.tracing.Tracer')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_tracing_writes_after_error(self, mock_s3, mock_config_file, mock_tracer):
+        commands = Commands(version_str='1.0')
+        with self.assertRaises(S3Exception):
+            with commands.tracing(''):
+                raise S3Exception('Bad token')
+        mock_tracer.return_value.write.assert_called_with('')
+
+    @patch('datadelivery.commands.DeliveryIndex')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_bucket(self, mock_s3, mock_config_file, mock_delivery_index):
+        mock_s3_object = mock_s3.return_value.with_deadline.return_value
         mock_to_user = MagicMock()
         mock_bucket = MagicMock()
         mock_delivery = MagicMock()
@@ -22,18 +117,80 @@ class CommandsTestCase(TestCase):
         mock_s3_object.create_delivery.return_value = mock_delivery
 
         commands = Commands(version_str='1.0')
-        commands.deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test', resend=False)
+        delivery = commands.deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test',
+                                    resend=False)
 
-        mock_s3.assert_called_with(self.config, user_agent_str='datadelivery/1.0')
+        self.assertEqual(delivery, mock_s3_object.send_delivery.return_value)
+        self.assertEqual(mock_s3.call_args[0], (self.config,))
         mock_s3_object.get_s3user_by_email.assert_called_with('joe@joe.com')
         mock_s3_object.get_bucket_by_name.assert_called_with('some_bucket')
         mock_s3_object.create_delivery.assert_called_with(mock_bucket, mock_to_user, 'Test')
         mock_s3_object.send_delivery.assert_called_with(mock_delivery, False)
 
+    @patch('datadelivery.commands.forward_command')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_forwards_to_agent(self, mock_s3, mock_forward_command):
+        mock_forward_command.return_value = True
+
+        commands = Commands(version_str='1.0', agent_socket_filename='/tmp/agent.sock')
+        commands.deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test', resend=True)
+
+        mock_forward_command.assert_called_with('/tmp/agent.sock', 'deliver',
+                                                ['some_bucket', 'joe@joe.com', 'Test', True])
+        mock_s3.assert_not_called()
+
+    @patch('datadelivery.commands.DeliveryIndex')
+    @patch('datadelivery.commands.forward_command')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_without_agent_runs_in_process(self, mock_s3, mock_config_file, mock_forward_command,
+                                                   mock_delivery_index):
+        mock_forward_command.return_value = False
+        mock_config_file.return_value.read_or_create_config.return_value = self.config
+
+        commands = Commands(version_str='1.0', agent_socket_filename='/tmp/agent.sock')
+        commands.deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test', resend=False)
+
+        mock_s3.return_value.with_deadline.return_value.send_delivery.assert_called()
+
+    @patch('datadelivery.commands.DeliveryIndex')
+    @patch('datadelivery.commands.forward_command')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_while_tracing_is_not_forwarded(self, mock_s3, mock_config_file, mock_forward_command,
+                                                    mock_delivery_index):
+        mock_config_file.return_value.read_or_create_config.return_value = self.config
+
+        commands = Commands(version_str='1.0', agent_socket_filename='/tmp/agent.sock')
+        commands.tracer = MagicMock()
+        commands.deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test', resend=False)
+
+        mock_forward_command.assert_not_called()
+
+    @patch('datadelivery.commands.DeliveryAgent')
     @patch('datadelivery.commands.ConfigFile')
     @patch('datadelivery.commands.S3')
-    def test_deliver_bucket_create_bucket(self, mock_s3, mock_config_file):
-        mock_s3_object = mock_s3.return_value
+    def test_serve(self, mock_s3, mock_config_file, mock_delivery_agent):
+        mock_config_file.return_value.read_or_create_config.return_value = self.config
+        mock_agent = mock_delivery_agent.return_value.start.return_value
+        mock_agent.serve_forever.side_effect = KeyboardInterrupt
+
+        commands = Commands(version_str='1.0', agent_socket_filename='/tmp/agent.sock')
+        commands.serve()
+
+        mock_delivery_agent.assert_called_with(commands, mock_config_file.return_value.agent_socket_filename)
+        mock_agent.close.assert_called_with()
+        self.assertEqual(commands.shared_s3, mock_s3.return_value)
+        self.assertEqual(commands.session_pool.s3, mock_s3.return_value)
+        self.assertEqual(commands._create_s3(), mock_s3.return_value)
+        self.assertEqual(mock_s3.call_count, 1)
+        self.assertEqual(commands.agent_socket_filename, None)
+
+    @patch('datadelivery.commands.DeliveryIndex')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_bucket_create_bucket(self, mock_s3, mock_config_file, mock_delivery_index):
+        mock_s3_object = mock_s3.return_value.with_deadline.return_value
         mock_to_user = MagicMock()
         mock_bucket = MagicMock()
         mock_delivery = MagicMock()
@@ -46,17 +203,18 @@ class CommandsTestCase(TestCase):
         commands = Commands(version_str='1.0')
         commands.deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test', resend=False)
 
-        mock_s3.assert_called_with(self.config, user_agent_str='datadelivery/1.0')
+        self.assertEqual(mock_s3.call_args[0], (self.config,))
         mock_s3_object.get_s3user_by_email.assert_called_with('joe@joe.com')
         mock_s3_object.get_bucket_by_name.assert_called_with('some_bucket')
         mock_s3_object.create_bucket.assert_called_with('some_bucket')
         mock_s3_object.create_delivery.assert_called_with(mock_bucket, mock_to_user, 'Test')
         mock_s3_object.send_delivery.assert_called_with(mock_delivery, False)
 
+    @patch('datadelivery.commands.DeliveryIndex')
     @patch('datadelivery.commands.ConfigFile')
     @patch('datadelivery.commands.S3')
-    def test_deliver_bucket_resend(self, mock_s3, mock_config_file):
-        mock_s3_object = mock_s3.return_value
+    def test_deliver_bucket_resend(self, mock_s3, mock_config_file, mock_delivery_index):
+        mock_s3_object = mock_s3.return_value.with_deadline.return_value
         mock_to_user = MagicMock()
         mock_bucket = MagicMock()
         mock_delivery = MagicMock()
@@ -64,13 +222,311 @@ class CommandsTestCase(TestCase):
         mock_s3_object.get_s3user_by_email.return_value = mock_to_user
         mock_s3_object.get_bucket_by_name.return_value = mock_bucket
         mock_s3_object.create_delivery.return_value = mock_delivery
+        mock_delivery_index.return_value.get.return_value = None
 
         commands = Commands(version_str='1.0')
         commands.deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test', resend=True)
 
-        mock_s3.assert_called_with(self.config, user_agent_str='datadelivery/1.0')
+        self.assertEqual(mock_s3.call_args[0], (self.config,))
         mock_s3_object.get_s3user_by_email.assert_called_with('joe@joe.com')
         mock_s3_object.get_bucket_by_name.assert_called_with('some_bucket')
         mock_s3_object.create_delivery.assert_called_with(mock_bucket, mock_to_user, 'Test')
         mock_s3_object.send_delivery.assert_called_with(mock_delivery, True)
 
+    @patch('datadelivery.commands.DeliveryIndex')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_records_delivery_in_index(self, mock_s3, mock_config_file, mock_delivery_index):
+        mock_s3_object = mock_s3.return_value.with_deadline.return_value
+
+        Commands(version_str='1.0').deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test',
+                                            resend=False)
+
+        mock_delivery_index.assert_called_with(mock_config_file.return_value.delivery_index_filename,
+                                               mock_s3_object.config)
+        mock_delivery_index.return_value.get.assert_not_called()
+        mock_delivery_index.return_value.put.assert_has_calls([
+            call('some_bucket', 'joe@joe.com', mock_s3_object.create_delivery.return_value),
+            call('some_bucket', 'joe@joe.com', mock_s3_object.send_delivery.return_value),
+        ])
+
+    @patch('datadelivery.commands.DeliveryIndex')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_resend_indexed_delivery(self, mock_s3, mock_config_file, mock_delivery_index):
+        mock_s3_object = mock_s3.return_value.with_deadline.return_value
+        indexed_delivery = mock_delivery_index.return_value.get.return_value
+
+        Commands(version_str='1.0').deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test',
+                                            resend=True)
+
+        mock_delivery_index.return_value.get.assert_called_with('some_bucket', 'joe@joe.com')
+        mock_s3_object.send_delivery.assert_called_once_with(indexed_delivery, True)
+        mock_s3_object.get_s3user_by_email.assert_not_called()
+        mock_s3_object.get_bucket_by_name.assert_not_called()
+        mock_s3_object.create_delivery.assert_not_called()
+        mock_delivery_index.return_value.put.assert_called_with('some_bucket', 'joe@joe.com',
+                                                                mock_s3_object.send_delivery.return_value)
+
+    @patch('datadelivery.commands.DeliveryIndex')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_resend_indexed_delivery_with_new_message(self, mock_s3, mock_config_file, mock_delivery_index):
+        mock_s3_object = mock_s3.return_value.with_deadline.return_value
+        indexed_delivery = mock_delivery_index.return_value.get.return_value
+        indexed_delivery.has_message.return_value = False
+
+        Commands(version_str='1.0').deliver(bucket_name='some_bucket', email='joe@joe.com',
+                                            user_message='Corrected', resend=True)
+
+        indexed_delivery.has_message.assert_called_with('Corrected')
+        mock_s3_object.create_delivery.assert_called_with(mock_s3_object.get_bucket_by_name.return_value,
+                                                          mock_s3_object.get_s3user_by_email.return_value,
+                                                          'Corrected')
+        mock_s3_object.send_delivery.assert_called_once_with(mock_s3_object.create_delivery.return_value, True)
+
+    @patch('datadelivery.commands.DeliveryIndex')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_resend_indexed_delivery_not_found(self, mock_s3, mock_config_file, mock_delivery_index):
+        mock_s3_object = mock_s3.return_value.with_deadline.return_value
+        indexed_delivery = mock_delivery_index.return_value.get.return_value
+        mock_s3_object.send_delivery.side_effect = [S3Exception('Not found.', 404), MagicMock()]
+
+        Commands(version_str='1.0').deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test',
+                                            resend=True)
+
+        mock_delivery_index.return_value.remove.assert_called_with('some_bucket', 'joe@joe.com')
+        mock_s3_object.send_delivery.assert_has_calls([
+            call(indexed_delivery, True),
+            call(mock_s3_object.create_delivery.return_value, True),
+        ])
+
+    @patch('datadelivery.commands.DeliveryIndex')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_resend_indexed_delivery_error(self, mock_s3, mock_config_file, mock_delivery_index):
+        mock_s3_object = mock_s3.return_value.with_deadline.return_value
+        mock_s3_object.send_delivery.side_effect = S3Exception('Service unavailable.', 503)
+
+        with self.assertRaises(S3Exception):
+            Commands(version_str='1.0').deliver(bucket_name='some_bucket', email='joe@joe.com', user_message='Test',
+                                                resend=True)
+
+        mock_s3_object.create_delivery.assert_not_called()
+        mock_delivery_index.return_value.remove.assert_not_called()
+
+    @patch('datadelivery.commands.format_results_table')
+    @patch('datadelivery.commands.BatchDelivery')
+    @patch('datadelivery.commands.read_manifest')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_many(self, mock_s3, mock_config_file, mock_read_manifest, mock_batch_delivery,
+                          mock_format_results_table):
+        mock_config_file.return_value.read_or_create_config.return_value = self.config
+        mock_batch_delivery.return_value.run.return_value = [MagicMock(succeeded=True)]
+
+        commands = Commands(version_str='1.0')
+        commands.deliver_many('manifest.csv', 3)
+
+        mock_read_manifest.assert_called_with('manifest.csv')
+        mock_s3.assert_called_once()
+        mock_batch_delivery.assert_called_with(mock_s3.return_value, 3, None, None)
+        mock_batch_delivery.return_value.run.assert_called_with(mock_read_manifest.return_value)
+        mock_format_results_table.assert_called_with(mock_batch_delivery.return_value.run.return_value)
+
+    @patch('datadelivery.commands.format_results_table')
+    @patch('datadelivery.commands.BatchDelivery')
+    @patch('datadelivery.commands.read_manifest')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_deliver_many_with_failures(self, mock_s3, mock_config_file, mock_read_manifest, mock_batch_delivery,
+                                        mock_format_results_table):
+        mock_batch_delivery.return_value.run.return_value = [MagicMock(succeeded=True), MagicMock(succeeded=False)]
+
+        commands = Commands(version_str='1.0')
+        with self.assertRaises(S3Exception) as raised:
+            commands.deliver_many('manifest.csv', 3)
+        self.assertEqual(str(raised.exception), '1 of 2 deliveries failed')
+
+    @patch('datadelivery.commands.DeliveryPlan')
+    @patch('datadelivery.commands.read_manifest')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_plan_only_prints(self, mock_s3, mock_config_file, mock_read_manifest, mock_delivery_plan):
+        mock_delivery_plan.return_value.format.return_value = 'Deliveries: 1'
+
+        Commands(version_str='1.0').plan('manifest.csv', False, 3)
+
+        mock_delivery_plan.assert_called_with(mock_read_manifest.return_value)
+        mock_s3.assert_not_called()
+        mock_delivery_plan.return_value.execute.assert_not_called()
+
+    @patch('datadelivery.commands.format_results_table')
+    @patch('datadelivery.commands.DeliveryPlan')
+    @patch('datadelivery.commands.read_manifest')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_plan_execute(self, mock_s3, mock_config_file, mock_read_manifest, mock_delivery_plan,
+                          mock_format_results_table):
+        mock_delivery_plan.return_value.format.return_value = 'Deliveries: 2'
+        mock_delivery_plan.return_value.execute.return_value = [MagicMock(succeeded=True), MagicMock(succeeded=False)]
+
+        with self.assertRaises(S3Exception) as raised:
+            Commands(version_str='1.0').plan('manifest.csv', True, 3)
+
+        self.assertEqual(str(raised.exception), '1 of 2 deliveries failed')
+        mock_delivery_plan.return_value.execute.assert_called_with(mock_s3.return_value, 3)
+        mock_format_results_table.assert_called_with(mock_delivery_plan.return_value.execute.return_value)
+
+    @patch('datadelivery.commands.write_items')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_list_buckets(self, mock_s3, mock_config_file, mock_write_items):
+        Commands(version_str='1.0').list_buckets('bucket1', None, 'ndjson')
+
+        mock_s3.return_value.iter_buckets.assert_called_with(name='bucket1', owner=None)
+        mock_write_items.assert_called_with(mock_s3.return_value.iter_buckets.return_value, BUCKET_COLUMNS,
+                                            'ndjson', sys.stdout)
+
+    @patch('datadelivery.commands.write_items')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_list_deliveries(self, mock_s3, mock_config_file, mock_write_items):
+        Commands(version_str='1.0').list_deliveries(3, None, 5, 1, 'table')
+
+        mock_s3.return_value.iter_deliveries.assert_called_with(bucket=3, from_user=None, to_user=5, state=1)
+        mock_write_items.assert_called_with(mock_s3.return_value.iter_deliveries.return_value, DELIVERY_COLUMNS,
+                                            'table', sys.stdout)
+
+    @patch('datadelivery.commands.DeliveryWatcher')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_status(self, mock_s3, mock_config_file, mock_delivery_watcher):
+        mock_delivery_watcher.return_value.format_status_table.return_value = 'Delivery  State'
+
+        Commands(version_str='1.0').status([8, 9])
+
+        mock_delivery_watcher.assert_called_with(mock_s3.return_value, [8, 9])
+        mock_delivery_watcher.return_value.poll.assert_called_with()
+        mock_delivery_watcher.return_value.watch.assert_not_called()
+
+    @patch('datadelivery.commands.DeliveryWatcher')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_watch(self, mock_s3, mock_config_file, mock_delivery_watcher):
+        mock_delivery_watcher.return_value.format_status_table.return_value = 'Delivery  State'
+        mock_delivery_watcher.return_value.watch.return_value = True
+
+        Commands(version_str='1.0').watch([8, 9], 600)
+
+        mock_delivery_watcher.return_value.watch.assert_called_with(600)
+
+    @patch('datadelivery.commands.DeliveryWatcher')
+    @patch('datadelivery.commands.ConfigFile')
+    @patch('datadelivery.commands.S3')
+    def test_watch_timeout(self, mock_s3, mock_config_file, mock_delivery_watcher):
+        mock_delivery_watcher.return_value.format_status_table.return_value = 'Delivery  State'
+        mock_delivery_watcher.return_value.watch.return_value = False
+        mock_delivery_watcher.return_value.deliveries = [MagicMock(finished=True), MagicMock(finished=False)]
+
+        with self.assertRaises(S3Exception) as raised:
+            Commands(version_str='1.0').watch([8, 9], 600)
+
+        self.assertEqual(str(raised.exception), '1 of 2 deliveries not finished after 600 seconds')
+
+
+class CommandsResendTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = MockD4S2Server().start()
+        self.server.add_recipient('bob@bob.com')
+        self.config_file = ConfigFile(os.path.join(self.temp_dir, 'datadelivery.yml'))
+        self.config_file.write_config(Config({'token': DEFAULT_TOKEN, 'url': self.server.url}))
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_resend_with_same_message_uses_indexed_delivery(self):
+        commands = Commands(version_str='1.0', config_file=self.config_file)
+        first = commands.deliver('bucket1', 'bob@bob.com', 'first message', False)
+
+        resent = commands.deliver('bucket1', 'bob@bob.com', 'first message', True)
+
+        self.assertEqual(resent.id, first.id)
+        self.assertEqual(len(self.server.deliveries), 1)
+
+    def test_resend_with_new_message_creates_delivery(self):
+        commands = Commands(version_str='1.0', config_file=self.config_file)
+        first = commands.deliver('bucket1', 'bob@bob.com', 'first message', False)
+
+        resent = commands.deliver('bucket1', 'bob@bob.com', 'corrected message', True)
+
+        self.assertNotEqual(resent.id, first.id)
+        self.assertEqual(resent.user_message, 'corrected message')
+        # a later resend without a message reuses the corrected delivery
+        self.assertEqual(commands.deliver('bucket1', 'bob@bob.com', '', True).id, resent.id)
+
+
+class CommandsTimingTestCase(TestCase):
+    def setUp(self):
+        self.server = MockD4S2Server(latency=STUB_LATENCY).start()
+        self.server.add_recipient('bob@bob.com')
+        self.server.add_bucket('bucket1')
+        self.config = Config({
+            'token': DEFAULT_TOKEN,
+            'url': self.server.url,
+            'identity_cache_ttl': 0,
+            'http_cache_size': 0,
+        })
+
+    def tearDown(self):
+        self.server.stop()
+
+    @patch('datadelivery.commands.ConfigFile')
+    def test_deliver_latency_is_dependency_depth(self, mock_config_file):
+        mock_config_file.return_value.read_or_create_config.return_value = self.config
+        commands = Commands(version_str='1.0')
+
+        # baseline: the seven requests made one after another
+        s3 = commands._create_s3()
+        start = time.time()
+        to_s3user = s3.get_s3user_by_email('bob@bob.com')
+        s3.current_s3user
+        bucket = s3.get_bucket_by_name('bucket1')
+        s3.send_delivery(s3.create_delivery(bucket, to_s3user, ''))
+        sequential_time = time.time() - start
+        self.assertEqual(self.server.total_requests, 7)
+
+        start = time.time()
+        commands.deliver('bucket1', 'bob@bob.com', '', False)
+        parallel_time = time.time() - start
+
+        # endpoint/current user/bucket -> s3 users -> create delivery -> send is four requests deep
+        # instead of seven so deliver should save about three latencies
+        self.assertEqual(self.server.total_requests, 14)
+        self.assertGreaterEqual(sequential_time, 7 * STUB_LATENCY)
+        self.assertLess(parallel_time, sequential_time - 2 * STUB_LATENCY)
+
+    @patch('datadelivery.commands.ConfigFile')
+    def test_list_buckets_does_not_cache_pages(self, mock_config_file):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        http_cache_dirname = os.path.join(temp_dir, 'http-cache')
+        mock_config_file.return_value.http_cache_dirname = http_cache_dirname
+        mock_config_file.return_value.read_or_create_config.return_value = Config({
+            'token': DEFAULT_TOKEN,
+            'url': self.server.url,
+        })
+
+        with patch('datadelivery.commands.sys.stdout') as mock_stdout:
+            Commands(version_str='1.0').list_buckets(None, None, 'ndjson')
+            first_output = mock_stdout.write.call_args_list
+            mock_stdout.reset_mock()
+            Commands(version_str='1.0').list_buckets(None, None, 'ndjson')
+
+        # long listings would write every page to disk so pages bypass the http cache
+        self.assertEqual(mock_stdout.write.call_args_list, first_output)
+        self.assertFalse(os.path.exists(http_cache_dirname) and os.listdir(http_cache_dirname))
+
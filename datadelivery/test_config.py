@@ -1,18 +1,101 @@
 from __future__ import absolute_import
+import os
+import shutil
+import stat
+import tempfile
 from unittest import TestCase
 from mock import MagicMock, patch, call, mock_open
-from datadelivery.config import ConfigFile, Config, ConfigSetupAbandoned, \
-    DEFAULT_DATA_DELIVERY_URL, DEFAULT_ENDPOINT_NAME, ENTER_DATA_DELIVERY_TOKEN_PROMPT
+from datadelivery.config import ConfigFile, Config, ConfigSetupAbandoned, load_yaml, \
+    DEFAULT_DATA_DELIVERY_URL, DEFAULT_ENDPOINT_NAME, ENTER_DATA_DELIVERY_TOKEN_PROMPT, \
+    DEFAULT_HTTP_POOL_SIZE, DEFAULT_IDENTITY_CACHE_TTL, DEFAULT_MAX_ATTEMPTS, DEFAULT_BACKOFF_BASE, \
+    DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, DEFAULT_HTTP_CACHE_MAX_SIZE
 
 
 class ConfigFileTestCase(TestCase):
-    @patch('datadelivery.config.Config')
-    def test_read_config(self, mock_config):
-        config_file = ConfigFile()
-        with patch("__builtin__.open", mock_open(read_data="data")):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'datadelivery.yml')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_identity_cache_filename(self):
+        config_file = ConfigFile('/tmp/.datadelivery.yml')
+        self.assertEqual(config_file.identity_cache_filename, '/tmp/.datadelivery.cache.json')
+
+    def test_rate_limit_filename(self):
+        config_file = ConfigFile('/tmp/.datadelivery.yml')
+        self.assertEqual(config_file.rate_limit_filename, '/tmp/.datadelivery.ratelimit.json')
+
+    def test_http_cache_dirname(self):
+        config_file = ConfigFile('/tmp/.datadelivery.yml')
+        self.assertEqual(config_file.http_cache_dirname, '/tmp/.datadelivery.http-cache')
+
+    def test_compiled_config_filename(self):
+        config_file = ConfigFile('/tmp/.datadelivery.yml')
+        self.assertEqual(config_file.compiled_config_filename, '/tmp/.datadelivery.compiled.json')
+
+    def test_agent_socket_filename(self):
+        config_file = ConfigFile('/tmp/.datadelivery.yml')
+        self.assertEqual(config_file.agent_socket_filename, '/tmp/.datadelivery.agent.sock')
+
+    def test_delivery_index_filename(self):
+        config_file = ConfigFile('/tmp/.datadelivery.yml')
+        self.assertEqual(config_file.delivery_index_filename, '/tmp/.datadelivery.deliveries.sqlite')
+
+    def test_read_config(self):
+        with open(self.filename, 'w') as outfile:
+            outfile.write('token: secret\nendpoint_name: other\n')
+
+        config = ConfigFile(self.filename).read_config()
+
+        self.assertEqual(config.token, 'secret')
+        self.assertEqual(config.endpoint_name, 'other')
+
+    def test_read_config_uses_compiled_config(self):
+        with open(self.filename, 'w') as outfile:
+            outfile.write('token: secret\n')
+        config_file = ConfigFile(self.filename)
+        config_file.read_config()
+        self.assertEqual(stat.S_IMODE(os.stat(config_file.compiled_config_filename).st_mode), 0o600)
+
+        with patch('datadelivery.config.load_yaml') as mock_load_yaml:
             config = config_file.read_config()
-            self.assertEqual(config, mock_config.return_value)
-            mock_config.assert_called_with("data")
+
+        self.assertEqual(config.token, 'secret')
+        mock_load_yaml.assert_not_called()
+
+    def test_read_config_after_file_changes(self):
+        config_file = ConfigFile(self.filename)
+        with open(self.filename, 'w') as outfile:
+            outfile.write('token: secret\n')
+        config_file.read_config()
+        with open(self.filename, 'w') as outfile:
+            outfile.write('token: other-secret\n')
+
+        self.assertEqual(config_file.read_config().token, 'other-secret')
+
+    def test_read_config_with_corrupt_compiled_config(self):
+        config_file = ConfigFile(self.filename)
+        with open(self.filename, 'w') as outfile:
+            outfile.write('token: secret\n')
+        with open(config_file.compiled_config_filename, 'w') as outfile:
+            outfile.write('{not json')
+
+        self.assertEqual(config_file.read_config().token, 'secret')
+        self.assertEqual(config_file.read_config().token, 'secret')
+
+    def test_load_yaml_prefers_c_loader(self):
+        mock_yaml = MagicMock()
+        with patch.dict('sys.modules', {'yaml': mock_yaml}):
+            data = load_yaml('token: secret')
+        self.assertEqual(data, mock_yaml.load.return_value)
+        mock_yaml.load.assert_called_with('token: secret', Loader=mock_yaml.CSafeLoader)
+
+        del mock_yaml.CSafeLoader
+        with patch.dict('sys.modules', {'yaml': mock_yaml}):
+            load_yaml('token: secret')
+        mock_yaml.load.assert_called_with('token: secret', Loader=mock_yaml.SafeLoader)
 
     @patch('datadelivery.config.Config')
     def test_write_config(self, mock_config):
@@ -101,11 +184,38 @@ class ConfigTestCase(TestCase):
             'token': 'secret1',
             'url': 'dataDeliveryURL',
             'endpoint_name': 'goodEndpoint',
+            'http_pool_size': 4,
+            'identity_cache_ttl': 0,
+            'http_cache_size': 0,
+            'retry_max_attempts': 5,
+            'retry_backoff': 0,
+            'connect_timeout': 3,
+            'read_timeout': 20,
+            'deliver_deadline': 90,
+            'rate_limit': 5,
+            'rate_limit_burst': 10,
+            'metrics_textfile': '/var/lib/node_exporter/datadelivery.prom',
+            'statsd_address': 'localhost:8125',
         })
 
         self.assertEqual(config.token, 'secret1')
         self.assertEqual(config.url, 'dataDeliveryURL')
         self.assertEqual(config.endpoint_name, 'goodEndpoint')
+        self.assertEqual(config.http_pool_size, 4)
+        self.assertEqual(config.identity_cache_ttl, 0)
+        self.assertEqual(config.to_dict()['identity_cache_ttl'], 0)
+        self.assertEqual(config.http_cache_size, 0)
+        self.assertEqual(config.to_dict()['http_cache_size'], 0)
+        self.assertEqual(config.retry_max_attempts, 5)
+        self.assertEqual(config.retry_backoff, 0)
+        self.assertEqual(config.connect_timeout, 3)
+        self.assertEqual(config.read_timeout, 20)
+        self.assertEqual(config.deliver_deadline, 90)
+        self.assertEqual(config.rate_limit, 5)
+        self.assertEqual(config.rate_limit_burst, 10)
+        self.assertEqual(config.to_dict()['rate_limit'], 5)
+        self.assertEqual(config.metrics_textfile, '/var/lib/node_exporter/datadelivery.prom')
+        self.assertEqual(config.to_dict()['statsd_address'], 'localhost:8125')
 
     def test_constructor_defaults(self):
         config = Config({
@@ -115,3 +225,15 @@ class ConfigTestCase(TestCase):
         self.assertEqual(config.token, 'secret1')
         self.assertEqual(config.url, DEFAULT_DATA_DELIVERY_URL)
         self.assertEqual(config.endpoint_name, DEFAULT_ENDPOINT_NAME)
+        self.assertEqual(config.http_pool_size, DEFAULT_HTTP_POOL_SIZE)
+        self.assertEqual(config.identity_cache_ttl, DEFAULT_IDENTITY_CACHE_TTL)
+        self.assertEqual(config.http_cache_size, DEFAULT_HTTP_CACHE_MAX_SIZE)
+        self.assertEqual(config.retry_max_attempts, DEFAULT_MAX_ATTEMPTS)
+        self.assertEqual(config.retry_backoff, DEFAULT_BACKOFF_BASE)
+        self.assertEqual(config.connect_timeout, DEFAULT_CONNECT_TIMEOUT)
+        self.assertEqual(config.read_timeout, DEFAULT_READ_TIMEOUT)
+        self.assertEqual(config.deliver_deadline, None)
+        self.assertEqual(config.rate_limit, None)
+        self.assertEqual(config.rate_limit_burst, None)
+        self.assertEqual(config.metrics_textfile, None)
+        self.assertEqual(config.statsd_address, None)
@@ -0,0 +1,27 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from mock import patch
+from datadelivery.deadline import Deadline
+
+
+class DeadlineTestCase(TestCase):
+    def test_no_deadline(self):
+        deadline = Deadline()
+        self.assertEqual(deadline.remaining(), None)
+        self.assertFalse(deadline.expired())
+        self.assertEqual(deadline.limit_timeout(60), 60)
+
+    @patch('datadelivery.deadline.time')
+    def test_remaining(self, mock_time):
+        mock_time.time.return_value = 1000
+        deadline = Deadline(30)
+
+        mock_time.time.return_value = 1010
+        self.assertEqual(deadline.remaining(), 20)
+        self.assertFalse(deadline.expired())
+        self.assertEqual(deadline.limit_timeout(10), 10)
+        self.assertEqual(deadline.limit_timeout(60), 20)
+
+        mock_time.time.return_value = 1031
+        self.assertEqual(deadline.remaining(), 0)
+        self.assertTrue(deadline.expired())
@@ -0,0 +1,53 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from mock import MagicMock
+from datadelivery.deliveryindex import DeliveryIndex
+
+
+class DeliveryIndexTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'deliveries.sqlite')
+        self.config = MagicMock(url='https://example.com/api/v2/', endpoint_name='default')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_put_and_get(self):
+        delivery_index = DeliveryIndex(self.filename, self.config)
+        self.assertIsNone(delivery_index.get('bucket1', 'joe@joe.com'))
+        delivery_index.put('bucket1', 'joe@joe.com', MagicMock(id=8, state=0, user_message='Hi'))
+        delivery_index.put('bucket1', 'joe@joe.com', MagicMock(id=8, state=1, user_message='Hi'))
+
+        indexed_delivery = DeliveryIndex(self.filename, self.config).get('bucket1', 'joe@joe.com')
+        self.assertEqual((indexed_delivery.id, indexed_delivery.state), (8, 1))
+        self.assertIsNone(delivery_index.get('bucket1', 'bob@bob.com'))
+        self.assertIsNone(delivery_index.get('bucket2', 'joe@joe.com'))
+
+    def test_has_message(self):
+        delivery_index = DeliveryIndex(self.filename, self.config)
+        delivery_index.put('bucket1', 'joe@joe.com', MagicMock(id=8, state=0, user_message=u'Hi \u00e9'))
+
+        indexed_delivery = delivery_index.get('bucket1', 'joe@joe.com')
+        self.assertTrue(indexed_delivery.has_message(u'Hi \u00e9'))
+        self.assertFalse(indexed_delivery.has_message('Bye'))
+
+    def test_entries_are_separate_per_endpoint(self):
+        delivery = MagicMock(id=8, state=0, user_message='Hi')
+        DeliveryIndex(self.filename, self.config).put('bucket1', 'joe@joe.com', delivery)
+        other_config = MagicMock(url=self.config.url, endpoint_name='other')
+        self.assertIsNone(DeliveryIndex(self.filename, other_config).get('bucket1', 'joe@joe.com'))
+
+    def test_remove(self):
+        delivery_index = DeliveryIndex(self.filename, self.config)
+        delivery_index.put('bucket1', 'joe@joe.com', MagicMock(id=8, state=0, user_message='Hi'))
+        delivery_index.remove('bucket1', 'joe@joe.com')
+        self.assertIsNone(delivery_index.get('bucket1', 'joe@joe.com'))
+
+    def test_unusable_database_is_treated_as_empty(self):
+        delivery_index = DeliveryIndex(os.path.join(self.temp_dir, 'missing', 'deliveries.sqlite'), self.config)
+        delivery_index.put('bucket1', 'joe@joe.com', MagicMock(id=8, state=0, user_message='Hi'))
+        self.assertIsNone(delivery_index.get('bucket1', 'joe@joe.com'))
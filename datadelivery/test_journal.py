@@ -0,0 +1,52 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from datadelivery.journal import DeliveryJournal, STAGE_BUCKET_RESOLVED, STAGE_DELIVERY_CREATED, STAGE_SENT
+from datadelivery.manifest import ManifestRow
+
+
+class DeliveryJournalTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'run.journal')
+        self.row = ManifestRow(1, 'bucket1', 'joe@joe.com')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_unknown_row(self):
+        self.assertEqual(DeliveryJournal(self.filename).get(self.row), {})
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_record_and_reload(self):
+        journal = DeliveryJournal(self.filename)
+        journal.record(self.row, STAGE_BUCKET_RESOLVED, {'id': 5})
+        journal.record(self.row, STAGE_DELIVERY_CREATED, {'id': 8})
+        journal.record(ManifestRow(2, 'bucket1', 'bob@bob.com'), STAGE_SENT, {'id': 9})
+        expected = {STAGE_BUCKET_RESOLVED: {'id': 5}, STAGE_DELIVERY_CREATED: {'id': 8}}
+        self.assertEqual(journal.get(self.row), expected)
+        self.assertEqual(DeliveryJournal(self.filename).get(self.row), expected)
+
+    def test_rows_are_keyed_by_number_bucket_and_email(self):
+        journal = DeliveryJournal(self.filename)
+        journal.record(self.row, STAGE_SENT, {'id': 8})
+        self.assertEqual(journal.get(ManifestRow(1, 'bucket1', 'bob@bob.com')), {})
+        self.assertEqual(journal.get(ManifestRow(2, 'bucket1', 'joe@joe.com')), {})
+
+    def test_incomplete_last_line_is_ignored(self):
+        DeliveryJournal(self.filename).record(self.row, STAGE_BUCKET_RESOLVED, {'id': 5})
+        with open(self.filename, 'a') as stream:
+            stream.write('{"data": {"id": 8}, "row": "1|bucket1|joe@joe.com", "st')
+        self.assertEqual(DeliveryJournal(self.filename).get(self.row), {STAGE_BUCKET_RESOLVED: {'id': 5}})
+
+    def test_record_after_incomplete_last_line(self):
+        DeliveryJournal(self.filename).record(self.row, STAGE_BUCKET_RESOLVED, {'id': 5})
+        with open(self.filename, 'a') as stream:
+            stream.write('{"data": {"id": 8}, "row": "1|bucket1|joe@joe.com", "st')
+
+        DeliveryJournal(self.filename).record(self.row, STAGE_DELIVERY_CREATED, {'id': 99})
+
+        self.assertEqual(DeliveryJournal(self.filename).get(self.row),
+                         {STAGE_BUCKET_RESOLVED: {'id': 5}, STAGE_DELIVERY_CREATED: {'id': 99}})
@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+import json
+from unittest import TestCase
+import shutil
+import tempfile
+from six import StringIO
+from datadelivery.cache import HttpCache
+from datadelivery.config import Config
+from datadelivery.listing import write_items, BUCKET_COLUMNS, DELIVERY_COLUMNS
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN
+from datadelivery.s3 import S3, S3Bucket
+
+
+class WriteItemsTestCase(TestCase):
+    def setUp(self):
+        self.buckets = [S3Bucket({'id': 1, 'name': 'bucket1', 'owner': 2, 'endpoint': 3}),
+                        S3Bucket({'id': 12, 'name': 'bucket12', 'owner': 2, 'endpoint': 3})]
+
+    def test_ndjson(self):
+        stream = StringIO()
+        self.assertEqual(write_items(iter(self.buckets), BUCKET_COLUMNS, 'ndjson', stream), 2)
+        self.assertEqual([json.loads(line) for line in stream.getvalue().splitlines()], [
+            {'id': 1, 'name': 'bucket1', 'owner': 2, 'endpoint': 3},
+            {'id': 12, 'name': 'bucket12', 'owner': 2, 'endpoint': 3},
+        ])
+
+    def test_table(self):
+        stream = StringIO()
+        write_items(iter(self.buckets), [('id', 4), ('name', 10), ('owner', 0)], 'table', stream)
+        self.assertEqual(stream.getvalue().splitlines(), [
+            'id    name        owner',
+            '1     bucket1     2',
+            '12    bucket12    2',
+        ])
+
+    def test_writes_each_item_before_fetching_the_next(self):
+        stream = StringIO()
+
+        def buckets():
+            yield self.buckets[0]
+            self.assertEqual(len(stream.getvalue().splitlines()), 2)
+            yield self.buckets[1]
+        write_items(buckets(), BUCKET_COLUMNS, 'table', stream)
+
+
+class ListDeliveriesServerTestCase(TestCase):
+    def setUp(self):
+        self.server = MockD4S2Server().start()
+        self.s3 = S3(Config({'token': DEFAULT_TOKEN, 'url': self.server.url, 'identity_cache_ttl': 0}), 'test')
+
+    def tearDown(self):
+        self.s3.close()
+        self.server.stop()
+
+    def test_iter_deliveries_pages_with_filters(self):
+        bucket = self.server.add_bucket('bucket1')
+        recipient = self.server.add_recipient('bob@bob.com')
+        s3_bucket = S3Bucket(bucket)
+        for _ in range(5):
+            self.s3.create_delivery(s3_bucket, self.s3.get_s3user_by_email('bob@bob.com'), '')
+        self.server.reset_request_counts()
+
+        stream = StringIO()
+        deliveries = self.s3.iter_deliveries(to_user=recipient['id'], page_size=2)
+        self.assertEqual(write_items(deliveries, DELIVERY_COLUMNS, 'ndjson', stream), 5)
+
+        self.assertEqual([json.loads(line)['id'] for line in stream.getvalue().splitlines()], [1, 2, 3, 4, 5])
+        self.assertEqual(self.server.request_counts, {'GET s3-deliveries/': 3})
+        self.assertEqual(list(self.s3.iter_deliveries(to_user=recipient['id'] + 1)), [])
+
+    def test_iter_buckets_revalidates_http_cache_when_requested(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.server.add_bucket('bucket1')
+        self.s3.http_cache = HttpCache(temp_dir)
+        first = [bucket.name for bucket in self.s3.iter_buckets(use_cache=True)]
+        statuses = []
+        handle = self.server.handle
+
+        def record_status(*args, **kwargs):
+            response = handle(*args, **kwargs)
+            statuses.append(response[0])
+            return response
+        self.server.handle = record_status
+
+        self.assertEqual([bucket.name for bucket in self.s3.iter_buckets(use_cache=True)], first)
+        self.assertEqual(statuses, [304])
+        self.assertEqual([bucket.name for bucket in self.s3.iter_buckets()], first)
+        self.assertEqual(statuses, [304, 200])
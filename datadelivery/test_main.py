@@ -0,0 +1,63 @@
+from __future__ import absolute_import
+import os
+import subprocess
+import sys
+from unittest import TestCase, skipIf
+from mock import patch
+from datadelivery.__main__ import get_version, main
+from datadelivery.s3 import S3Exception
+
+# cumulative microseconds allowed for importing datadelivery.__main__, was ~290ms when requests,
+# yaml and pkg_resources were imported eagerly
+IMPORT_TIME_BUDGET_US = 150000
+SLOW_MODULES = ['requests', 'yaml', 'pkg_resources', 'multiprocessing']
+
+
+def read_import_times():
+    """
+    Import datadelivery.__main__ in a new interpreter with -X importtime.
+    :return: dict: module name -> cumulative import time in microseconds
+    """
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import datadelivery.__main__'],
+                               cwd=project_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    _, stderr = process.communicate()
+    import_times = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, module_name = line.split('|')
+            cumulative = cumulative.strip()
+            if cumulative.isdigit():
+                import_times[module_name.strip()] = int(cumulative)
+    return import_times
+
+
+class MainTestCase(TestCase):
+    @patch('datadelivery.__main__.get_version')
+    @patch('datadelivery.__main__.ArgParser')
+    def test_main_prints_s3_errors(self, mock_arg_parser, mock_get_version):
+        mock_arg_parser.return_value.parse_and_run_commands.side_effect = S3Exception('Bad token')
+        with self.assertRaises(SystemExit) as raised:
+            main()
+        self.assertEqual(raised.exception.code, 1)
+
+    @skipIf(sys.version_info < (3, 8), "importlib.metadata requires python 3.8")
+    def test_get_version(self):
+        with patch('importlib.metadata.version') as mock_version:
+            mock_version.return_value = '1.2.3'
+            self.assertEqual(get_version(), '1.2.3')
+            mock_version.assert_called_with('datadelivery')
+
+
+@skipIf(sys.version_info < (3, 7), "-X importtime requires python 3.7")
+class StartupTimeTestCase(TestCase):
+    def test_slow_modules_not_imported(self):
+        import_times = read_import_times()
+        self.assertIn('datadelivery.__main__', import_times)
+        for module_name in SLOW_MODULES:
+            self.assertNotIn(module_name, import_times)
+
+    def test_import_time_budget(self):
+        import_times = read_import_times()
+        self.assertLess(import_times['datadelivery.__main__'], IMPORT_TIME_BUDGET_US)
@@ -0,0 +1,123 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from datadelivery.manifest import read_manifest, ManifestRow, ManifestException
+
+
+class ReadManifestTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_file(self, filename, contents):
+        path = os.path.join(self.temp_dir, filename)
+        with open(path, 'w') as outfile:
+            outfile.write(contents)
+        return path
+
+    def assert_rows(self, rows):
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0].row_num, 1)
+        self.assertEqual(rows[0].bucket_name, 'bucket1')
+        self.assertEqual(rows[0].email, 'joe@joe.com')
+        self.assertEqual(rows[0].msg_file, 'msg.txt')
+        self.assertEqual(rows[0].resend, False)
+        self.assertEqual(rows[1].row_num, 2)
+        self.assertEqual(rows[1].bucket_name, 'bucket2')
+        self.assertEqual(rows[1].email, 'bob@bob.com')
+        self.assertEqual(rows[1].msg_file, None)
+        self.assertEqual(rows[1].resend, True)
+
+    def test_read_csv(self):
+        path = self.write_file('manifest.csv', "bucket_name,email,msg_file,resend\n"
+                                               "bucket1,joe@joe.com,msg.txt,\n"
+                                               "bucket2,bob@bob.com,,true\n")
+        self.assert_rows(read_manifest(path))
+
+    def test_read_yaml(self):
+        path = self.write_file('manifest.yml', "- {bucket_name: bucket1, email: joe@joe.com, msg_file: msg.txt}\n"
+                                               "- {bucket_name: bucket2, email: bob@bob.com, resend: true}\n")
+        self.assert_rows(read_manifest(path))
+
+    def test_read_ndjson(self):
+        path = self.write_file('manifest.ndjson',
+                               '{"bucket_name": "bucket1", "email": "joe@joe.com", "msg_file": "msg.txt"}\n'
+                               '\n'
+                               '{"bucket_name": "bucket2", "email": "bob@bob.com", "resend": true}\n')
+        self.assert_rows(read_manifest(path))
+
+    def test_read_json_list(self):
+        path = self.write_file('manifest.json',
+                               '[\n'
+                               '  {"bucket_name": "bucket1", "email": "joe@joe.com", "msg_file": "msg.txt"},\n'
+                               '  {"bucket_name": "bucket2", "email": "bob@bob.com", "resend": true}\n'
+                               ']\n')
+        self.assert_rows(read_manifest(path))
+
+    def test_read_json_one_object_per_line(self):
+        path = self.write_file('manifest.json',
+                               '{"bucket_name": "bucket1", "email": "joe@joe.com", "msg_file": "msg.txt"}\n'
+                               '{"bucket_name": "bucket2", "email": "bob@bob.com", "resend": true}\n')
+        self.assert_rows(read_manifest(path))
+
+    def test_read_missing_file(self):
+        path = os.path.join(self.temp_dir, 'missing.csv')
+        with self.assertRaises(ManifestException) as raised:
+            read_manifest(path)
+        self.assertIn('Unable to read manifest {}'.format(path), str(raised.exception))
+
+    def test_read_invalid_ndjson_line(self):
+        path = self.write_file('manifest.ndjson',
+                               '{"bucket_name": "bucket1", "email": "joe@joe.com"}\n'
+                               '{"bucket_name": "bucket2",\n')
+        with self.assertRaises(ManifestException) as raised:
+            read_manifest(path)
+        self.assertIn('Manifest {} line 2 is not valid JSON'.format(path), str(raised.exception))
+
+    def test_read_invalid_json_list(self):
+        path = self.write_file('manifest.json', '[{"bucket_name": "bucket1",\n')
+        with self.assertRaises(ManifestException) as raised:
+            read_manifest(path)
+        self.assertIn('Manifest {} is not valid JSON'.format(path), str(raised.exception))
+
+    def test_read_invalid_yaml(self):
+        path = self.write_file('manifest.yml', "- {bucket_name: bucket1\n- email: [\n")
+        with self.assertRaises(ManifestException) as raised:
+            read_manifest(path)
+        self.assertIn('Manifest {} is not valid YAML'.format(path), str(raised.exception))
+        self.assertIn('line 2', str(raised.exception))
+
+    def test_read_unsupported_extension(self):
+        path = self.write_file('manifest.txt', "bucket1 joe@joe.com\n")
+        with self.assertRaises(ManifestException):
+            read_manifest(path)
+
+    def test_read_missing_email(self):
+        path = self.write_file('manifest.csv', "bucket_name,email\nbucket1,\n")
+        with self.assertRaises(ManifestException) as raised:
+            read_manifest(path)
+        self.assertIn('row 1', str(raised.exception))
+
+    def test_read_yaml_not_a_list(self):
+        path = self.write_file('manifest.yml', "bucket_name: bucket1\n")
+        with self.assertRaises(ManifestException):
+            read_manifest(path)
+
+
+class ManifestRowTestCase(TestCase):
+    def test_read_user_message_no_file(self):
+        row = ManifestRow(1, 'bucket1', 'joe@joe.com')
+        self.assertEqual(row.read_user_message(), '')
+
+    def test_read_user_message(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as outfile:
+            outfile.write('Hello')
+        try:
+            row = ManifestRow(1, 'bucket1', 'joe@joe.com', msg_file=outfile.name)
+            self.assertEqual(row.read_user_message(), 'Hello')
+        finally:
+            os.unlink(outfile.name)
@@ -0,0 +1,124 @@
+from __future__ import absolute_import
+import os
+import shutil
+import socket
+import tempfile
+from unittest import TestCase
+from mock import MagicMock, patch
+from datadelivery.config import Config
+from datadelivery.metrics import RequestMetrics, LATENCY_BUCKETS
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN
+from datadelivery.s3 import S3
+
+
+class RequestMetricsTestCase(TestCase):
+    def record(self, metrics, method, url_suffix, status_code=200, retry=0, seconds=0.02, error=None):
+        with patch('datadelivery.metrics.time') as mock_time:
+            mock_time.time.return_value = 1000.0
+            context = metrics.request_started(method, url_suffix, retry)
+            mock_time.time.return_value = 1000.0 + seconds
+            response = MagicMock(status_code=status_code) if error is None else None
+            metrics.request_finished(context, response, error)
+
+    def test_records_requests_by_route(self):
+        metrics = RequestMetrics()
+        self.record(metrics, 'GET', 's3-users/?endpoint=1&email=bob@bob.com')
+        self.record(metrics, 'GET', 's3-users/?endpoint=1&user=2', status_code=503)
+        self.record(metrics, 'GET', 's3-users/?endpoint=1&user=2', retry=1, seconds=0.3)
+        self.record(metrics, 'POST', 's3-deliveries/12/send/?force=true')
+        self.record(metrics, 'POST', 's3-deliveries/')
+        self.record(metrics, 'GET', 'http://other.host/api/s3-buckets/?page=2', error=Exception('timeout'))
+
+        s3_users = metrics.routes['GET']['s3-users']
+        self.assertEqual(s3_users.count, 3)
+        self.assertEqual(s3_users.retries, 1)
+        self.assertEqual(s3_users.status_counts, {200: 2, 503: 1})
+        self.assertEqual(s3_users.bucket_counts[LATENCY_BUCKETS.index(0.025)], 2)
+        self.assertEqual(s3_users.bucket_counts[LATENCY_BUCKETS.index(0.5)], 1)
+        self.assertEqual(metrics.routes['POST']['s3-deliveries/send'].count, 1)
+        self.assertEqual(metrics.routes['POST']['s3-deliveries'].count, 1)
+        self.assertEqual(metrics.routes['GET']['other'].status_counts, {'error': 1})
+        self.assertEqual(metrics.deliveries_sent, 1)
+
+    def test_slow_requests_use_last_bucket(self):
+        metrics = RequestMetrics()
+        self.record(metrics, 'GET', 's3-buckets/', seconds=60)
+        self.assertEqual(metrics.routes['GET']['s3-buckets'].bucket_counts[-1], 1)
+
+    def test_unknown_method(self):
+        metrics = RequestMetrics()
+        self.record(metrics, 'PATCH', 's3-buckets/1/')
+        self.assertEqual(metrics.routes['PATCH']['s3-buckets'].count, 1)
+
+    def test_format_prometheus(self):
+        metrics = RequestMetrics()
+        self.record(metrics, 'GET', 's3-buckets/?name=mybucket', seconds=0.02)
+        self.record(metrics, 'GET', 's3-buckets/?name=mybucket', seconds=0.2, retry=1, status_code=404)
+
+        lines = metrics.format_prometheus().splitlines()
+
+        labels = 'method="GET",route="s3-buckets"'
+        self.assertIn('datadelivery_api_requests_total{' + labels + ',status="200"} 1', lines)
+        self.assertIn('datadelivery_api_requests_total{' + labels + ',status="404"} 1', lines)
+        self.assertIn('datadelivery_api_retries_total{' + labels + '} 1', lines)
+        self.assertIn('datadelivery_api_request_duration_seconds_bucket{' + labels + ',le="0.01"} 0', lines)
+        self.assertIn('datadelivery_api_request_duration_seconds_bucket{' + labels + ',le="0.025"} 1', lines)
+        self.assertIn('datadelivery_api_request_duration_seconds_bucket{' + labels + ',le="0.25"} 2', lines)
+        self.assertIn('datadelivery_api_request_duration_seconds_bucket{' + labels + ',le="+Inf"} 2', lines)
+        self.assertIn('datadelivery_api_request_duration_seconds_count{' + labels + '} 2', lines)
+        self.assertIn('datadelivery_deliveries_sent_total 0', lines)
+        # routes without requests are left out
+        self.assertNotIn('s3-users', metrics.format_prometheus())
+
+    def test_write_prometheus_textfile(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        filename = os.path.join(temp_dir, 'datadelivery.prom')
+        metrics = RequestMetrics()
+        self.record(metrics, 'GET', 's3-endpoints/?name=default')
+
+        metrics.write_prometheus_textfile(filename)
+
+        with open(filename) as infile:
+            self.assertEqual(infile.read(), metrics.format_prometheus())
+        self.assertEqual(os.listdir(temp_dir), ['datadelivery.prom'])
+
+    def test_push_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        metrics = RequestMetrics()
+        self.record(metrics, 'POST', 's3-deliveries/12/send/', seconds=0.05)
+
+        metrics.push_statsd('127.0.0.1:{}'.format(server.getsockname()[1]))
+
+        lines = [server.recv(1024).decode('utf-8') for _ in metrics.format_statsd()]
+        self.assertEqual(lines[:4], [
+            'datadelivery.api.post.s3_deliveries.send.requests:1|c',
+            'datadelivery.api.post.s3_deliveries.send.retries:0|c',
+            'datadelivery.api.post.s3_deliveries.send.status.200:1|c',
+            'datadelivery.api.post.s3_deliveries.send.latency_avg_ms:50.000|g',
+        ])
+        self.assertEqual(lines[4], 'datadelivery.deliveries.sent:1|c')
+
+    def test_export_ignores_errors(self):
+        metrics = RequestMetrics()
+        metrics.export(textfile='/missing/directory/datadelivery.prom', statsd_address='not-an-address')
+
+    def test_records_s3_requests(self):
+        server = MockD4S2Server().start()
+        self.addCleanup(server.stop)
+        server.add_recipient('bob@bob.com')
+        metrics = RequestMetrics()
+        s3 = S3(Config({'token': DEFAULT_TOKEN, 'url': server.url}), 'test/1.0')
+        s3.add_request_hook(metrics)
+
+        bucket = s3.create_bucket('bucket1')
+        s3.send_delivery(s3.create_delivery(bucket, s3.get_s3user_by_email('bob@bob.com'), ''))
+
+        self.assertEqual(metrics.routes['GET']['s3-users'].count, 2)
+        self.assertEqual(metrics.routes['POST']['s3-buckets'].count, 1)
+        self.assertEqual(metrics.routes['POST']['s3-deliveries'].count, 1)
+        self.assertEqual(metrics.routes['POST']['s3-deliveries/send'].count, 1)
+        self.assertEqual(metrics.deliveries_sent, 1)
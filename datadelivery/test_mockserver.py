@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+import time
+from unittest import TestCase
+import requests
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN, DELIVERY_STATE_DECLINED
+
+
+class MockD4S2ServerTestCase(TestCase):
+    def setUp(self):
+        self.server = MockD4S2Server().start()
+        self.headers = {'Authorization': 'Token {}'.format(DEFAULT_TOKEN)}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get(self, url_suffix, token=DEFAULT_TOKEN):
+        return requests.get(self.server.url + url_suffix, headers={'Authorization': 'Token {}'.format(token)})
+
+    def post(self, url_suffix, data):
+        return requests.post(self.server.url + url_suffix, headers=self.headers, json=data)
+
+    def test_identity_routes(self):
+        self.assertEqual(self.get('s3-endpoints/?name=default').json(), [self.server.endpoint])
+        self.assertEqual(self.get('s3-endpoints/?name=other').json(), [])
+        self.assertEqual(self.get('users/current-user/').json(), self.server.current_user)
+        self.assertEqual(self.get('s3-users/?endpoint=1&user=1').json(), [self.server.current_s3user])
+
+    def test_invalid_token(self):
+        response = self.get('users/current-user/', token='bad')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'detail': 'Invalid token.'})
+
+    def test_recipient_lookup(self):
+        recipient = self.server.add_recipient('bob@bob.com')
+        self.assertEqual(self.get('s3-users/?endpoint=1&email=bob@bob.com').json(), [recipient])
+        self.assertEqual(self.get('s3-users/?endpoint=1&email=tom@tom.com').json(), [])
+
+    def test_create_bucket(self):
+        bucket = self.post('s3-buckets/', {'name': 'mybucket', 'owner': 1, 'endpoint': 1}).json()
+        self.assertEqual(self.get('s3-buckets/?name=mybucket').json(), [bucket])
+        self.assertEqual(self.post('s3-buckets/', {'name': 'mybucket', 'owner': 1, 'endpoint': 1}).status_code, 400)
+
+    def test_create_and_send_delivery(self):
+        delivery = self.post('s3-deliveries/', {'bucket': 1, 'from_user': 1, 'to_user': 2,
+                                                'user_message': 'Hello'}).json()
+        self.assertEqual(delivery['state'], 0)
+
+        sent = self.post('s3-deliveries/{}/send/'.format(delivery['id']), {})
+        self.assertEqual(sent.json()['state'], 1)
+        self.assertEqual(self.get('s3-deliveries/{}/'.format(delivery['id'])).json(), sent.json())
+        self.assertEqual(self.post('s3-deliveries/{}/send/'.format(delivery['id']), {}).status_code, 400)
+        self.assertEqual(self.post('s3-deliveries/{}/send/?force=true'.format(delivery['id']), {}).status_code, 200)
+        self.assertEqual(self.post('s3-deliveries/99/send/', {}).status_code, 404)
+
+    def test_etag(self):
+        delivery = self.post('s3-deliveries/', {'bucket': 1, 'from_user': 1, 'to_user': 2,
+                                                'user_message': 'Hello'}).json()
+        url = self.server.url + 's3-deliveries/{}/'.format(delivery['id'])
+        etag = self.get('s3-deliveries/{}/'.format(delivery['id'])).headers['ETag']
+        headers = dict(self.headers, **{'If-None-Match': etag})
+        not_modified = requests.get(url, headers=headers)
+        self.assertEqual((not_modified.status_code, not_modified.content), (304, b''))
+
+        self.server.set_delivery_state(delivery['id'], DELIVERY_STATE_DECLINED, 'No thanks')
+        modified = requests.get(url, headers=headers)
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual((modified.json()['state'], modified.json()['decline_reason']),
+                         (DELIVERY_STATE_DECLINED, 'No thanks'))
+        self.assertNotEqual(modified.headers['ETag'], etag)
+
+    def test_request_counts(self):
+        self.get('s3-deliveries/1/')
+        self.get('s3-deliveries/2/')
+        self.get('users/current-user/')
+        self.assertEqual(self.server.request_counts, {'GET s3-deliveries/{id}/': 2, 'GET users/current-user/': 1})
+        self.assertEqual(self.server.total_requests, 3)
+        self.server.reset_request_counts()
+        self.assertEqual(self.server.total_requests, 0)
+
+    def test_latency(self):
+        self.server.latency = 0.1
+        start = time.time()
+        self.get('users/current-user/')
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+    def test_error_rate(self):
+        self.server.error_rate = 1.0
+        response = self.get('users/current-user/')
+        self.assertEqual(response.status_code, 503)
+
+    def test_rate_limit(self):
+        self.server.rate_limit = 2
+        status_codes = [self.get('users/current-user/').status_code for _ in range(3)]
+        self.assertEqual(status_codes, [200, 200, 429])
+        self.assertEqual(self.get('users/current-user/').headers['Retry-After'], '1')
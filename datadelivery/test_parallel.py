@@ -0,0 +1,44 @@
+from __future__ import absolute_import
+import threading
+import time
+from unittest import TestCase
+from datadelivery.parallel import run_in_parallel
+
+
+class RunInParallelTestCase(TestCase):
+    def test_returns_results_in_order(self):
+        self.assertEqual(run_in_parallel(lambda: 1, lambda: 2, lambda: 3), [1, 2, 3])
+
+    def test_no_functions(self):
+        self.assertEqual(run_in_parallel(), [])
+
+    def test_functions_run_at_the_same_time(self):
+        barrier_count = [0]
+        lock = threading.Lock()
+        all_started = threading.Event()
+
+        def wait_for_others():
+            with lock:
+                barrier_count[0] += 1
+                if barrier_count[0] == 3:
+                    all_started.set()
+            return all_started.wait(5)
+
+        self.assertEqual(run_in_parallel(wait_for_others, wait_for_others, wait_for_others), [True, True, True])
+
+    def test_reraises_first_error_after_all_finish(self):
+        finished = []
+
+        def slow():
+            time.sleep(0.05)
+            finished.append('slow')
+
+        def fail(message):
+            def raise_error():
+                raise ValueError(message)
+            return raise_error
+
+        with self.assertRaises(ValueError) as raised:
+            run_in_parallel(slow, fail('first'), fail('second'))
+        self.assertEqual(str(raised.exception), 'first')
+        self.assertEqual(finished, ['slow'])
@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from datadelivery.config import Config
+from datadelivery.manifest import ManifestRow
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN
+from datadelivery.plan import DeliveryPlan
+from datadelivery.s3 import S3
+
+
+class DeliveryPlanTestCase(TestCase):
+    def setUp(self):
+        self.rows = [
+            ManifestRow(1, 'bucket1', 'joe@joe.com'),
+            ManifestRow(2, 'bucket1', 'bob@bob.com', resend=True),
+            ManifestRow(3, 'bucket2', 'joe@joe.com'),
+        ]
+
+    def test_dedupes_recipients_and_buckets(self):
+        plan = DeliveryPlan(self.rows)
+        self.assertEqual(plan.emails, ['joe@joe.com', 'bob@bob.com'])
+        self.assertEqual(plan.bucket_names, ['bucket1', 'bucket2'])
+        self.assertEqual(plan.min_request_count, 3 + 2 + 2 + 6)
+        self.assertEqual(plan.max_request_count, 3 + 2 + 2 + 6 + 2)
+        self.assertEqual(plan.naive_request_count, 21)
+
+    def test_format(self):
+        self.assertEqual(DeliveryPlan(self.rows).format().split('\n'), [
+            'Identity lookups: 3',
+            '  GET s3-endpoints/, GET users/current-user/, GET s3-users/',
+            'Recipient lookups: 2',
+            '  GET s3-users/ email=joe@joe.com',
+            '  GET s3-users/ email=bob@bob.com',
+            'Bucket lookups: 2',
+            '  GET s3-buckets/ name=bucket1 (POST s3-buckets/ if missing)',
+            '  GET s3-buckets/ name=bucket2 (POST s3-buckets/ if missing)',
+            'Deliveries: 3',
+            '  row 1: POST s3-deliveries/ bucket1 -> joe@joe.com, POST s3-deliveries/{id}/send/',
+            '  row 2: POST s3-deliveries/ bucket1 -> bob@bob.com, POST s3-deliveries/{id}/send/ (force)',
+            '  row 3: POST s3-deliveries/ bucket2 -> joe@joe.com, POST s3-deliveries/{id}/send/',
+            'Total requests: 13 - 15 (separate deliver commands: 21)',
+        ])
+
+
+class DeliveryPlanExecuteTestCase(TestCase):
+    def setUp(self):
+        self.server = MockD4S2Server().start()
+        self.server.add_recipient('joe@joe.com')
+        self.server.add_recipient('bob@bob.com')
+        self.server.add_bucket('bucket1')
+        config = Config({'token': DEFAULT_TOKEN, 'url': self.server.url, 'identity_cache_ttl': 0})
+        self.s3 = S3(config, user_agent_str='test')
+
+    def tearDown(self):
+        self.s3.close()
+        self.server.stop()
+
+    def test_execute_makes_planned_requests(self):
+        rows = [ManifestRow(idx + 1, 'bucket{}'.format(idx % 2 + 1), email)
+                for idx, email in enumerate(['joe@joe.com', 'bob@bob.com'] * 20)]
+        plan = DeliveryPlan(rows)
+
+        results = plan.execute(self.s3, num_workers=4)
+
+        self.assertTrue(all(result.succeeded for result in results))
+        self.assertEqual([result.row for result in results], rows)
+        self.assertEqual(self.server.total_requests, plan.min_request_count + 1)
+        self.assertEqual(self.server.request_counts['POST s3-buckets/'], 1)
+        self.assertEqual(self.server.request_counts['POST s3-deliveries/{id}/send/'], 40)
+
+    def test_execute_fails_rows_with_unknown_recipient(self):
+        rows = [ManifestRow(1, 'bucket1', 'tom@tom.com'), ManifestRow(2, 'bucket1', 'joe@joe.com'),
+                ManifestRow(3, 'bucket1', 'tom@tom.com')]
+
+        results = DeliveryPlan(rows).execute(self.s3, num_workers=2)
+
+        self.assertEqual([result.succeeded for result in results], [False, True, False])
+        self.assertIn('tom@tom.com', str(results[0].error))
+        self.assertEqual(self.server.request_counts['GET s3-users/'], 3)
@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from six import StringIO
+from datadelivery.profiling import StackSampler, profiling
+
+
+def wait_in_worker(stop_event):
+    stop_event.wait(5)
+
+
+class StackSamplerTestCase(TestCase):
+    def test_sample(self):
+        sampler = StackSampler()
+        frame = sys._getframe()
+
+        sampler.sample('MainThread', frame)
+        sampler.sample('MainThread', frame)
+
+        self.assertEqual(len(sampler.counts), 1)
+        stack, count = list(sampler.counts.items())[0]
+        self.assertEqual(count, 2)
+        self.assertTrue(stack.startswith('MainThread;'))
+        self.assertTrue(stack.endswith(';test_sample (test_profiling.py:{})'.format(
+            StackSamplerTestCase.test_sample.__code__.co_firstlineno)))
+
+    def test_write_collapsed(self):
+        sampler = StackSampler()
+        sampler.counts = {'MainThread;main (a.py:1);run (b.py:2)': 3, 'MainThread;main (a.py:1)': 1}
+        stream = StringIO()
+
+        sampler.write_collapsed(stream)
+
+        self.assertEqual(stream.getvalue(), 'MainThread;main (a.py:1) 1\nMainThread;main (a.py:1);run (b.py:2) 3\n')
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.temp_dir, 'profile')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_profiling_writes_files_and_summary(self):
+        stop_event = threading.Event()
+        worker = threading.Thread(target=wait_in_worker, args=(stop_event,), name='Worker')
+        summary = StringIO()
+
+        with profiling(self.prefix, summary):
+            worker.start()
+            time.sleep(0.1)
+            stop_event.set()
+            worker.join()
+
+        stats = pstats.Stats(self.prefix + '.pstats')
+        self.assertIn('sleep', ' '.join(name for _, _, name in stats.stats))
+        with open(self.prefix + '.collapsed') as infile:
+            collapsed = infile.read()
+        # the sampler sees threads that cProfile does not
+        self.assertIn('Worker;', collapsed)
+        self.assertIn('wait_in_worker (test_profiling.py:', collapsed)
+        self.assertIn('cumulative', summary.getvalue())
+        self.assertIn(self.prefix + '.collapsed', summary.getvalue())
@@ -0,0 +1,82 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+from mock import patch
+from datadelivery.ratelimit import RateLimiter, fcntl
+
+
+class RateLimiterTestCase(TestCase):
+    @patch('datadelivery.ratelimit.time')
+    def test_burst_then_limited(self, mock_time):
+        mock_time.time.return_value = 100.0
+        rate_limiter = RateLimiter(rate=2, burst=3)
+        self.assertEqual([rate_limiter.reserve() for _ in range(5)], [0.0, 0.0, 0.0, 0.5, 1.0])
+
+    @patch('datadelivery.ratelimit.time')
+    def test_tokens_refill_up_to_burst(self, mock_time):
+        mock_time.time.return_value = 100.0
+        rate_limiter = RateLimiter(rate=2, burst=2)
+        rate_limiter.reserve()
+        rate_limiter.reserve()
+        mock_time.time.return_value = 100.5
+        self.assertEqual(rate_limiter.reserve(), 0.0)
+        self.assertEqual(rate_limiter.reserve(), 0.5)
+        mock_time.time.return_value = 200.0
+        self.assertEqual([rate_limiter.reserve() for _ in range(3)], [0.0, 0.0, 0.5])
+
+    def test_burst_defaults_to_one_second_of_requests(self):
+        self.assertEqual(RateLimiter(rate=5).burst, 5.0)
+        self.assertEqual(RateLimiter(rate=0.2).burst, 1.0)
+
+    @patch('datadelivery.ratelimit.time')
+    def test_acquire_sleeps_for_reserved_token(self, mock_time):
+        mock_time.time.return_value = 100.0
+        rate_limiter = RateLimiter(rate=4, burst=1)
+        self.assertEqual(rate_limiter.acquire(), 0.0)
+        self.assertEqual(rate_limiter.acquire(), 0.25)
+        mock_time.sleep.assert_called_once_with(0.25)
+
+
+@skipIf(fcntl is None, 'requires fcntl')
+class SharedRateLimiterTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.state_filename = os.path.join(self.temp_dir, 'ratelimit.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @patch('datadelivery.ratelimit.time')
+    def test_limiters_share_state_file(self, mock_time):
+        mock_time.time.return_value = 100.0
+        first = RateLimiter(rate=2, burst=2, state_filename=self.state_filename)
+        second = RateLimiter(rate=2, burst=2, state_filename=self.state_filename)
+        self.assertEqual([first.reserve(), second.reserve(), first.reserve(), second.reserve()],
+                         [0.0, 0.0, 0.5, 1.0])
+
+    @patch('datadelivery.ratelimit.time')
+    def test_corrupt_state_file_starts_full(self, mock_time):
+        mock_time.time.return_value = 100.0
+        with open(self.state_filename, 'w') as stream:
+            stream.write('not json')
+        rate_limiter = RateLimiter(rate=1, burst=2, state_filename=self.state_filename)
+        self.assertEqual([rate_limiter.reserve() for _ in range(3)], [0.0, 0.0, 1.0])
+
+    def test_limit_across_processes(self):
+        from multiprocessing import Process
+        processes = [Process(target=_reserve_tokens, args=(self.state_filename, 5)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        # 20 reservations with a burst of 10 leave the bucket about 10 tokens in debt
+        rate_limiter = RateLimiter(rate=1, burst=10, state_filename=self.state_filename)
+        self.assertGreater(rate_limiter.reserve(), 5.0)
+
+
+def _reserve_tokens(state_filename, count):
+    rate_limiter = RateLimiter(rate=1, burst=10, state_filename=state_filename)
+    for _ in range(count):
+        rate_limiter.reserve()
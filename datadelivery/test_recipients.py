@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+import threading
+from unittest import TestCase
+from mock import MagicMock, patch, call
+from datadelivery.recipients import RecipientLookup
+from datadelivery.s3 import NotFoundException, S3Exception
+
+
+class RecipientLookupTestCase(TestCase):
+    def setUp(self):
+        self.s3 = MagicMock()
+        self.s3.get_s3user_by_email.side_effect = lambda email: MagicMock(email=email)
+
+    def test_found_user_is_cached(self):
+        lookup = RecipientLookup(self.s3)
+        s3user = lookup.get_s3user_by_email('joe@joe.com')
+        self.assertEqual(s3user.email, 'joe@joe.com')
+        self.assertEqual(lookup.get_s3user_by_email('joe@joe.com'), s3user)
+        self.s3.get_s3user_by_email.assert_called_once_with('joe@joe.com')
+
+    def test_uses_s3_passed_to_lookup(self):
+        other_s3 = MagicMock()
+        lookup = RecipientLookup(self.s3)
+        self.assertEqual(lookup.get_s3user_by_email('joe@joe.com', other_s3),
+                         other_s3.get_s3user_by_email.return_value)
+        self.s3.get_s3user_by_email.assert_not_called()
+
+    def test_not_found_is_cached(self):
+        self.s3.get_s3user_by_email.side_effect = NotFoundException('No s3 user found with email tom@tom.com')
+        lookup = RecipientLookup(self.s3)
+        for _ in range(2):
+            with self.assertRaises(NotFoundException) as raised_exception:
+                lookup.get_s3user_by_email('tom@tom.com')
+            self.assertEqual(str(raised_exception.exception), 'No s3 user found with email tom@tom.com')
+        self.s3.get_s3user_by_email.assert_called_once_with('tom@tom.com')
+
+    def test_not_found_is_not_cached_when_negative_ttl_zero(self):
+        self.s3.get_s3user_by_email.side_effect = NotFoundException('missing')
+        lookup = RecipientLookup(self.s3, negative_ttl=0)
+        for _ in range(2):
+            with self.assertRaises(NotFoundException):
+                lookup.get_s3user_by_email('tom@tom.com')
+        self.assertEqual(self.s3.get_s3user_by_email.call_count, 2)
+
+    def test_other_errors_are_not_cached(self):
+        self.s3.get_s3user_by_email.side_effect = [S3Exception('Service unavailable'), MagicMock()]
+        lookup = RecipientLookup(self.s3)
+        with self.assertRaises(S3Exception):
+            lookup.get_s3user_by_email('joe@joe.com')
+        lookup.get_s3user_by_email('joe@joe.com')
+        self.assertEqual(self.s3.get_s3user_by_email.call_count, 2)
+
+    @patch('datadelivery.recipients.time')
+    def test_entries_expire(self, mock_time):
+        mock_time.time.return_value = 1000
+        lookup = RecipientLookup(self.s3, ttl=300)
+        lookup.get_s3user_by_email('joe@joe.com')
+        mock_time.time.return_value = 1299
+        lookup.get_s3user_by_email('joe@joe.com')
+        self.assertEqual(self.s3.get_s3user_by_email.call_count, 1)
+        mock_time.time.return_value = 1300
+        lookup.get_s3user_by_email('joe@joe.com')
+        self.assertEqual(self.s3.get_s3user_by_email.call_count, 2)
+
+    def test_least_recently_used_is_evicted(self):
+        lookup = RecipientLookup(self.s3, max_size=2)
+        lookup.get_s3user_by_email('a@a.com')
+        lookup.get_s3user_by_email('b@b.com')
+        lookup.get_s3user_by_email('a@a.com')
+        lookup.get_s3user_by_email('c@c.com')
+        lookup.get_s3user_by_email('a@a.com')
+        lookup.get_s3user_by_email('b@b.com')
+        self.s3.get_s3user_by_email.assert_has_calls([
+            call('a@a.com'), call('b@b.com'), call('c@c.com'), call('b@b.com')])
+        self.assertEqual(self.s3.get_s3user_by_email.call_count, 4)
+
+    def test_concurrent_lookups_share_one_request(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_lookup(email):
+            started.set()
+            release.wait()
+            return MagicMock(email=email)
+        self.s3.get_s3user_by_email.side_effect = slow_lookup
+        lookup = RecipientLookup(self.s3)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(lookup.get_s3user_by_email('joe@joe.com')))
+                   for _ in range(5)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(set(id(result) for result in results)), 1)
+        self.s3.get_s3user_by_email.assert_called_once_with('joe@joe.com')
+
+    def test_prefetch_looks_up_distinct_uncached_emails(self):
+        lookup = RecipientLookup(self.s3)
+        lookup.get_s3user_by_email('a@a.com')
+        lookup.prefetch(['a@a.com', 'b@b.com', 'c@c.com', 'b@b.com'])
+        self.assertEqual(sorted(args[0][0] for args in self.s3.get_s3user_by_email.call_args_list),
+                         ['a@a.com', 'b@b.com', 'c@c.com'])
+        lookup.get_s3user_by_email('c@c.com')
+        self.assertEqual(self.s3.get_s3user_by_email.call_count, 3)
+
+    def test_prefetch_ignores_errors(self):
+        self.s3.get_s3user_by_email.side_effect = S3Exception('Service unavailable')
+        lookup = RecipientLookup(self.s3)
+        lookup.prefetch(['a@a.com'])
+        with self.assertRaises(S3Exception):
+            lookup.get_s3user_by_email('a@a.com')
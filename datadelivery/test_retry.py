@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from mock import MagicMock, patch
+from datadelivery.retry import RetryPolicy, RetryBudget, parse_retry_after
+
+
+class RetryPolicyTestCase(TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(max_attempts=3, backoff_base=1.0)
+
+    def make_response(self, status_code, retry_after=None):
+        headers = {}
+        if retry_after is not None:
+            headers['Retry-After'] = retry_after
+        return MagicMock(status_code=status_code, headers=headers)
+
+    @patch('datadelivery.retry.random')
+    def test_connection_error_uses_exponential_backoff_with_jitter(self, mock_random):
+        mock_random.uniform.side_effect = lambda low, high: high
+        self.assertEqual(self.policy.get_retry_delay(1, retry_safe=True), 1.0)
+        self.assertEqual(self.policy.get_retry_delay(2, retry_safe=True), 2.0)
+        mock_random.uniform.assert_called_with(0, 2.0)
+
+    def test_gives_up_after_max_attempts(self):
+        self.assertEqual(self.policy.get_retry_delay(3, retry_safe=True), None)
+
+    def test_not_retry_safe(self):
+        self.assertEqual(self.policy.get_retry_delay(1, retry_safe=False), None)
+        self.assertEqual(self.policy.get_retry_delay(1, retry_safe=False, response=self.make_response(503)), None)
+
+    def test_retryable_status_codes(self):
+        for status_code in [429, 502, 503, 504]:
+            self.assertIsNotNone(self.policy.get_retry_delay(1, True, self.make_response(status_code)))
+        for status_code in [200, 400, 401, 404, 500]:
+            self.assertIsNone(self.policy.get_retry_delay(1, True, self.make_response(status_code)))
+
+    def test_honors_retry_after(self):
+        self.assertEqual(self.policy.get_retry_delay(1, True, self.make_response(429, '7')), 7.0)
+
+    def test_retry_after_too_long_gives_up(self):
+        self.assertEqual(self.policy.get_retry_delay(1, True, self.make_response(503, '3600')), None)
+
+    def test_budget_exhausted(self):
+        policy = RetryPolicy(max_attempts=3, budget=RetryBudget(ratio=0, min_retries=1))
+        self.assertIsNotNone(policy.get_retry_delay(1, retry_safe=True))
+        self.assertIsNone(policy.get_retry_delay(1, retry_safe=True))
+
+
+class RetryBudgetTestCase(TestCase):
+    def test_retries_grow_with_requests(self):
+        budget = RetryBudget(ratio=0.5, min_retries=0)
+        self.assertFalse(budget.try_spend())
+        budget.record_request()
+        budget.record_request()
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+
+
+class ParseRetryAfterTestCase(TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after('120'), 120.0)
+
+    def test_missing_or_invalid(self):
+        self.assertEqual(parse_retry_after(None), None)
+        self.assertEqual(parse_retry_after('soon'), None)
+
+    @patch('datadelivery.retry.time')
+    def test_http_date(self, mock_time):
+        mock_time.time.return_value = 784111767  # Sun, 06 Nov 1994 08:49:27 GMT
+        self.assertEqual(parse_retry_after('Sun, 06 Nov 1994 08:49:37 GMT'), 10)
+        self.assertEqual(parse_retry_after('Sun, 06 Nov 1994 08:49:17 GMT'), 0)
@@ -1,12 +1,17 @@
 from __future__ import absolute_import
 from unittest import TestCase
+import requests
 from mock import MagicMock, patch, call
-from datadelivery.s3 import S3, NotFoundException
+from datadelivery.adaptive import AdaptiveConcurrency
+from datadelivery.s3 import S3, NotFoundException, S3Exception, DeadlineExceededException, should_invalidate_identity
 
 
 class S3TestCase(TestCase):
     def setUp(self):
-        self.config = MagicMock(endpoint_name='main_endpoint', url='someurl/', token='secret')
+        self.config = MagicMock(endpoint_name='main_endpoint', url='someurl/', token='secret',
+                                retry_max_attempts=3, retry_backoff=0.5, connect_timeout=10, read_timeout=60,
+                                deliver_deadline=None)
+        self.expected_timeout = (10, 60)
         self.user_agent_str = 'tool/1.0'
         self.current_user_id = 111
         self.current_s3user_id = 222
@@ -40,13 +45,24 @@ class S3TestCase(TestCase):
         }
 
     def setup_get_responses(self, mock_method, *args):
-        base_responses = [
-            self.current_endpoint_response,
-            self.current_user_response,
-            self.s3user_for_current_user,
-        ]
-        base_responses.extend(args)
-        self.setup_responses(mock_method, base_responses)
+        """
+        Respond to the current endpoint and user lookups based on url, other requests receive args in order.
+        """
+        base_responses = {
+            'someurl/s3-endpoints/?name=main_endpoint': self.current_endpoint_response,
+            'someurl/users/current-user/': self.current_user_response,
+            'someurl/s3-users/?endpoint=123&user=222': self.s3user_for_current_user,
+        }
+        other_responses = list(args)
+
+        def get_response(url, **kwargs):
+            mock_get_response = MagicMock()
+            if url in base_responses:
+                mock_get_response.json.return_value = base_responses[url]
+            else:
+                mock_get_response.json.return_value = other_responses.pop(0)
+            return mock_get_response
+        mock_method.side_effect = get_response
 
     def setup_responses(self, mock_method, get_responses):
         get_side_effects = []
@@ -57,8 +73,15 @@ class S3TestCase(TestCase):
         mock_method.side_effect = get_side_effects
 
     @patch('datadelivery.s3.requests')
-    def test_constructor_finds_current_endpoint_and_user(self, mock_requests):
-        self.setup_get_responses(mock_requests.get)
+    def test_constructor_makes_no_requests(self, mock_requests):
+        S3(self.config, self.user_agent_str)
+
+        mock_requests.Session.return_value.get.assert_not_called()
+        mock_requests.Session.return_value.post.assert_not_called()
+
+    @patch('datadelivery.s3.requests')
+    def test_current_endpoint_and_user_fetched_on_first_use(self, mock_requests):
+        self.setup_get_responses(mock_requests.Session.return_value.get)
 
         s3 = S3(self.config, self.user_agent_str)
 
@@ -71,12 +94,133 @@ class S3TestCase(TestCase):
         self.assertEqual(s3.current_s3user.email, 'joe@joe.com')
         self.assertEqual(s3.current_s3user.type, 'Normal')
 
-        mock_requests.get.assert_has_calls([
-            call('someurl/s3-endpoints/?name=main_endpoint', headers=self.expected_headers),
-            call('someurl/users/current-user/', headers=self.expected_headers),
-            call('someurl/s3-users/?endpoint=123&user=222', headers=self.expected_headers),
+        mock_requests.Session.return_value.get.assert_has_calls([
+            call('someurl/s3-endpoints/?name=main_endpoint',
+                 headers=self.expected_headers, timeout=self.expected_timeout),
+            call('someurl/users/current-user/', headers=self.expected_headers, timeout=self.expected_timeout),
+            call('someurl/s3-users/?endpoint=123&user=222',
+                 headers=self.expected_headers, timeout=self.expected_timeout),
+        ])
+
+        s3.current_endpoint
+        s3.current_s3user
+        self.assertEqual(mock_requests.Session.return_value.get.call_count, 3)
+
+    @patch('datadelivery.s3.requests')
+    def test_current_endpoint_and_user_from_identity_cache(self, mock_requests):
+        mock_identity_cache = MagicMock()
+        mock_identity_cache.get.side_effect = lambda key, name: {
+            'endpoint': self.current_endpoint_response[0],
+            's3user': self.s3user_for_current_user[0],
+        }[name]
+
+        s3 = S3(self.config, self.user_agent_str, identity_cache=mock_identity_cache)
+
+        self.assertEqual(s3.current_endpoint.id, self.current_endpoint_id)
+        self.assertEqual(s3.current_s3user.id, self.current_s3user_id)
+        mock_identity_cache.make_key.assert_called_with('someurl/', 'main_endpoint', 'secret')
+        mock_identity_cache.put.assert_not_called()
+        mock_requests.Session.return_value.get.assert_not_called()
+
+    @patch('datadelivery.s3.requests')
+    def test_current_endpoint_and_user_saved_in_identity_cache(self, mock_requests):
+        self.setup_get_responses(mock_requests.Session.return_value.get)
+        mock_identity_cache = MagicMock()
+        mock_identity_cache.get.return_value = None
+
+        s3 = S3(self.config, self.user_agent_str, identity_cache=mock_identity_cache)
+        s3.current_s3user
+
+        key = mock_identity_cache.make_key.return_value
+        mock_identity_cache.put.assert_has_calls([
+            call(key, 'endpoint', self.current_endpoint_response[0]),
+            call(key, 's3user', self.s3user_for_current_user[0]),
+        ])
+
+    @patch('datadelivery.s3.requests')
+    def test_unauthorized_response_invalidates_identity_cache(self, mock_requests):
+        mock_requests.HTTPError = ValueError
+        mock_response = MagicMock(status_code=401, text='Invalid token.')
+        mock_response.raise_for_status.side_effect = ValueError()
+        mock_requests.Session.return_value.get.return_value = mock_response
+        mock_identity_cache = MagicMock()
+
+        s3 = S3(self.config, self.user_agent_str, identity_cache=mock_identity_cache)
+        with self.assertRaises(S3Exception) as raised:
+            s3.get_bucket_by_name('mybucket')
+
+        self.assertEqual(raised.exception.status_code, 401)
+        mock_identity_cache.invalidate.assert_called_with(mock_identity_cache.make_key.return_value)
+
+    @patch('datadelivery.s3.requests')
+    def test_missing_delivery_keeps_identity_cache(self, mock_requests):
+        mock_requests.HTTPError = ValueError
+        mock_response = MagicMock(status_code=404, text='Not found.')
+        mock_response.raise_for_status.side_effect = ValueError()
+        mock_requests.Session.return_value.get.return_value = mock_response
+        mock_requests.Session.return_value.post.return_value = mock_response
+        mock_identity_cache = MagicMock()
+
+        s3 = S3(self.config, self.user_agent_str, identity_cache=mock_identity_cache)
+        with self.assertRaises(S3Exception):
+            s3.get_delivery(888)
+        with self.assertRaises(S3Exception):
+            s3.send_delivery(MagicMock(id=888), force=True)
+
+        mock_identity_cache.invalidate.assert_not_called()
+
+    @patch('datadelivery.s3.requests')
+    def test_identity_not_found_invalidates_identity_cache(self, mock_requests):
+        mock_requests.HTTPError = ValueError
+        mock_response = MagicMock(status_code=404, text='Not found.')
+        mock_response.raise_for_status.side_effect = ValueError()
+        mock_requests.Session.return_value.get.return_value = mock_response
+        mock_identity_cache = MagicMock()
+
+        s3 = S3(self.config, self.user_agent_str, identity_cache=mock_identity_cache)
+        with self.assertRaises(S3Exception):
+            s3.get_current_user()
+
+        mock_identity_cache.invalidate.assert_called_with(mock_identity_cache.make_key.return_value)
+
+    def test_should_invalidate_identity(self):
+        self.assertTrue(should_invalidate_identity('GET', 's3-deliveries/888/', 401))
+        self.assertTrue(should_invalidate_identity('GET', 's3-users/?endpoint=1&email=bob@bob.com', 404))
+        self.assertTrue(should_invalidate_identity('POST', 's3-buckets/', 404))
+        self.assertFalse(should_invalidate_identity('GET', 's3-deliveries/888/', 404))
+        self.assertFalse(should_invalidate_identity('POST', 's3-deliveries/888/send/?force=true', 404))
+        self.assertFalse(should_invalidate_identity('GET', 's3-users/?endpoint=1', 500))
+
+    @patch('datadelivery.s3.requests')
+    def test_constructor_creates_pooled_session(self, mock_requests):
+        self.config.http_pool_size = 5
+        self.setup_get_responses(mock_requests.Session.return_value.get)
+
+        s3 = S3(self.config, self.user_agent_str)
+
+        self.assertEqual(s3.session, mock_requests.Session.return_value)
+        mock_requests.adapters.HTTPAdapter.assert_called_with(pool_connections=5, pool_maxsize=5)
+        mock_adapter = mock_requests.adapters.HTTPAdapter.return_value
+        s3.session.mount.assert_has_calls([
+            call('https://', mock_adapter),
+            call('http://', mock_adapter),
         ])
 
+    @patch('datadelivery.s3.requests')
+    def test_constructor_reuses_session(self, mock_requests):
+        mock_session = MagicMock()
+        self.setup_get_responses(mock_session.get)
+
+        s3 = S3(self.config, self.user_agent_str, session=mock_session)
+        s3.current_s3user
+        s3.close()
+
+        self.assertEqual(s3.session, mock_session)
+        mock_requests.Session.assert_not_called()
+        self.assertEqual(mock_session.get.call_count, 3)
+        mock_requests.get.assert_not_called()
+        mock_session.close.assert_called_with()
+
     @patch('datadelivery.s3.requests')
     def test_get_s3user_by_email(self, mock_requests):
         response = [
@@ -88,7 +232,7 @@ class S3TestCase(TestCase):
                 'type': 'Normal'
             }
         ]
-        self.setup_get_responses(mock_requests.get, response)
+        self.setup_get_responses(mock_requests.Session.return_value.get, response)
 
         s3 = S3(self.config, self.user_agent_str)
         s3user = s3.get_s3user_by_email('bob@bob.com')
@@ -99,20 +243,22 @@ class S3TestCase(TestCase):
         self.assertEqual(s3user.email, 'bob@bob.com')
         self.assertEqual(s3user.type, 'Normal')
 
-        mock_requests.get.assert_has_calls([
-            call('someurl/s3-users/?endpoint=123&email=bob@bob.com', headers=self.expected_headers),
+        mock_requests.Session.return_value.get.assert_has_calls([
+            call('someurl/s3-users/?endpoint=123&email=bob@bob.com',
+                 headers=self.expected_headers, timeout=self.expected_timeout),
         ])
 
     @patch('datadelivery.s3.requests')
     def test_get_user_by_email_not_found(self, mock_requests):
-        self.setup_get_responses(mock_requests.get, [])
+        self.setup_get_responses(mock_requests.Session.return_value.get, [])
 
         s3 = S3(self.config, self.user_agent_str)
         with self.assertRaises(NotFoundException):
             s3.get_s3user_by_email('tom@tom.com')
 
-        mock_requests.get.assert_has_calls([
-            call('someurl/s3-users/?endpoint=123&email=tom@tom.com', headers=self.expected_headers),
+        mock_requests.Session.return_value.get.assert_has_calls([
+            call('someurl/s3-users/?endpoint=123&email=tom@tom.com',
+                 headers=self.expected_headers, timeout=self.expected_timeout),
         ])
 
     @patch('datadelivery.s3.requests')
@@ -125,7 +271,7 @@ class S3TestCase(TestCase):
                 'endpoint': self.current_endpoint_id
             }
         ]
-        self.setup_get_responses(mock_requests.get, response)
+        self.setup_responses(mock_requests.Session.return_value.get, [response])
 
         s3 = S3(self.config, self.user_agent_str)
         s3_bucket = s3.get_bucket_by_name('some_bucket')
@@ -135,26 +281,26 @@ class S3TestCase(TestCase):
         self.assertEqual(s3_bucket.owner, 2)
         self.assertEqual(s3_bucket.endpoint, self.current_endpoint_id)
 
-        mock_requests.get.assert_has_calls([
-            call('someurl/s3-buckets/?name=some_bucket', headers=self.expected_headers),
+        mock_requests.Session.return_value.get.assert_has_calls([
+            call('someurl/s3-buckets/?name=some_bucket', headers=self.expected_headers, timeout=self.expected_timeout),
         ])
 
     @patch('datadelivery.s3.requests')
     def test_get_bucket_by_name_not_found(self, mock_requests):
-        self.setup_get_responses(mock_requests.get, [])
+        self.setup_responses(mock_requests.Session.return_value.get, [[]])
 
         s3 = S3(self.config, self.user_agent_str)
         with self.assertRaises(NotFoundException):
             s3.get_bucket_by_name('otherBucket')
 
-        mock_requests.get.assert_has_calls([
-            call('someurl/s3-buckets/?name=otherBucket', headers=self.expected_headers),
+        mock_requests.Session.return_value.get.assert_has_calls([
+            call('someurl/s3-buckets/?name=otherBucket', headers=self.expected_headers, timeout=self.expected_timeout),
         ])
 
     @patch('datadelivery.s3.requests')
     def test_create_bucket(self, mock_requests):
-        self.setup_get_responses(mock_requests.get)
-        self.setup_responses(mock_requests.post, [
+        self.setup_get_responses(mock_requests.Session.return_value.get)
+        self.setup_responses(mock_requests.Session.return_value.post, [
             {
                 'id': 333,
                 'name': 'mybucket',
@@ -176,14 +322,15 @@ class S3TestCase(TestCase):
             'endpoint': self.current_endpoint_id,
             'name': 'mybucket'
         }
-        mock_requests.post.assert_has_calls([
-            call('someurl/s3-buckets/', headers=self.expected_headers, json=expected_json),
+        mock_requests.Session.return_value.post.assert_has_calls([
+            call('someurl/s3-buckets/',
+                 headers=self.expected_headers, timeout=self.expected_timeout, json=expected_json),
         ])
 
     @patch('datadelivery.s3.requests')
     def test_create_delivery_and_send(self, mock_requests):
-        self.setup_get_responses(mock_requests.get)
-        self.setup_responses(mock_requests.post, [
+        self.setup_get_responses(mock_requests.Session.return_value.get)
+        self.setup_responses(mock_requests.Session.return_value.post, [
             {
                 'id': 888,
                 'bucket': 222,
@@ -220,14 +367,15 @@ class S3TestCase(TestCase):
             'to_user': 444,
             'user_message': 'Testing',
         }
-        mock_requests.post.assert_has_calls([
-            call('someurl/s3-deliveries/', headers=self.expected_headers, json=expected_json),
+        mock_requests.Session.return_value.post.assert_has_calls([
+            call('someurl/s3-deliveries/',
+                 headers=self.expected_headers, timeout=self.expected_timeout, json=expected_json),
         ])
 
     @patch('datadelivery.s3.requests')
     def test_send_delivery(self, mock_requests):
-        self.setup_get_responses(mock_requests.get)
-        self.setup_responses(mock_requests.post, [
+        self.setup_get_responses(mock_requests.Session.return_value.get)
+        self.setup_responses(mock_requests.Session.return_value.post, [
             {
                 'id': 888,
                 'bucket': 222,
@@ -256,14 +404,141 @@ class S3TestCase(TestCase):
         self.assertEqual(s3_delivery.performed_by, '')
         self.assertEqual(s3_delivery.delivery_email_text, '')
 
-        mock_requests.post.assert_has_calls([
-            call('someurl/s3-deliveries/888/send/', headers=self.expected_headers, json={}),
+        mock_requests.Session.return_value.post.assert_has_calls([
+            call('someurl/s3-deliveries/888/send/',
+                 headers=self.expected_headers, timeout=self.expected_timeout, json={}),
         ])
 
+    @patch('datadelivery.s3.requests')
+    def test_iter_buckets_follows_next_page(self, mock_requests):
+        bucket = {'id': 1, 'name': 'mybucket', 'owner': 222, 'endpoint': 123}
+        pages = [
+            {'count': 3, 'next': 'someurl/s3-buckets/?page=2&page_size=2', 'results': [bucket, bucket]},
+            {'count': 3, 'next': None, 'results': [dict(bucket, id=3)]},
+        ]
+        self.setup_responses(mock_requests.Session.return_value.get, pages)
+
+        s3 = S3(self.config, self.user_agent_str)
+        buckets = s3.iter_buckets(owner=222, page_size=2)
+
+        mock_requests.Session.return_value.get.assert_not_called()
+        self.assertEqual([bucket.id for bucket in buckets], [1, 1, 3])
+        mock_requests.Session.return_value.get.assert_has_calls([
+            call('someurl/s3-buckets/?owner=222&page_size=2', headers=self.expected_headers,
+                 timeout=self.expected_timeout),
+            call('someurl/s3-buckets/?page=2&page_size=2', headers=self.expected_headers,
+                 timeout=self.expected_timeout),
+        ], any_order=True)
+
+    @patch('datadelivery.s3.requests')
+    def test_iter_buckets_does_not_follow_next_page_off_config_url(self, mock_requests):
+        bucket = {'id': 1, 'name': 'mybucket', 'owner': 222, 'endpoint': 123}
+        pages = [
+            {'count': 2, 'next': 'http://evil.example.com/api/s3-buckets/?page=2&page_size=1', 'results': [bucket]},
+            {'count': 2, 'next': None, 'results': [dict(bucket, id=2)]},
+        ]
+        self.setup_responses(mock_requests.Session.return_value.get, pages)
+
+        s3 = S3(self.config, self.user_agent_str)
+        self.assertEqual([bucket.id for bucket in s3.iter_buckets(page_size=1)], [1, 2])
+
+        # the token is only sent to config.url, the query string of the link is kept
+        mock_requests.Session.return_value.get.assert_called_with(
+            'someurl/s3-buckets/?page=2&page_size=1', headers=self.expected_headers, timeout=self.expected_timeout)
+
+    @patch('datadelivery.s3.requests')
+    def test_iter_deliveries_unpaginated_list(self, mock_requests):
+        delivery = {'id': 888, 'bucket': 222, 'from_user': 111, 'to_user': 444, 'state': 1, 'user_message': '',
+                    'decline_reason': '', 'performed_by': '', 'delivery_email_text': ''}
+        self.setup_responses(mock_requests.Session.return_value.get, [[delivery]])
+
+        s3 = S3(self.config, self.user_agent_str)
+
+        self.assertEqual([delivery.id for delivery in s3.iter_deliveries(to_user=444)], [888])
+        mock_requests.Session.return_value.get.assert_called_with(
+            'someurl/s3-deliveries/?page_size=100&to_user=444', headers=self.expected_headers,
+            timeout=self.expected_timeout)
+
+    @patch('datadelivery.s3.requests')
+    def test_get_request_saves_response_in_http_cache(self, mock_requests):
+        mock_http_cache = MagicMock()
+        mock_http_cache.get.return_value = None
+        mock_response = MagicMock(status_code=200, headers={'ETag': '"abc"'})
+        mock_response.json.return_value = [{'id': 1}]
+        mock_requests.Session.return_value.get.return_value = mock_response
+
+        data = S3(self.config, self.user_agent_str, http_cache=mock_http_cache)._get_request('s3-buckets/')
+
+        self.assertEqual(data, [{'id': 1}])
+        mock_http_cache.make_key.assert_called_with('someurl/s3-buckets/', 'secret')
+        mock_http_cache.put.assert_called_with(mock_http_cache.make_key.return_value, [{'id': 1}], '"abc"', None)
+        mock_requests.Session.return_value.get.assert_called_with(
+            'someurl/s3-buckets/', headers=self.expected_headers, timeout=self.expected_timeout)
+
+    @patch('datadelivery.s3.requests')
+    def test_get_request_not_modified_uses_http_cache(self, mock_requests):
+        mock_http_cache = MagicMock()
+        mock_http_cache.get.return_value = {
+            'data': [{'id': 1}], 'etag': '"abc"', 'last_modified': 'Tue, 01 Sep 2026 10:00:00 GMT'
+        }
+        mock_requests.Session.return_value.get.return_value = MagicMock(status_code=304)
+
+        data = S3(self.config, self.user_agent_str, http_cache=mock_http_cache)._get_request('s3-buckets/')
+
+        self.assertEqual(data, [{'id': 1}])
+        mock_http_cache.put.assert_not_called()
+        expected_headers = dict(self.expected_headers, **{
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Tue, 01 Sep 2026 10:00:00 GMT',
+        })
+        mock_requests.Session.return_value.get.assert_called_with(
+            'someurl/s3-buckets/', headers=expected_headers, timeout=self.expected_timeout)
+
+    @patch('datadelivery.s3.requests')
+    def test_get_request_bypasses_http_cache(self, mock_requests):
+        mock_http_cache = MagicMock()
+        mock_response = MagicMock(status_code=200, headers={'ETag': '"abc"'})
+        mock_response.json.return_value = [{'id': 1}]
+        mock_requests.Session.return_value.get.return_value = mock_response
+
+        s3 = S3(self.config, self.user_agent_str, http_cache=mock_http_cache)
+        data = s3._get_request('s3-buckets/', use_cache=False)
+
+        self.assertEqual(data, [{'id': 1}])
+        mock_http_cache.get.assert_not_called()
+        mock_http_cache.put.assert_not_called()
+
+    @patch('datadelivery.s3.requests')
+    def test_get_delivery(self, mock_requests):
+        mock_response = MagicMock(status_code=200, headers={'ETag': '"abc"'})
+        mock_response.json.return_value = {
+            'id': 888, 'bucket': 222, 'from_user': 111, 'to_user': 444, 'state': 3, 'user_message': '',
+            'decline_reason': 'No thanks', 'performed_by': '', 'delivery_email_text': '',
+        }
+        mock_requests.Session.return_value.get.return_value = mock_response
+
+        s3_delivery, etag = S3(self.config, self.user_agent_str).get_delivery(888)
+
+        self.assertEqual((s3_delivery.id, s3_delivery.state, s3_delivery.decline_reason), (888, 3, 'No thanks'))
+        self.assertEqual(etag, '"abc"')
+        mock_requests.Session.return_value.get.assert_called_with(
+            'someurl/s3-deliveries/888/', headers=self.expected_headers, timeout=self.expected_timeout)
+
+    @patch('datadelivery.s3.requests')
+    def test_get_delivery_not_modified(self, mock_requests):
+        mock_requests.Session.return_value.get.return_value = MagicMock(status_code=304)
+
+        s3_delivery, etag = S3(self.config, self.user_agent_str).get_delivery(888, etag='"abc"')
+
+        self.assertEqual((s3_delivery, etag), (None, '"abc"'))
+        expected_headers = dict(self.expected_headers, **{'If-None-Match': '"abc"'})
+        mock_requests.Session.return_value.get.assert_called_with(
+            'someurl/s3-deliveries/888/', headers=expected_headers, timeout=self.expected_timeout)
+
     @patch('datadelivery.s3.requests')
     def test_send_delivery_resend(self, mock_requests):
-        self.setup_get_responses(mock_requests.get)
-        self.setup_responses(mock_requests.post, [
+        self.setup_get_responses(mock_requests.Session.return_value.get)
+        self.setup_responses(mock_requests.Session.return_value.post, [
             {
                 'id': 888,
                 'bucket': 222,
@@ -283,10 +558,251 @@ class S3TestCase(TestCase):
             force=True
         )
 
-        mock_requests.post.assert_has_calls([
-            call('someurl/s3-deliveries/888/send/?force=true', headers=self.expected_headers, json={}),
+        mock_requests.Session.return_value.post.assert_has_calls([
+            call('someurl/s3-deliveries/888/send/?force=true',
+                 headers=self.expected_headers, timeout=self.expected_timeout, json={}),
         ])
 
+    @patch('datadelivery.retry.RetryPolicy.sleep')
+    @patch('datadelivery.s3.requests')
+    def test_get_retries_unavailable_response(self, mock_requests, mock_sleep):
+        mock_unavailable = MagicMock(status_code=503, headers={'Retry-After': '2'})
+        mock_ok = MagicMock(status_code=200)
+        mock_ok.json.return_value = []
+        mock_requests.Session.return_value.get.side_effect = [mock_unavailable, mock_ok]
+
+        s3 = S3(self.config, self.user_agent_str)
+        with self.assertRaises(NotFoundException):
+            s3.get_bucket_by_name('mybucket')
+
+        self.assertEqual(mock_requests.Session.return_value.get.call_count, 2)
+        mock_sleep.assert_called_once_with(2.0)
+
+    @patch('datadelivery.retry.RetryPolicy.sleep')
+    @patch('datadelivery.s3.requests')
+    def test_rate_limiter_acquired_for_each_attempt(self, mock_requests, mock_sleep):
+        mock_unavailable = MagicMock(status_code=503, headers={})
+        mock_ok = MagicMock(status_code=200)
+        mock_ok.json.return_value = []
+        mock_requests.Session.return_value.get.side_effect = [mock_unavailable, mock_ok]
+        mock_rate_limiter = MagicMock()
+
+        s3 = S3(self.config, self.user_agent_str, rate_limiter=mock_rate_limiter)
+        with self.assertRaises(NotFoundException):
+            s3.get_bucket_by_name('mybucket')
+
+        self.assertEqual(mock_rate_limiter.acquire.call_count, 2)
+
+    @patch('datadelivery.retry.RetryPolicy.sleep')
+    @patch('datadelivery.s3.requests')
+    def test_get_retries_connection_error(self, mock_requests, mock_sleep):
+        mock_requests.exceptions = requests.exceptions
+        mock_ok = MagicMock(status_code=200)
+        mock_ok.json.return_value = []
+        connection_error = requests.exceptions.ConnectionError('reset')
+        mock_requests.Session.return_value.get.side_effect = [connection_error, connection_error, mock_ok]
+
+        s3 = S3(self.config, self.user_agent_str)
+        with self.assertRaises(NotFoundException):
+            s3.get_bucket_by_name('mybucket')
+
+        self.assertEqual(mock_requests.Session.return_value.get.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch('datadelivery.retry.RetryPolicy.sleep')
+    @patch('datadelivery.s3.requests')
+    def test_get_connection_error_after_max_attempts(self, mock_requests, mock_sleep):
+        mock_requests.exceptions = requests.exceptions
+        mock_requests.Session.return_value.get.side_effect = requests.exceptions.ConnectionError('reset')
+
+        s3 = S3(self.config, self.user_agent_str)
+        with self.assertRaises(S3Exception) as raised:
+            s3.get_bucket_by_name('mybucket')
+
+        self.assertIn('Failed to connect to someurl/', str(raised.exception))
+        self.assertEqual(mock_requests.Session.return_value.get.call_count, 3)
+
+    @patch('datadelivery.retry.RetryPolicy.sleep')
+    @patch('datadelivery.s3.requests')
+    def test_post_not_retried_unless_safe(self, mock_requests, mock_sleep):
+        mock_requests.exceptions = requests.exceptions
+        mock_requests.Session.return_value.post.side_effect = requests.exceptions.ConnectionError('reset')
+
+        s3 = S3(self.config, self.user_agent_str)
+        with self.assertRaises(S3Exception):
+            s3.send_delivery(delivery=MagicMock(id=888), force=True)
+        self.assertEqual(mock_requests.Session.return_value.post.call_count, 1)
+
+        mock_requests.Session.return_value.post.reset_mock()
+        with self.assertRaises(S3Exception):
+            s3.send_delivery(delivery=MagicMock(id=888))
+        self.assertEqual(mock_requests.Session.return_value.post.call_count, 3)
+        mock_sleep.assert_called()
+
+    @patch('datadelivery.s3.requests')
+    def test_with_deadline_shares_session_and_identity(self, mock_requests):
+        self.setup_get_responses(mock_requests.Session.return_value.get)
+        self.config.deliver_deadline = 30
+
+        s3 = S3(self.config, self.user_agent_str)
+        deadline_s3 = s3.with_deadline()
+        deadline_s3.current_s3user
+
+        self.assertEqual(deadline_s3.session, s3.session)
+        self.assertEqual(s3.current_s3user, deadline_s3.current_s3user)
+        self.assertEqual(mock_requests.Session.return_value.get.call_count, 3)
+        self.assertEqual(s3.deadline.remaining(), None)
+        self.assertLessEqual(deadline_s3.deadline.remaining(), 30)
+
+    @patch('datadelivery.s3.requests')
+    def test_with_new_session_shares_identity(self, mock_requests):
+        mock_requests.Session.side_effect = [MagicMock(), MagicMock()]
+        s3 = S3(self.config, self.user_agent_str)
+        self.setup_get_responses(s3.session.get)
+
+        new_session_s3 = s3.with_new_session()
+        s3.current_s3user
+
+        self.assertNotEqual(new_session_s3.session, s3.session)
+        self.assertEqual(new_session_s3.current_s3user, s3.current_s3user)
+        new_session_s3.session.get.assert_not_called()
+
+    @patch('datadelivery.deadline.time')
+    @patch('datadelivery.s3.requests')
+    def test_timeouts_limited_by_deadline(self, mock_requests, mock_time):
+        mock_time.time.return_value = 1000
+        self.setup_responses(mock_requests.Session.return_value.get, [[], []])
+
+        s3 = S3(self.config, self.user_agent_str).with_deadline(30)
+        mock_time.time.return_value = 1025
+        with self.assertRaises(NotFoundException):
+            s3.get_bucket_by_name('mybucket')
+        mock_requests.Session.return_value.get.assert_called_with(
+            'someurl/s3-buckets/?name=mybucket', headers=self.expected_headers, timeout=(5, 5))
+
+        mock_time.time.return_value = 1030
+        with self.assertRaises(DeadlineExceededException):
+            s3.get_bucket_by_name('mybucket')
+        self.assertEqual(mock_requests.Session.return_value.get.call_count, 1)
+
+    @patch('datadelivery.retry.RetryPolicy.sleep')
+    @patch('datadelivery.s3.requests')
+    def test_read_timeout_retried_then_reported(self, mock_requests, mock_sleep):
+        mock_requests.exceptions = requests.exceptions
+        mock_requests.Session.return_value.get.side_effect = requests.exceptions.ReadTimeout('slow')
+
+        s3 = S3(self.config, self.user_agent_str)
+        with self.assertRaises(S3Exception) as raised:
+            s3.get_bucket_by_name('mybucket')
+
+        self.assertIn('Request to someurl/s3-buckets/?name=mybucket timed out', str(raised.exception))
+        self.assertEqual(mock_requests.Session.return_value.get.call_count, 3)
+
+    @patch('datadelivery.retry.RetryPolicy.sleep')
+    @patch('datadelivery.s3.requests')
+    def test_retry_not_attempted_past_deadline(self, mock_requests, mock_sleep):
+        mock_unavailable = MagicMock(status_code=503, headers={'Retry-After': '60'}, text='Unavailable')
+        mock_requests.Session.return_value.get.return_value = mock_unavailable
+
+        s3 = S3(self.config, self.user_agent_str).with_deadline(30)
+        s3.get_bucket_by_name('mybucket')
+
+        self.assertEqual(mock_requests.Session.return_value.get.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    @patch('datadelivery.retry.RetryPolicy.sleep')
+    @patch('datadelivery.s3.requests')
+    def test_request_hooks_called_for_each_attempt(self, mock_requests, mock_sleep):
+        mock_requests.exceptions = requests.exceptions
+        connection_error = requests.exceptions.ConnectionError('reset')
+        mock_ok = MagicMock(status_code=200)
+        mock_ok.json.return_value = []
+        mock_requests.Session.return_value.get.side_effect = [connection_error, mock_ok]
+        mock_hook = MagicMock()
+
+        s3 = S3(self.config, self.user_agent_str)
+        s3.add_request_hook(mock_hook)
+        with self.assertRaises(NotFoundException):
+            s3.with_deadline().get_bucket_by_name('mybucket')
+
+        mock_hook.request_started.assert_has_calls([
+            call('GET', 's3-buckets/?name=mybucket', 0),
+            call('GET', 's3-buckets/?name=mybucket', 1),
+        ])
+        context = mock_hook.request_started.return_value
+        mock_hook.request_finished.assert_has_calls([
+            call(context, None, connection_error),
+            call(context, mock_ok, None),
+        ])
+
+    @patch('datadelivery.s3.requests')
+    def test_request_hooks_finished_for_other_request_errors(self, mock_requests):
+        mock_requests.exceptions = requests.exceptions
+        error = requests.exceptions.ChunkedEncodingError('truncated')
+        mock_requests.Session.return_value.get.side_effect = error
+        concurrency = AdaptiveConcurrency(maximum=1)
+        mock_hook = MagicMock()
+
+        s3 = S3(self.config, self.user_agent_str)
+        s3.add_request_hook(concurrency)
+        s3.add_request_hook(mock_hook)
+        with self.assertRaises(S3Exception) as raised:
+            s3.get_bucket_by_name('mybucket')
+
+        self.assertIn('Request to someurl/s3-buckets/?name=mybucket failed', str(raised.exception))
+        self.assertEqual(mock_requests.Session.return_value.get.call_count, 1)
+        self.assertEqual(concurrency.in_flight, 0)
+        mock_hook.request_finished.assert_called_once_with(mock_hook.request_started.return_value, None, error)
+
+    @patch('datadelivery.s3.requests')
+    def test_request_hooks_finished_for_unexpected_errors(self, mock_requests):
+        mock_requests.exceptions = requests.exceptions
+        mock_requests.Session.return_value.get.side_effect = KeyboardInterrupt()
+        concurrency = AdaptiveConcurrency(maximum=1)
+
+        s3 = S3(self.config, self.user_agent_str)
+        s3.add_request_hook(concurrency)
+        with self.assertRaises(KeyboardInterrupt):
+            s3.get_bucket_by_name('mybucket')
+
+        self.assertEqual(concurrency.in_flight, 0)
+
+    @patch('datadelivery.retry.RetryPolicy.sleep')
+    @patch('datadelivery.s3.requests')
+    def test_send_delivery_retry_rejected_after_lost_response(self, mock_requests, mock_sleep):
+        mock_requests.exceptions = requests.exceptions
+        mock_requests.HTTPError = ValueError
+        mock_already_sent = MagicMock(status_code=400, text='Delivery already sent.')
+        mock_already_sent.raise_for_status.side_effect = ValueError()
+        mock_requests.Session.return_value.post.side_effect = [requests.exceptions.ReadTimeout('slow'),
+                                                               mock_already_sent]
+        mock_get_response = MagicMock(status_code=200, headers={})
+        mock_get_response.json.return_value = {
+            'id': 888, 'bucket': 222, 'from_user': 111, 'to_user': 444, 'state': 1, 'user_message': '',
+            'decline_reason': '', 'performed_by': '', 'delivery_email_text': 'You have a delivery.',
+        }
+        mock_requests.Session.return_value.get.return_value = mock_get_response
+
+        s3_delivery = S3(self.config, self.user_agent_str).send_delivery(MagicMock(id=888))
+
+        self.assertEqual((s3_delivery.id, s3_delivery.state), (888, 1))
+        self.assertEqual(mock_requests.Session.return_value.post.call_count, 2)
+        mock_requests.Session.return_value.get.assert_called_once_with(
+            'someurl/s3-deliveries/888/', headers=self.expected_headers, timeout=self.expected_timeout)
+
+    @patch('datadelivery.s3.requests')
+    def test_send_delivery_already_sent_without_retry(self, mock_requests):
+        mock_requests.HTTPError = ValueError
+        mock_already_sent = MagicMock(status_code=400, text='Delivery already sent.')
+        mock_already_sent.raise_for_status.side_effect = ValueError()
+        mock_requests.Session.return_value.post.return_value = mock_already_sent
+
+        with self.assertRaises(S3Exception) as raised:
+            S3(self.config, self.user_agent_str).send_delivery(MagicMock(id=888))
+
+        self.assertEqual(raised.exception.status_code, 400)
+        mock_requests.Session.return_value.get.assert_not_called()
+
     @patch('datadelivery.s3.requests')
     def test_make_message_for_http_error(self, mock_requests):
         response = MagicMock()
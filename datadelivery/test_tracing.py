@@ -0,0 +1,108 @@
+from __future__ import absolute_import
+import json
+import socket
+from datetime import timedelta
+from unittest import TestCase
+from mock import MagicMock, patch
+from six import StringIO
+from datadelivery.config import Config
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN
+from datadelivery.s3 import S3, S3Exception
+from datadelivery.tracing import Tracer, RequestTrace
+
+
+class RequestTraceTestCase(TestCase):
+    def test_route(self):
+        self.assertEqual(RequestTrace('POST', 's3-deliveries/888/send/?force=true', 0).route,
+                         's3-deliveries/{id}/send/')
+        self.assertEqual(RequestTrace('GET', 's3-users/?endpoint=1&email=joe@joe.com', 0).route, 's3-users/')
+
+    def test_finish_with_response(self):
+        trace = RequestTrace('GET', 's3-buckets/?name=mybucket', 1)
+        trace.dns = 0.001
+        trace.connect = 0.002
+        response = MagicMock(status_code=200, content=b'[]', elapsed=timedelta(milliseconds=10))
+
+        trace.finish(response, None)
+
+        data = trace.to_dict()
+        self.assertEqual(data['status'], 200)
+        self.assertEqual(data['bytes'], 2)
+        self.assertEqual(data['server_ms'], 7.0)
+        self.assertEqual(data['retry'], 1)
+        self.assertEqual(data['error'], None)
+
+    def test_finish_with_error(self):
+        trace = RequestTrace('GET', 's3-buckets/', 0)
+        trace.finish(None, IOError('reset'))
+        self.assertEqual(trace.to_dict()['status'], None)
+        self.assertEqual(trace.to_dict()['error'], 'reset')
+
+
+class TracerTestCase(TestCase):
+    def setUp(self):
+        self.server = MockD4S2Server().start()
+        self.config = Config({'token': DEFAULT_TOKEN, 'url': self.server.url})
+        self.tracer = Tracer()
+
+    def tearDown(self):
+        self.tracer.close()
+        self.server.stop()
+
+    def test_attach_records_each_request(self):
+        self.server.latency = 0.05
+        s3 = S3(self.config, 'tool/1.0')
+        self.tracer.attach(s3)
+
+        s3.current_s3user
+        with self.assertRaises(S3Exception):
+            s3.with_deadline().send_delivery(MagicMock(id=99))
+
+        traces = sorted(self.tracer.traces, key=lambda trace: trace.url_suffix)
+        self.assertEqual([(trace.method, trace.url_suffix, trace.status) for trace in traces], [
+            ('POST', 's3-deliveries/99/send/', 404),
+            ('GET', 's3-endpoints/?name=default', 200),
+            ('GET', 's3-users/?endpoint=1&user=1', 200),
+            ('GET', 'users/current-user/', 200),
+        ])
+        # the endpoint and current user lookups run at the same time so each opens a connection
+        self.assertEqual(len([trace for trace in traces if trace.connect > 0]), 2)
+        self.assertTrue(all(trace.total >= trace.server for trace in traces))
+
+    def test_close_restores_getaddrinfo(self):
+        original_getaddrinfo = socket.getaddrinfo
+        self.tracer.attach(S3(self.config, 'tool/1.0'))
+        self.assertNotEqual(socket.getaddrinfo, original_getaddrinfo)
+        self.tracer.close()
+        self.assertEqual(socket.getaddrinfo, original_getaddrinfo)
+
+    def test_write_ndjson(self):
+        trace = RequestTrace('GET', 'users/current-user/', 0)
+        trace.finish(MagicMock(status_code=200, content=b'{}', elapsed=timedelta(0)), None)
+        self.tracer.traces.append(trace)
+
+        stream = StringIO()
+        self.tracer.write_ndjson(stream)
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['url'], 'users/current-user/')
+
+    def test_format_summary(self):
+        for url_suffix, status, retry in [('s3-deliveries/1/send/', 200, 0), ('s3-deliveries/2/send/', 503, 0),
+                                          ('s3-deliveries/2/send/', 200, 1)]:
+            trace = RequestTrace('POST', url_suffix, retry)
+            trace.finish(MagicMock(status_code=status, content=b'{}', elapsed=timedelta(0)), None)
+            trace.total = 0.010
+            self.tracer.traces.append(trace)
+
+        self.assertEqual(self.tracer.format_summary().split('\n'), [
+            'Method  Route                     Calls  Errors  Retries  Bytes  Avg ms  Max ms',
+            'POST    s3-deliveries/{id}/send/  3      1       1        6      10.0    10.0',
+        ])
+
+    @patch('datadelivery.tracing.sys')
+    def test_write_summary_to_stderr(self, mock_sys):
+        with patch.object(self.tracer, 'format_summary', return_value='table'):
+            self.tracer.write('')
+        mock_sys.stderr.write.assert_any_call('table')
@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+from unittest import TestCase
+from mock import MagicMock, patch, call
+from datadelivery.config import Config
+from datadelivery.mockserver import MockD4S2Server, DEFAULT_TOKEN, DELIVERY_STATE_ACCEPTED, \
+    DELIVERY_STATE_DECLINED
+from datadelivery.s3 import S3
+from datadelivery.watch import DeliveryWatcher
+
+
+def make_delivery(delivery_id, state, decline_reason=''):
+    return MagicMock(id=delivery_id, state=state, decline_reason=decline_reason)
+
+
+class DeliveryWatcherTestCase(TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = patch('datadelivery.watch.time')
+        self.mock_time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_time.time.side_effect = lambda: self.now
+        self.mock_time.sleep.side_effect = self.sleep
+        self.s3 = MagicMock()
+        self.responses = {}
+        self.s3.get_delivery.side_effect = lambda delivery_id, etag: self.responses[delivery_id].pop(0)
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def test_unchanged_deliveries_back_off(self):
+        notified = make_delivery(8, 1)
+        self.responses[8] = [(notified, '"a"'), (None, '"a"'), (None, '"a"'), (make_delivery(8, 2), '"b"')]
+        watcher = DeliveryWatcher(self.s3, [8], min_interval=2, max_interval=3, backoff_factor=2)
+
+        self.assertTrue(watcher.watch())
+
+        self.assertEqual(self.s3.get_delivery.call_args_list, [
+            call(8, None), call(8, '"a"'), call(8, '"a"'), call(8, '"a"')])
+        # polled at 100, then 2 seconds later, then backed off to 3 (the max) and 3
+        self.assertEqual(self.now, 108.0)
+
+    def test_reports_state_changes(self):
+        self.responses[8] = [(make_delivery(8, 1), '"a"'), (make_delivery(8, 3, 'No thanks'), '"b"')]
+        self.responses[9] = [(make_delivery(9, 2), '"c"')]
+        changes = []
+        watcher = DeliveryWatcher(self.s3, [8, 9], on_change=lambda watched, old_state_name: changes.append(
+            (watched.id, old_state_name, watched.state_name)))
+
+        self.assertTrue(watcher.watch())
+
+        self.assertEqual(sorted(changes), [(8, 'notified', 'declined'), (8, 'unknown', 'notified'),
+                                           (9, 'unknown', 'accepted')])
+        self.assertEqual(self.s3.get_delivery.call_count, 3)
+        self.assertEqual(watcher.format_status_table().split('\n'), [
+            'Delivery  State     Decline Reason',
+            '8         declined  No thanks',
+            '9         accepted',
+        ])
+
+    def test_timeout(self):
+        self.s3.get_delivery.side_effect = None
+        self.s3.get_delivery.return_value = (None, None)
+        watcher = DeliveryWatcher(self.s3, [8], min_interval=2, max_interval=2)
+
+        self.assertFalse(watcher.watch(timeout=5))
+
+        self.assertEqual(self.now, 105.0)
+        self.assertEqual(self.s3.get_delivery.call_count, 3)
+
+
+class DeliveryWatcherServerTestCase(TestCase):
+    def setUp(self):
+        self.server = MockD4S2Server().start()
+        self.server.add_recipient('bob@bob.com')
+        self.config = Config({'token': DEFAULT_TOKEN, 'url': self.server.url, 'identity_cache_ttl': 0})
+        self.s3 = S3(self.config, user_agent_str='test')
+
+    def tearDown(self):
+        self.s3.close()
+        self.server.stop()
+
+    def test_unchanged_delivery_is_not_modified(self):
+        bucket = self.s3.create_bucket('bucket1')
+        to_s3user = self.s3.get_s3user_by_email('bob@bob.com')
+        delivery = self.s3.send_delivery(self.s3.create_delivery(bucket, to_s3user, ''))
+        watcher = DeliveryWatcher(self.s3, [delivery.id], min_interval=0, max_interval=0)
+
+        watcher.poll()
+        self.assertEqual(watcher.deliveries[0].state_name, 'notified')
+        self.assertEqual(self.s3.get_delivery(delivery.id, watcher.deliveries[0].etag),
+                         (None, watcher.deliveries[0].etag))
+        self.server.set_delivery_state(delivery.id, DELIVERY_STATE_DECLINED, 'No thanks')
+        self.server.reset_request_counts()
+
+        self.assertTrue(watcher.watch())
+        self.assertEqual(watcher.deliveries[0].delivery.decline_reason, 'No thanks')
+        self.assertEqual(self.server.request_counts, {'GET s3-deliveries/{id}/': 1})
+
+    def test_accepted_delivery_finishes(self):
+        bucket = self.s3.create_bucket('bucket1')
+        delivery = self.s3.create_delivery(bucket, self.s3.get_s3user_by_email('bob@bob.com'), '')
+        self.server.set_delivery_state(delivery.id, DELIVERY_STATE_ACCEPTED)
+
+        self.assertTrue(DeliveryWatcher(self.s3, [delivery.id]).watch(timeout=5))
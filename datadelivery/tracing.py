@@ -0,0 +1,216 @@
+from __future__ import print_function, absolute_import
+import json
+import socket
+import sys
+import threading
+import time
+import requests.adapters
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+SUMMARY_TABLE_HEADERS = ['Method', 'Route', 'Calls', 'Errors', 'Retries', 'Bytes', 'Avg ms', 'Max ms']
+
+# timings for the request currently being sent by each thread, set by Tracer.request_started
+_local = threading.local()
+
+
+class RequestTrace(object):
+    def __init__(self, method, url_suffix, retry):
+        """
+        Timing of a single HTTP call made by an S3 client.
+        Connection timings are zero when a pooled connection was reused.
+        :param method: str: HTTP method
+        :param url_suffix: str: url relative to the api url
+        :param retry: int: 0 for the first attempt, 1 for the first retry, etc
+        """
+        self.method = method
+        self.url_suffix = url_suffix
+        self.retry = retry
+        self.status = None
+        self.bytes = 0
+        self.error = None
+        self.dns = 0.0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.server = 0.0
+        self.total = 0.0
+        self.start = time.time()
+
+    @property
+    def route(self):
+        """
+        url_suffix without the query string and with ids replaced so calls can be grouped.
+        """
+        path = self.url_suffix.split('?')[0]
+        return '/'.join(['{id}' if part.isdigit() else part for part in path.split('/')])
+
+    def finish(self, response, error):
+        self.total = time.time() - self.start
+        if response is not None:
+            self.status = response.status_code
+            self.bytes = len(response.content)
+            waiting = response.elapsed.total_seconds() - self.dns - self.connect - self.tls
+            self.server = max(0.0, waiting)
+        if error is not None:
+            self.error = str(error)
+
+    def to_dict(self):
+        return {
+            'method': self.method,
+            'url': self.url_suffix,
+            'status': self.status,
+            'bytes': self.bytes,
+            'dns_ms': _milliseconds(self.dns),
+            'connect_ms': _milliseconds(self.connect),
+            'tls_ms': _milliseconds(self.tls),
+            'server_ms': _milliseconds(self.server),
+            'total_ms': _milliseconds(self.total),
+            'retry': self.retry,
+            'error': self.error,
+        }
+
+
+class Tracer(object):
+    def __init__(self):
+        """
+        Records a RequestTrace for every HTTP call made by the S3 clients it is attached to.
+        """
+        self.traces = []
+        self._lock = threading.Lock()
+        self._original_getaddrinfo = None
+
+    def attach(self, s3):
+        """
+        Start tracing requests made by s3. Mounts an adapter on the session that times new connections
+        and wraps socket.getaddrinfo to time DNS lookups until close is called.
+        :param s3: S3: client to trace
+        """
+        adapter = _TimedHTTPAdapter(pool_connections=s3.config.http_pool_size, pool_maxsize=s3.config.http_pool_size)
+        s3.session.mount('https://', adapter)
+        s3.session.mount('http://', adapter)
+        s3.add_request_hook(self)
+        if self._original_getaddrinfo is None:
+            self._original_getaddrinfo = socket.getaddrinfo
+            socket.getaddrinfo = self._timed_getaddrinfo
+
+    def close(self):
+        """
+        Stop timing DNS lookups.
+        """
+        if self._original_getaddrinfo is not None:
+            socket.getaddrinfo = self._original_getaddrinfo
+            self._original_getaddrinfo = None
+
+    def _timed_getaddrinfo(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return self._original_getaddrinfo(*args, **kwargs)
+        finally:
+            _add_dns_timing(time.time() - start)
+
+    def request_started(self, method, url_suffix, retry):
+        trace = RequestTrace(method, url_suffix, retry)
+        _local.trace = trace
+        return trace
+
+    def request_finished(self, trace, response, error):
+        _local.trace = None
+        trace.finish(response, error)
+        with self._lock:
+            self.traces.append(trace)
+
+    def write_ndjson(self, stream):
+        """
+        Write one JSON object per HTTP call.
+        :param stream: file to write to
+        """
+        for trace in self.traces:
+            stream.write(json.dumps(trace.to_dict(), sort_keys=True) + '\n')
+
+    def format_summary(self):
+        """
+        Create a plain text table with call counts and timing for each method and route.
+        :return: str: table text
+        """
+        groups = {}
+        for trace in self.traces:
+            groups.setdefault((trace.method, trace.route), []).append(trace)
+        table = [SUMMARY_TABLE_HEADERS]
+        for (method, route), traces in sorted(groups.items()):
+            totals = [trace.total for trace in traces]
+            table.append([
+                method, route, str(len(traces)),
+                str(len([trace for trace in traces if trace.error or (trace.status or 0) >= 400])),
+                str(len([trace for trace in traces if trace.retry])),
+                str(sum(trace.bytes for trace in traces)),
+                '{:.1f}'.format(_milliseconds(sum(totals) / len(totals))),
+                '{:.1f}'.format(_milliseconds(max(totals))),
+            ])
+        widths = [max(len(line[idx]) for line in table) for idx in range(len(SUMMARY_TABLE_HEADERS))]
+        return '\n'.join(['  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip()
+                          for line in table])
+
+    def write(self, trace_filename):
+        """
+        Write the NDJSON trace to trace_filename or the summary table to stderr when trace_filename is empty.
+        :param trace_filename: str: path of the file to write or ''
+        """
+        if trace_filename:
+            with open(trace_filename, 'w') as outfile:
+                self.write_ndjson(outfile)
+        else:
+            print(self.format_summary(), file=sys.stderr)
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _add_dns_timing(seconds):
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.dns += seconds
+
+
+class _ConnectTimingMixin(object):
+    def _new_conn(self):
+        # opening the socket includes the DNS lookup which is recorded separately by Tracer._timed_getaddrinfo
+        trace = getattr(_local, 'trace', None)
+        dns_before = trace.dns if trace else 0.0
+        start = time.time()
+        sock = super(_ConnectTimingMixin, self)._new_conn()
+        if trace:
+            trace.connect += time.time() - start - (trace.dns - dns_before)
+        return sock
+
+
+class _TimedHTTPConnection(_ConnectTimingMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_ConnectTimingMixin, HTTPSConnection):
+    def connect(self):
+        # connect opens the socket with _new_conn and then performs the TLS handshake
+        trace = getattr(_local, 'trace', None)
+        before = (trace.dns + trace.connect) if trace else 0.0
+        start = time.time()
+        super(_TimedHTTPSConnection, self).connect()
+        if trace:
+            trace.tls += time.time() - start - (trace.dns + trace.connect - before)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super(_TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+import time
+from datadelivery.batch import DEFAULT_NUM_WORKERS
+
+DELIVERY_STATE_NAMES = {
+    0: 'new',
+    1: 'notified',
+    2: 'accepted',
+    3: 'declined',
+    4: 'failed',
+    5: 'canceled',
+}
+TERMINAL_DELIVERY_STATES = [2, 3, 4, 5]
+DEFAULT_MIN_INTERVAL = 2.0
+DEFAULT_MAX_INTERVAL = 60.0
+DEFAULT_BACKOFF_FACTOR = 1.5
+STATUS_TABLE_HEADERS = ['Delivery', 'State', 'Decline Reason']
+
+
+class WatchedDelivery(object):
+    def __init__(self, delivery_id, interval):
+        """
+        Polling state for a single delivery.
+        :param delivery_id: int: id of the delivery
+        :param interval: float: seconds to wait before polling again
+        """
+        self.id = delivery_id
+        self.delivery = None
+        self.etag = None
+        self.interval = interval
+        self.next_poll = 0.0
+
+    @property
+    def state_name(self):
+        if self.delivery is None:
+            return 'unknown'
+        return DELIVERY_STATE_NAMES.get(self.delivery.state, str(self.delivery.state))
+
+    @property
+    def finished(self):
+        return self.delivery is not None and self.delivery.state in TERMINAL_DELIVERY_STATES
+
+
+class DeliveryWatcher(object):
+    def __init__(self, s3, delivery_ids, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR, num_workers=DEFAULT_NUM_WORKERS, on_change=None):
+        """
+        Polls deliveries until the recipients accept or decline them.
+        Each delivery is polled with If-None-Match so an unchanged delivery costs an empty 304 response.
+        A delivery that has not changed is polled less often, backing off from min_interval to max_interval,
+        and goes back to min_interval when it changes.
+        :param s3: S3: client used to fetch deliveries
+        :param delivery_ids: [int]: deliveries to watch
+        :param min_interval: float: seconds between polls of a delivery that just changed
+        :param max_interval: float: longest time between polls of a delivery
+        :param backoff_factor: float: interval multiplier applied each time a delivery is unchanged
+        :param num_workers: int: number of deliveries to poll at the same time
+        :param on_change: function(WatchedDelivery, old_state_name) called when a delivery changes state
+        """
+        self.s3 = s3
+        self.deliveries = [WatchedDelivery(delivery_id, min_interval) for delivery_id in delivery_ids]
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.num_workers = num_workers
+        self.on_change = on_change
+
+    @property
+    def finished(self):
+        return all(watched.finished for watched in self.deliveries)
+
+    def poll(self):
+        """
+        Fetch every unfinished delivery that is due to be polled.
+        """
+        now = time.time()
+        due = [watched for watched in self.deliveries if not watched.finished and watched.next_poll <= now]
+        if not due:
+            return
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(self.num_workers, len(due)))
+        try:
+            pool.map(self._poll_delivery, due)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _poll_delivery(self, watched):
+        old_state_name = watched.state_name
+        delivery, watched.etag = self.s3.get_delivery(watched.id, watched.etag)
+        if delivery is None:
+            watched.interval = min(self.max_interval, watched.interval * self.backoff_factor)
+        else:
+            changed = watched.delivery is None or vars(delivery) != vars(watched.delivery)
+            watched.delivery = delivery
+            if changed:
+                watched.interval = self.min_interval
+                if self.on_change and watched.state_name != old_state_name:
+                    self.on_change(watched, old_state_name)
+            else:
+                watched.interval = min(self.max_interval, watched.interval * self.backoff_factor)
+        watched.next_poll = time.time() + watched.interval
+
+    def watch(self, timeout=None):
+        """
+        Poll until every delivery is in a terminal state or timeout seconds have passed.
+        :param timeout: float: seconds to wait or None to wait forever
+        :return: bool: True if every delivery finished
+        """
+        stop_at = time.time() + timeout if timeout is not None else None
+        while True:
+            self.poll()
+            if self.finished:
+                return True
+            now = time.time()
+            next_poll = min(watched.next_poll for watched in self.deliveries if not watched.finished)
+            if stop_at is not None:
+                if now >= stop_at:
+                    return False
+                next_poll = min(next_poll, stop_at)
+            time.sleep(max(0.0, next_poll - now))
+
+    def format_status_table(self):
+        """
+        Create a plain text table with the state of each delivery.
+        :return: str: table text
+        """
+        table = [STATUS_TABLE_HEADERS]
+        for watched in self.deliveries:
+            decline_reason = watched.delivery.decline_reason if watched.delivery else ''
+            table.append([str(watched.id), watched.state_name, decline_reason or ''])
+        widths = [max(len(line[idx]) for line in table) for idx in range(len(STATUS_TABLE_HEADERS))]
+        return '\n'.join(['  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip()
+                          for line in table])
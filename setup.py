@@ -11,6 +11,9 @@ setup(name='datadelivery',
           'PyYAML',
           'six',
       ],
+      extras_require={
+          'async': ['aiohttp'],
+      },
       entry_points={
           'console_scripts': [
               'datadelivery = datadelivery.__main__:main'